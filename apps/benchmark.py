@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import math
+import re
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Category, Product
+from .synthetic import SYNTHETIC_PASSWORD, SYNTHETIC_PREFIX
+
+SERVER_TIMING_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+# Перцентиль по отсортированным значениям (метод ближайшего ранга)
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = max(0, math.ceil(percent / 100 * len(values)) - 1)
+    return values[index]
+
+
+# Пиковый размер памяти процесса в мегабайтах (ru_maxrss на Linux в килобайтах, на macOS в байтах)
+def get_max_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def is_success(status):
+    return 200 <= status < 300
+
+
+# Страницы для замера на синтетическом каталоге: (имя, путь, нужен ли вход)
+def get_benchmark_urls(prefix=SYNTHETIC_PREFIX):
+    root = Category.objects.filter(slug__startswith=f'{prefix}-', parent=None).order_by('pk').first()
+    leaf = Category.objects.filter(slug__startswith=f'{prefix}-', subcategories=None).order_by('pk').first()
+    product = Product.objects.filter(slug__startswith=f'{prefix}-product-').order_by('pk').first()
+    if root is None or product is None:
+        return []
+    return [
+        ('index', reverse('index'), False),
+        ('category_root', reverse('category_page', kwargs={'slug': root.slug}), False),
+        ('category_leaf', reverse('category_page', kwargs={'slug': leaf.slug}), False),
+        ('product_detail', product.get_absolute_url(), False),
+        ('favorite', reverse('favorite'), True),
+        ('my_cart', reverse('my_cart'), True),
+        ('checkout', reverse('checkout'), True),
+    ]
+
+
+# Ошибки страниц видны по статусу в отчёте, трейсбэк на каждый из сотен запросов не печатаем
+@contextmanager
+def benchmark_settings():
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], INSTRUMENTATION_LOG=None):
+            yield
+    finally:
+        request_logger.setLevel(level)
+
+
+# Прогоняет каждую страницу requests раз через тестовый клиент Django.
+# cold=True - перед каждым запросом кэш очищается, иначе первый запрос прогревает кэш и не учитывается.
+# Память меряется отдельным запросом под tracemalloc, чтобы он не искажал время остальных
+class BenchmarkRunner:
+    def __init__(self, urls, requests=50, cold=False, username=None, password=SYNTHETIC_PASSWORD):
+        self.urls = urls
+        self.requests = requests
+        self.cold = cold
+        self.guest = Client(raise_request_exception=False)
+        self.user = Client(raise_request_exception=False)
+        self.is_logged_in = bool(username) and self.user.login(username=username, password=password)
+
+    def request(self, client, path):
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            started_at = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started_at
+        return response.status_code, elapsed, sum(len(context.captured_queries) for context in contexts)
+
+    # Страница с ошибкой (не 2xx) не замеряется: время и запросы страницы ошибки с нормальными не сравнить
+    def measure(self, path, client):
+        if not self.cold:
+            status = self.request(client, path)[0]
+            if not is_success(status):
+                return {'path': path, 'status': [status], 'error': True}
+
+        timings, queries, statuses = [], [], set()
+        for _ in range(self.requests):
+            if self.cold:
+                cache.clear()
+            status, elapsed, count = self.request(client, path)
+            if not is_success(status):
+                return {'path': path, 'status': [status], 'error': True}
+            timings.append(elapsed * 1000)
+            queries.append(count)
+            statuses.add(status)
+
+        if self.cold:
+            cache.clear()
+        tracemalloc.start()
+        client.get(path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'path': path,
+            'status': sorted(statuses),
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'mean': round(statistics.mean(timings), 2),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def run(self):
+        results = {}
+        with benchmark_settings():
+            for name, path, login_required in self.urls:
+                if login_required and not self.is_logged_in:
+                    continue
+                results[name] = self.measure(path, self.user if login_required else self.guest)
+        return {
+            'requests': self.requests,
+            'cold': self.cold,
+            'max_rss_mb': round(get_max_rss(), 1),
+            'urls': results,
+        }
+
+
+# -------------------------------------------------------------------------------------
+
+# Пары страниц для сравнения sync и async вьюшек: (имя, sync путь, async путь, нужен ли вход)
+def get_async_benchmark_urls(prefix=SYNTHETIC_PREFIX):
+    leaf = Category.objects.filter(slug__startswith=f'{prefix}-', subcategories=None).order_by('pk').first()
+    product = Product.objects.filter(slug__startswith=f'{prefix}-product-').order_by('pk').first()
+    if leaf is None or product is None:
+        return []
+    return [
+        ('index', reverse('index'), reverse('async_index'), False),
+        ('category_leaf', reverse('category_page', kwargs={'slug': leaf.slug}),
+         reverse('async_category_page', kwargs={'slug': leaf.slug}), False),
+        ('product_detail', product.get_absolute_url(),
+         reverse('async_product_detail', kwargs={'slug': product.slug}), False),
+        ('favorite', reverse('favorite'), reverse('async_favorite'), True),
+    ]
+
+
+# Число запросов к базе из заголовка Server-Timing (InstrumentationMiddleware), None если заголовка нет
+def get_server_timing_queries(response):
+    match = SERVER_TIMING_QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def summarize(results, elapsed):
+    timings = [timing for _, timing, _ in results]
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'status': sorted({status for status, _, _ in results}),
+        'rps': round(len(timings) / elapsed, 1),
+        'queries': max(queries) if queries else None,
+        'p50': round(percentile(timings, 50), 2),
+        'p95': round(percentile(timings, 95), 2),
+        'p99': round(percentile(timings, 99), 2),
+    }
+
+
+# Сравнение sync вьюшек под WSGI и async вьюшек под ASGI при concurrency одновременных запросах.
+# Без base_url оба пути гоняются в процессе: WSGI - пул потоков с тестовыми клиентами (как воркеры
+# gunicorn --threads), ASGI - один event loop с AsyncClient и asyncio.gather (как uvicorn/daphne).
+# С base_url запросы идут по HTTP на уже запущенный сервер, sync и async страницы с одного сервера.
+# Кэш страниц отключён (cold), иначе сравнивалась бы отдача из кэша, а не работа вьюшек
+class ConcurrencyBenchmark:
+    def __init__(self, urls, requests=200, concurrency=20, cold=True, username=None, password=SYNTHETIC_PASSWORD,
+                 base_url=None):
+        self.urls = urls
+        self.requests = requests
+        self.concurrency = concurrency
+        self.cold = cold
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.username = username
+        self.password = password
+        self.cookies = self.login() if username else None
+        self.is_logged_in = bool(self.cookies)
+
+    # Кука сессии после входа, её получают все клиенты (и sync, и async, и HTTP).
+    # Остальные куки (сообщение об успешном входе) не берём, иначе каждый клиент выводил бы его на странице
+    def login(self):
+        if self.base_url:
+            import requests
+
+            session = requests.Session()
+            login_url = f'{self.base_url}{reverse("login")}'
+            session.get(login_url)
+            session.post(login_url, data={'username': self.username, 'password': self.password,
+                                          'csrfmiddlewaretoken': session.cookies.get('csrftoken', '')},
+                         headers={'Referer': login_url})
+            cookies = session.cookies.get_dict()
+        else:
+            client = Client()
+            client.login(username=self.username, password=self.password)
+            cookies = {key: morsel.value for key, morsel in client.cookies.items()}
+        if settings.SESSION_COOKIE_NAME not in cookies:
+            return None
+        return {settings.SESSION_COOKIE_NAME: cookies[settings.SESSION_COOKIE_NAME]}
+
+    def get_client(self, login_required):
+        if self.base_url:
+            import requests
+
+            session = requests.Session()
+            if login_required:
+                session.cookies.update(self.cookies)
+            return session
+        client = Client(raise_request_exception=False)
+        if login_required:
+            client.cookies.load(self.cookies)
+        return client
+
+    def timed_get(self, client, path):
+        if self.cold:
+            cache.clear()
+        started_at = time.perf_counter()
+        if self.base_url:
+            response = client.get(f'{self.base_url}{path}', allow_redirects=False)
+        else:
+            response = client.get(path)
+        return response.status_code, (time.perf_counter() - started_at) * 1000, get_server_timing_queries(response)
+
+    def run_threads(self, path, login_required):
+        def worker(_):
+            if not hasattr(self.local, 'client'):
+                self.local.client = self.get_client(login_required)
+            try:
+                return self.timed_get(self.local.client, path)
+            finally:
+                connections.close_all()
+
+        self.local = threading.local()
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            results = list(executor.map(worker, range(self.requests)))
+        return results, time.perf_counter() - started_at
+
+    async def run_event_loop(self, path, login_required):
+        client = AsyncClient(raise_request_exception=False)
+        if login_required:
+            client.cookies.load(self.cookies)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def request():
+            async with semaphore:
+                if self.cold:
+                    await cache.aclear()
+                started_at = time.perf_counter()
+                response = await client.get(path)
+                return response.status_code, (time.perf_counter() - started_at) * 1000, \
+                    get_server_timing_queries(response)
+
+        started_at = time.perf_counter()
+        results = await asyncio.gather(*(request() for _ in range(self.requests)))
+        return results, time.perf_counter() - started_at
+
+    def measure(self, path, login_required, use_event_loop):
+        if self.base_url or not use_event_loop:
+            results, elapsed = self.run_threads(path, login_required)
+        else:
+            results, elapsed = asyncio.run(self.run_event_loop(path, login_required))
+        return summarize(results, elapsed)
+
+    def run(self):
+        results = {}
+        # Число запросов к базе каждая страница сообщает в Server-Timing, и под WSGI, и под ASGI
+        with benchmark_settings(), override_settings(INSTRUMENTATION_SERVER_TIMING=True):
+            for name, sync_path, async_path, login_required in self.urls:
+                if login_required and not self.is_logged_in:
+                    continue
+                wsgi = self.measure(sync_path, login_required, use_event_loop=False)
+                asgi = self.measure(async_path, login_required, use_event_loop=True)
+                results[name] = {
+                    'wsgi': wsgi,
+                    'asgi': asgi,
+                    'speedup': round(asgi['rps'] / wsgi['rps'], 2) if wsgi['rps'] else 0,
+                }
+        return {
+            'requests': self.requests,
+            'concurrency': self.concurrency,
+            'server': self.base_url or 'in-process',
+            'urls': results,
+        }
+
+
+# -------------------------------------------------------------------------------------
+
+# В базовый прогон попадают только страницы без ошибок
+def save_baseline(path, report):
+    report = {**report, 'urls': {name: result for name, result in report['urls'].items() if not result.get('error')}}
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+# Изменение метрик относительно базового прогона в процентах: {страница: {метрика: %}}
+def compare_reports(report, baseline, metrics=('p50', 'p95', 'p99', 'queries', 'peak_kb')):
+    changes = {}
+    for name, result in report['urls'].items():
+        previous = baseline['urls'].get(name)
+        if previous is None or result.get('error') or previous.get('error'):
+            continue
+        changes[name] = {
+            metric: round((result[metric] - previous[metric]) / previous[metric] * 100, 1) if previous[metric] else 0
+            for metric in metrics
+        }
+    return changes
@@ -0,0 +1,254 @@
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Prefetch, OuterRef, Subquery
+
+from .models import Category, Product, Gallery
+
+
+# Queryset товаров для карточек: категория и главная картинка через JOIN в том же запросе
+def get_products_queryset():
+    return Product.objects.select_related('category', 'primary_image', 'variant_group')
+
+
+# Пересчитываем главную картинку товаров одним UPDATE с подзапросом
+def sync_primary_images(products=None):
+    products = Product.objects.all() if products is None else products
+    first_image = Gallery.objects.filter(product=OuterRef('pk')).order_by('position', 'pk').values('pk')[:1]
+    return products.update(primary_image=Subquery(first_image))
+
+
+# Функция для получения каталога главной страницы за фиксированное кол-во запросов
+def get_homepage_catalog():
+    return Category.objects.filter(parent=None).prefetch_related(
+        Prefetch('products', queryset=get_products_queryset())
+    )
+
+
+# -------------------------------------------------------------------------------------
+
+CATEGORY_TREE_CACHE_KEY = 'catalog:category_tree'
+CATEGORY_TREE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Дерево категорий: всё строится одним запросом, а дальше все обращения идут по словарям
+class CategoryTree:
+    def __init__(self, categories):
+        self.by_pk = {category.pk: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories if category.slug}
+        self.children = {pk: [] for pk in self.by_pk}
+        self.roots = []
+
+        for category in categories:
+            if category.parent_id in self.by_pk:
+                self.children[category.parent_id].append(category)
+            else:
+                self.roots.append(category)
+
+        # Предки и потомки считаются заранее, чтобы отдавать их за O(1)
+        self.ancestors_by_pk = {}
+        self.descendants_by_pk = {}
+        for root in self.roots:
+            self._walk(root, [])
+
+    def _walk(self, category, path):
+        self.ancestors_by_pk[category.pk] = list(path)
+        descendants = []
+        for child in self.children[category.pk]:
+            descendants.append(child)
+            descendants.extend(self._walk(child, path + [category]))
+        self.descendants_by_pk[category.pk] = descendants
+        return descendants
+
+    def get(self, slug):
+        return self.by_slug.get(slug)
+
+    def subcategories(self, slug):
+        category = self.get(slug)
+        return self.children[category.pk] if category else []
+
+    def ancestors(self, slug):
+        category = self.get(slug)
+        return self.ancestors_by_pk[category.pk] if category else []
+
+    def descendants(self, slug):
+        category = self.get(slug)
+        return self.descendants_by_pk[category.pk] if category else []
+
+    # Хлебные крошки: все предки и сама категория
+    def breadcrumbs(self, slug):
+        category = self.get(slug)
+        return self.ancestors_by_pk[category.pk] + [category] if category else []
+
+
+# Функция для получения дерева категорий из кэша
+def get_category_tree():
+    tree = cache.get(CATEGORY_TREE_CACHE_KEY)
+    if tree is None:
+        tree = CategoryTree(list(Category.objects.order_by('pk')))
+        cache.set(CATEGORY_TREE_CACHE_KEY, tree, CATEGORY_TREE_CACHE_TIMEOUT)
+    return tree
+
+
+async def aget_category_tree():
+    tree = await cache.aget(CATEGORY_TREE_CACHE_KEY)
+    if tree is None:
+        tree = CategoryTree([category async for category in Category.objects.order_by('pk')])
+        await cache.aset(CATEGORY_TREE_CACHE_KEY, tree, CATEGORY_TREE_CACHE_TIMEOUT)
+    return tree
+
+
+# Сбрасываем закэшированное дерево, следующее обращение соберёт его заново
+def invalidate_category_tree():
+    cache.delete(CATEGORY_TREE_CACHE_KEY)
+
+
+# id категории вместе со всеми её подкатегориями
+def get_category_ids(category):
+    tree = get_category_tree()
+    return [category.pk] + [child.pk for child in tree.descendants_by_pk.get(category.pk, [])]
+
+
+# Товары категории вместе со всеми её подкатегориями
+def get_category_products(category):
+    return get_products_queryset().filter(category_id__in=get_category_ids(category))
+
+
+# -------------------------------------------------------------------------------------
+
+CATEGORY_PRODUCT_IDS_CACHE_KEY = 'catalog:category_product_ids:{}'
+RELATED_PRODUCTS_CACHE_TIMEOUT = 60 * 60
+
+
+# Список id товаров категории держим в кэше, чтобы выбирать случайные товары в памяти
+def get_category_product_ids(category_ids):
+    keys = {CATEGORY_PRODUCT_IDS_CACHE_KEY.format(pk): pk for pk in category_ids}
+    cached = cache.get_many(keys)
+
+    missing = [pk for key, pk in keys.items() if key not in cached]
+    if missing:
+        fresh = {pk: [] for pk in missing}
+        for pk, category_id in Product.objects.filter(category_id__in=missing).values_list('pk', 'category_id'):
+            fresh[category_id].append(pk)
+        cache.set_many({CATEGORY_PRODUCT_IDS_CACHE_KEY.format(pk): ids for pk, ids in fresh.items()},
+                       RELATED_PRODUCTS_CACHE_TIMEOUT)
+        cached.update({CATEGORY_PRODUCT_IDS_CACHE_KEY.format(pk): ids for pk, ids in fresh.items()})
+
+    return [product_id for ids in cached.values() for product_id in ids]
+
+
+def invalidate_category_product_ids(category_id):
+    cache.delete(CATEGORY_PRODUCT_IDS_CACHE_KEY.format(category_id))
+
+
+# Категории, из которых берутся похожие товары: своя и при желании соседние подкатегории
+def get_related_category_ids(product, include_siblings=False):
+    category_ids = [product.category_id]
+    if include_siblings:
+        tree = get_category_tree()
+        category = tree.by_pk.get(product.category_id)
+        if category and category.parent_id in tree.children:
+            category_ids = [sibling.pk for sibling in tree.children[category.parent_id]]
+    return category_ids
+
+
+# Случайная выборка разных id товаров без самого товара
+def sample_related_product_ids(product, count=3, include_siblings=False):
+    category_ids = get_related_category_ids(product, include_siblings)
+    ids = [pk for pk in get_category_product_ids(category_ids) if pk != product.pk]
+    return random.sample(ids, min(count, len(ids)))
+
+
+# Функция для получения похожих товаров: сначала готовые рекомендации из товара, иначе случайная выборка
+def get_related_products(product, count=3, include_siblings=False):
+    ids = product.recommended_ids
+    if ids is None:
+        ids = sample_related_product_ids(product, count, include_siblings)
+    ids = ids[:count]
+    if not ids:
+        return []
+
+    products = get_products_queryset().in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+async def aget_related_products(product, count=3, include_siblings=False):
+    ids = product.recommended_ids
+    if ids is None:
+        ids = await sync_to_async(sample_related_product_ids)(product, count, include_siblings)
+    ids = ids[:count]
+    if not ids:
+        return []
+
+    products = await get_products_queryset().ain_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+# Пересобираем рекомендации для набора товаров одной пачкой и сохраняем их в базу
+def build_recommendations(products, count=3, include_siblings=False):
+    for product in products:
+        product.recommended_ids = sample_related_product_ids(product, count, include_siblings)
+    Product.objects.bulk_update(products, ['recommended_ids'])
+    return len(products)
+
+
+# -------------------------------------------------------------------------------------
+
+CATALOG_VERSION_CACHE_KEY = 'catalog:version'
+
+
+# Версия каталога - время последнего изменения товаров/категорий в микросекундах.
+# Входит в ключи кэша страниц и фрагментов, поэтому смена версии сразу делает их устаревшими
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_CACHE_KEY)
+    if version is None:
+        version = bump_catalog_version()
+    return version
+
+
+async def aget_catalog_version():
+    version = await cache.aget(CATALOG_VERSION_CACHE_KEY)
+    if version is None:
+        version = await sync_to_async(bump_catalog_version)()
+    return version
+
+
+def bump_catalog_version():
+    version = time.time_ns() // 1000
+    cache.set(CATALOG_VERSION_CACHE_KEY, version, None)
+    return version
+
+
+
+# -------------------------------------------------------------------------------------
+
+VARIANTS_CACHE_KEY = 'catalog:variants:{}:{}'
+
+
+# Цвета модели товара: (код цвета, название, слаг) из кэша, один values_list на группу
+def get_variant_swatches(product):
+    if not product.variant_group_id:
+        return [(product.color_code, product.color_name, product.slug)]
+
+    key = VARIANTS_CACHE_KEY.format(get_catalog_version(), product.variant_group_id)
+    swatches = cache.get(key)
+    if swatches is None:
+        swatches = list(Product.objects.filter(variant_group_id=product.variant_group_id)
+                        .order_by('color_code', 'pk').values_list('color_code', 'color_name', 'slug'))
+        cache.set(key, swatches, RELATED_PRODUCTS_CACHE_TIMEOUT)
+    return swatches
+
+
+async def aget_variant_swatches(product):
+    if not product.variant_group_id:
+        return [(product.color_code, product.color_name, product.slug)]
+
+    key = VARIANTS_CACHE_KEY.format(await aget_catalog_version(), product.variant_group_id)
+    swatches = await cache.aget(key)
+    if swatches is None:
+        swatches = [swatch async for swatch in Product.objects.filter(variant_group_id=product.variant_group_id)
+                    .order_by('color_code', 'pk').values_list('color_code', 'color_name', 'slug')]
+        await cache.aset(key, swatches, RELATED_PRODUCTS_CACHE_TIMEOUT)
+    return swatches
@@ -0,0 +1,33 @@
+import os
+
+from django.conf import settings
+from django.core import checks
+
+LOCAL_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+# Кэш в памяти процесса при нескольких воркерах: запись в одном воркере не сбрасывает кэш других,
+# и они показывают устаревший каталог, цены и избранное. Число воркеров берём из WEB_CONCURRENCY
+# (его читают gunicorn и uvicorn), на проде без него - предупреждение в check --deploy
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] != LOCAL_CACHE_BACKEND:
+        return []
+    if int(os.environ.get('WEB_CONCURRENCY') or 1) > 1:
+        return [checks.Error(
+            'Кэш в памяти процесса (LocMemCache) при нескольких воркерах',
+            hint='Задайте CACHE_BACKEND=redis или memcached и CACHE_LOCATION (root/cache.py)',
+            id='apps.E001',
+        )]
+    return []
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache_deploy(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] != LOCAL_CACHE_BACKEND:
+        return []
+    return [checks.Warning(
+        'Кэш в памяти процесса (LocMemCache): сброс кэшей работает только при одном воркере',
+        hint='Для нескольких воркеров задайте CACHE_BACKEND=redis или memcached (root/cache.py)',
+        id='apps.W001',
+    )]
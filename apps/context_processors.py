@@ -0,0 +1,27 @@
+from django.utils.functional import SimpleLazyObject
+
+from .catalog import get_catalog_version
+from .favorites import get_favorite_ids
+
+
+# Кол-во товаров в корзине для шапки. Считается только если шаблон его выводит
+def cart(request):
+    if not hasattr(request, 'cart'):
+        return {}
+    return {
+        'cart_total_quantity': SimpleLazyObject(lambda: request.cart.get_total_quantity())
+    }
+
+
+# Версия каталога для ключей {% cache %} во фрагментах шаблонов
+def catalog(request):
+    return {
+        'catalog_version': SimpleLazyObject(get_catalog_version)
+    }
+
+
+# id избранных товаров пользователя для сердечка на карточках: одно обращение к кэшу на запрос
+def favorites(request):
+    return {
+        'favorite_ids': SimpleLazyObject(lambda: get_favorite_ids(request.user))
+    }
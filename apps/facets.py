@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, When, Value, Count, IntegerField, Q
+
+from .catalog import get_catalog_version
+from .models import Product, Brand
+
+FACETS_CACHE_KEY = 'catalog:facets:{}:{}:{}'
+FACETS_CACHE_TIMEOUT = 60 * 60
+DIMENSIONS = ('length', 'width', 'height')
+
+
+# Номер ценового диапазона считается прямо в SQL по цене со скидкой
+def price_bucket_expression():
+    bounds = settings.CATALOG_PRICE_BUCKETS
+    return Case(
+        *[When(effective_price__lt=bound, then=Value(number)) for number, bound in enumerate(bounds)],
+        default=Value(len(bounds)),
+        output_field=IntegerField(),
+    )
+
+
+def get_price_buckets():
+    bounds = (0,) + tuple(settings.CATALOG_PRICE_BUCKETS)
+    buckets = []
+    for number in range(len(bounds)):
+        low = bounds[number]
+        high = bounds[number + 1] if number + 1 < len(bounds) else None
+        buckets.append({'value': number, 'low': low, 'high': high})
+    return buckets
+
+
+# Выбранные фильтры из GET параметров
+class FacetFilters:
+    def __init__(self, params):
+        self.colors = set(params.getlist('color'))
+        self.brands = {int(pk) for pk in params.getlist('brand') if pk.isdigit()}
+        self.prices = {int(pk) for pk in params.getlist('price') if pk.isdigit()}
+        self.dimensions = {}
+        for name in DIMENSIONS:
+            for bound in ('min', 'max'):
+                value = params.get(f'{name}_{bound}', '').replace(',', '.')
+                try:
+                    self.dimensions[f'{name}_{bound}'] = float(value)
+                except ValueError:
+                    pass
+
+    def __bool__(self):
+        return bool(self.colors or self.brands or self.prices or self.dimensions)
+
+    # Фильтры по размерам идут в запрос через индексы *_value
+    def dimension_q(self):
+        q = Q()
+        for key, value in self.dimensions.items():
+            name, bound = key.rsplit('_', 1)
+            q &= Q(**{f'{name}_value__{"gte" if bound == "min" else "lte"}': value})
+        return q
+
+    def dimensions_key(self):
+        return '&'.join(f'{key}={value}' for key, value in sorted(self.dimensions.items())) or '-'
+
+
+# Индекс фасетов категории: кол-во товаров по (цвет, категория, ценовой диапазон) одним GROUP BY.
+# Хранится в кэше под версией каталога, поэтому устаревает при любом изменении товаров
+def get_facet_index(category_ids, filters):
+    key = FACETS_CACHE_KEY.format(get_catalog_version(), ','.join(map(str, sorted(category_ids))),
+                                  filters.dimensions_key())
+    index = cache.get(key)
+    if index is None:
+        rows = (Product.objects.filter(category_id__in=category_ids)
+                .filter(filters.dimension_q())
+                .annotate(price_bucket=price_bucket_expression())
+                .values('color_code', 'color_name', 'category_id', 'price_bucket')
+                .annotate(total=Count('pk'))
+                .order_by())
+        brands = list(Brand.objects.filter(category_id__in=category_ids).values_list('pk', 'title', 'category_id'))
+        index = {'rows': list(rows), 'brands': brands}
+        cache.set(key, index, FACETS_CACHE_TIMEOUT)
+    return index
+
+
+def brand_category_ids(index, brand_ids):
+    return {category_id for pk, title, category_id in index['brands'] if pk in brand_ids}
+
+
+# Проходит ли строка индекса выбранные фильтры, кроме фасета skip.
+# Так счётчик каждого фасета показывает сколько товаров будет если выбрать ещё и это значение
+def row_matches(row, filters, brand_categories, skip=None):
+    if skip != 'color' and filters.colors and row['color_code'] not in filters.colors:
+        return False
+    if skip != 'brand' and filters.brands and row['category_id'] not in brand_categories:
+        return False
+    if skip != 'price' and filters.prices and row['price_bucket'] not in filters.prices:
+        return False
+    return True
+
+
+# Значения фасетов со счётчиками для шаблона
+def get_facets(category_ids, filters):
+    index = get_facet_index(category_ids, filters)
+    brand_categories = brand_category_ids(index, filters.brands)
+
+    colors = {}
+    prices = {}
+    category_totals = {}
+    for row in index['rows']:
+        if row_matches(row, filters, brand_categories, skip='color'):
+            color = colors.setdefault(row['color_code'], {'value': row['color_code'], 'title': row['color_name'],
+                                                          'count': 0})
+            color['count'] += row['total']
+        if row_matches(row, filters, brand_categories, skip='price'):
+            prices[row['price_bucket']] = prices.get(row['price_bucket'], 0) + row['total']
+        if row_matches(row, filters, brand_categories, skip='brand'):
+            category_totals[row['category_id']] = category_totals.get(row['category_id'], 0) + row['total']
+
+    brands = {}
+    for pk, title, category_id in index['brands']:
+        brand = brands.setdefault(pk, {'value': pk, 'title': title, 'count': 0})
+        brand['count'] += category_totals.get(category_id, 0)
+
+    price_buckets = [dict(bucket, count=prices.get(bucket['value'], 0)) for bucket in get_price_buckets()]
+    return {
+        'colors': [dict(color, selected=color['value'] in filters.colors) for color in colors.values()],
+        'brands': [dict(brand, selected=brand['value'] in filters.brands) for brand in brands.values()],
+        'prices': [dict(bucket, selected=bucket['value'] in filters.prices)
+                   for bucket in price_buckets if bucket['count']],
+        'dimensions': filters.dimensions,
+    }
+
+
+# Применяем выбранные фильтры к товарам категории
+def apply_facet_filters(queryset, category_ids, filters):
+    if not filters:
+        return queryset
+
+    queryset = queryset.filter(filters.dimension_q())
+    if filters.colors:
+        queryset = queryset.filter(color_code__in=filters.colors)
+    if filters.brands:
+        index = get_facet_index(category_ids, filters)
+        queryset = queryset.filter(category_id__in=brand_category_ids(index, filters.brands))
+    if filters.prices:
+        # Диапазоны цен условиями на effective_price, чтобы работал индекс
+        q = Q()
+        for bucket in get_price_buckets():
+            if bucket['value'] in filters.prices:
+                if bucket['high']:
+                    q |= Q(effective_price__gte=bucket['low'], effective_price__lt=bucket['high'])
+                else:
+                    q |= Q(effective_price__gte=bucket['low'])
+        queryset = queryset.filter(q)
+    return queryset
@@ -0,0 +1,149 @@
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+from urllib.request import Request, urlopen
+
+
+# Подпись вебхука в формате заголовка Stripe-Signature
+def sign_payload(payload, secret, timestamp=None):
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+# Тело запроса Stripe (form-urlencoded с ключами вида line_items[0][price_data][unit_amount]) в словарь
+def parse_form(body):
+    data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = re.findall(r'[^\[\]]+', key)
+        target = data
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return data
+
+
+# Локальная заглушка Stripe API для тестов и нагрузочных прогонов без сети.
+# Умеет создавать сессии оплаты с учётом Idempotency-Key, а GET по ссылке оплаты
+# "оплачивает" сессию: отправляет подписанный вебхук и перенаправляет на success_url
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, webhook_url=None, webhook_secret='whsec_test'):
+        super().__init__(address, FakeStripeHandler)
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.sessions = {}
+        self.idempotent_responses = {}
+        self.requests_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def create_session(self, params, idempotency_key=None):
+        with self.lock:
+            self.requests_count += 1
+            if idempotency_key and idempotency_key in self.idempotent_responses:
+                return self.idempotent_responses[idempotency_key]
+
+            session_id = f'cs_test_{uuid.uuid4().hex}'
+            items = list(params.get('line_items', {}).values())
+            amount = sum(int(item['price_data']['unit_amount']) * int(item.get('quantity', 1)) for item in items)
+            session = {
+                'id': session_id,
+                'object': 'checkout.session',
+                'url': f'{self.base_url}/pay/{session_id}',
+                'amount_total': amount,
+                'currency': items[0]['price_data'].get('currency') if items else None,
+                'client_reference_id': params.get('client_reference_id'),
+                'metadata': params.get('metadata', {}),
+                'mode': params.get('mode'),
+                'payment_status': 'unpaid',
+                'status': 'open',
+                'success_url': params.get('success_url'),
+                'cancel_url': params.get('cancel_url'),
+            }
+            self.sessions[session_id] = session
+            if idempotency_key:
+                self.idempotent_responses[idempotency_key] = session
+            return session
+
+    # Событие вебхука об оплате сессии: (тело, заголовок подписи)
+    def build_event(self, session_id, event_type='checkout.session.completed'):
+        session = self.sessions[session_id]
+        if event_type == 'checkout.session.completed':
+            session.update(payment_status='paid', status='complete')
+        event = {
+            'id': f'evt_test_{uuid.uuid4().hex}',
+            'object': 'event',
+            'type': event_type,
+            'created': int(time.time()),
+            'data': {'object': dict(session)},
+        }
+        payload = json.dumps(event)
+        return payload, sign_payload(payload, self.webhook_secret)
+
+    def send_event(self, session_id, event_type='checkout.session.completed'):
+        payload, signature = self.build_event(session_id, event_type)
+        if self.webhook_url:
+            request = Request(self.webhook_url, data=payload.encode(), method='POST',
+                              headers={'Content-Type': 'application/json', 'Stripe-Signature': signature})
+            urlopen(request, timeout=10).close()
+        return payload, signature
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Request-Id', f'req_{uuid.uuid4().hex[:14]}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode()
+        if self.path == '/v1/checkout/sessions':
+            session = self.server.create_session(parse_form(body), self.headers.get('Idempotency-Key'))
+            self.send_json(200, session)
+        else:
+            self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'Unknown path'}})
+
+    def do_GET(self):
+        match = re.fullmatch(r'/v1/checkout/sessions/(\w+)', self.path)
+        if match and match.group(1) in self.server.sessions:
+            self.send_json(200, self.server.sessions[match.group(1)])
+            return
+
+        match = re.fullmatch(r'/pay/(\w+)', self.path)
+        if match and match.group(1) in self.server.sessions:
+            session_id = match.group(1)
+            self.server.send_event(session_id)
+            success_url = self.server.sessions[session_id]['success_url'] or '/'
+            self.send_response(303)
+            self.send_header('Location', success_url.replace('{CHECKOUT_SESSION_ID}', session_id))
+            self.end_headers()
+            return
+
+        self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'Unknown path'}})
+
+
+# Запуск заглушки в фоновом потоке, port=0 - свободный порт
+def start_fake_stripe(host='127.0.0.1', port=0, webhook_url=None, webhook_secret='whsec_test'):
+    server = FakeStripeServer((host, port), webhook_url, webhook_secret)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
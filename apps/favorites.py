@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .models import FavoriteProducts
+
+FAVORITE_IDS_CACHE_KEY = 'favorites:{}'
+# Сброс по переключению доходит до других воркеров только через общий кэш (root/cache.py).
+# Короткий срок ограничивает, сколько сердечко может врать, если кэш у процессов свой
+FAVORITE_IDS_CACHE_TIMEOUT = 60
+
+
+# Множество id избранных товаров пользователя, хранится в кэше
+def get_favorite_ids(user):
+    if not user.is_authenticated:
+        return set()
+
+    key = FAVORITE_IDS_CACHE_KEY.format(user.pk)
+    favorite_ids = cache.get(key)
+    if favorite_ids is None:
+        favorite_ids = set(FavoriteProducts.objects.filter(user=user).values_list('product_id', flat=True))
+        cache.set(key, favorite_ids, FAVORITE_IDS_CACHE_TIMEOUT)
+    return favorite_ids
+
+
+async def aget_favorite_ids(user):
+    if not user.is_authenticated:
+        return set()
+
+    key = FAVORITE_IDS_CACHE_KEY.format(user.pk)
+    favorite_ids = await cache.aget(key)
+    if favorite_ids is None:
+        product_ids = FavoriteProducts.objects.filter(user=user).values_list('product_id', flat=True)
+        favorite_ids = {pk async for pk in product_ids}
+        await cache.aset(key, favorite_ids, FAVORITE_IDS_CACHE_TIMEOUT)
+    return favorite_ids
+
+
+# Добавляем или убираем товар из избранного одним DELETE или INSERT.
+# Возвращает True если товар добавлен
+def toggle_favorite(user, product):
+    deleted, _ = FavoriteProducts.objects.filter(user=user, product=product).delete()
+    added = not deleted
+    if added:
+        try:
+            with transaction.atomic():
+                FavoriteProducts.objects.create(user=user, product=product)
+        except IntegrityError:  # параллельный запрос уже добавил этот товар
+            pass
+
+    cache.delete(FAVORITE_IDS_CACHE_KEY.format(user.pk))
+    return added
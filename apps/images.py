@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError, features
+
+DERIVATIVES_CACHE_KEY = 'images:derivatives:{}'
+
+# Форматы Pillow и расширения файлов
+FORMATS = {
+    'avif': ('AVIF', 'avif'),
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+    'png': ('PNG', 'png'),
+}
+
+
+# Какие современные форматы умеет собранный Pillow
+def get_supported_formats():
+    return [fmt for fmt in settings.IMAGE_DERIVATIVE_FORMATS if features.check(fmt)]
+
+
+# Запасной формат для <img src>: jpeg для фото, png если есть прозрачность
+def get_fallback_format(image):
+    return 'png' if image.mode in ('RGBA', 'LA', 'P') else 'jpeg'
+
+
+def resize(image, width):
+    if image.width <= width:
+        return image.copy()
+    height = round(image.height * width / image.width)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+# Ширины производных для картинки: картинки не растягиваются, поэтому ширины не меньше исходной
+# заменяются одним вариантом в исходную ширину, иначе srcset обещал бы браузеру размер, которого нет
+def get_widths(image):
+    widths = [width for width in settings.IMAGE_DERIVATIVE_WIDTHS if width < image.width]
+    if len(widths) < len(settings.IMAGE_DERIVATIVE_WIDTHS):
+        widths.append(image.width)
+    return widths
+
+
+def encode(image, fmt):
+    pillow_format, extension = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, quality=settings.IMAGE_DERIVATIVE_QUALITY)
+    return buffer.getvalue()
+
+
+def save_derivative(image, digest, width, fmt):
+    path = os.path.join(settings.IMAGE_DERIVATIVES_DIR, f'{digest}_{width}.{FORMATS[fmt][1]}')
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(encode(resize(image, width), fmt)))
+    return path
+
+
+# Манифест производных лежит рядом с ними в хранилище: его видят все процессы и он переживает
+# перезапуск, поэтому после промаха кэша картинку не нужно читать и декодировать заново
+def get_manifest_path(name):
+    return os.path.join(settings.IMAGE_DERIVATIVES_DIR, 'manifests', f'{hashlib.md5(name.encode()).hexdigest()}.json')
+
+
+def load_manifest(name):
+    try:
+        with default_storage.open(get_manifest_path(name), 'rb') as manifest:
+            data = json.load(manifest)
+    except (FileNotFoundError, ValueError):
+        return None
+    # В JSON ключи-ширины стали строками
+    return {fmt: variants if fmt == 'fallback' else {int(width): path for width, path in variants.items()}
+            for fmt, variants in data.items()}
+
+
+def save_manifest(name, derivatives):
+    path = get_manifest_path(name)
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    default_storage.save(path, ContentFile(json.dumps(derivatives).encode()))
+
+
+# Генерируем все размеры и форматы для одной картинки и сохраняем манифест.
+# Имена файлов строятся из хэша содержимого, поэтому готовые файлы не пересоздаются, а картинка
+# декодируется только если какого-то файла ещё нет (Image.open читает лишь заголовок).
+# Формат, который не удалось закодировать (например, Pillow без кодека AVIF), пропускается.
+# Возвращает {формат: {ширина: путь}} или None если файл не растровая картинка (например svg)
+# или его не удалось закодировать даже в запасной формат
+def generate_derivatives(name):
+    with default_storage.open(name, 'rb') as source:
+        content = source.read()
+    digest = hashlib.sha1(content).hexdigest()[:16]
+
+    try:
+        image = Image.open(BytesIO(content))
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    fallback = get_fallback_format(image)
+    derivatives = {}
+    for fmt in get_supported_formats() + [fallback]:
+        try:
+            derivatives[fmt] = {width: save_derivative(image, digest, width, fmt) for width in get_widths(image)}
+        except (OSError, ValueError, KeyError):
+            if fmt == fallback:
+                return None
+    derivatives['fallback'] = fallback
+    save_manifest(name, derivatives)
+    return derivatives
+
+
+def get_derivatives_key(name):
+    return DERIVATIVES_CACHE_KEY.format(hashlib.md5(name.encode()).hexdigest())
+
+
+# Пустой результат (нет файла, svg) храним недолго, готовые варианты - бессрочно
+def store_derivatives(name, derivatives):
+    cache.set(get_derivatives_key(name), derivatives or {}, None if derivatives else 60 * 5)
+
+
+# Производные картинки: из кэша, затем из манифеста, при первом обращении генерируются прямо в запросе
+def get_derivatives(name):
+    derivatives = cache.get(get_derivatives_key(name))
+    if derivatives is not None:
+        return derivatives
+
+    derivatives = load_manifest(name)
+    if derivatives is None:
+        try:
+            derivatives = generate_derivatives(name) or {}
+        except FileNotFoundError:
+            derivatives = {}
+    store_derivatives(name, derivatives)
+    return derivatives
+
+
+# URL картинки нужной ширины и формата, без производных - URL оригинала
+def get_image_url(field_file, width=None, fmt=None):
+    if not field_file:
+        return '-'
+    derivatives = get_derivatives(field_file.name)
+    if not derivatives:
+        return field_file.url
+
+    variants = derivatives.get(fmt or derivatives['fallback']) or derivatives[derivatives['fallback']]
+    width = width or settings.IMAGE_DERIVATIVE_WIDTHS[0]
+    # Берём ближайший размер не меньше запрошенного
+    fitting = [w for w in sorted(variants) if w >= width] or [max(variants)]
+    return default_storage.url(variants[fitting[0]])
+
+
+# srcset для <source>/<img>: "url 200w, url 400w, ..."
+def get_image_srcset(field_file, fmt=None):
+    if not field_file:
+        return ''
+    derivatives = get_derivatives(field_file.name)
+    if not derivatives:
+        return ''
+    variants = derivatives.get(fmt or derivatives['fallback'], {})
+    return ', '.join(f'{default_storage.url(path)} {width}w' for width, path in sorted(variants.items()))
@@ -0,0 +1,172 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+# Метрики текущего запроса, через них шаблоны сообщают время рендера
+current_metrics = ContextVar('current_metrics', default=None)
+
+# Списки параметров IN (%s, %s, ...) разной длины считаем одним и тем же запросом
+IN_PARAMS_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+# Числа и строки прямо в тексте запроса (LIMIT 21, OFFSET 12 и т.п.)
+LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+log_lock = threading.Lock()
+
+
+# Отпечаток SQL: текст без значений параметров, чтобы N+1 (один и тот же запрос
+# с разными id) складывался в одну строку
+def get_sql_fingerprint(sql):
+    sql = IN_PARAMS_RE.sub('(%s...)', sql)
+    sql = LITERALS_RE.sub('?', sql)
+    return ' '.join(sql.split())
+
+
+# Запросы с одинаковым отпечатком, выполненные больше одного раза: [(отпечаток, сколько раз)]
+def get_duplicates(fingerprints):
+    return [(fingerprint, count) for fingerprint, count in Counter(fingerprints).most_common() if count > 1]
+
+
+# Стоимость одного запроса: число запросов к базе, время в базе и в шаблонах.
+# Запросы к базе передаёт record_query
+class RequestMetrics:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.total_time = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.fingerprints = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started_at
+            self.fingerprints.append(get_sql_fingerprint(sql))
+
+    @property
+    def queries(self):
+        return len(self.fingerprints)
+
+    @property
+    def duplicates(self):
+        return get_duplicates(self.fingerprints)
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.started_at
+
+    # Заголовок Server-Timing, время в миллисекундах (видно во вкладке Network браузера)
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'dup;desc="{sum(count for fingerprint, count in self.duplicates)} duplicates"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+            'duplicates': [{'sql': fingerprint, 'count': count} for fingerprint, count in self.duplicates[:5]],
+        }
+
+
+# Запрос к базе записывается в метрики текущего запроса. Обёртка стоит на всех соединениях,
+# а метрики берутся из contextvar: под ASGI async ORM и sync вьюшки выполняют запросы в sync-потоке
+# со своими соединениями, и contextvar приходит туда вместе с sync_to_async
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def add_query_recording(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# Уже открытым соединениям обёртка ставится сразу, новым - при подключении
+def install_query_recording():
+    for connection in connections.all(initialized_only=True):
+        add_query_recording(connection=connection)
+    connection_created.connect(add_query_recording, dispatch_uid='add_query_recording')
+
+
+# Время рендера шаблона верхнего уровня. Вложенные include и inclusion-теги
+# рендерятся внутри него и отдельно не считаются
+original_template_render = Template.render
+
+
+def instrumented_template_render(self, context=None, request=None):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return original_template_render(self, context, request)
+    started_at = time.perf_counter()
+    try:
+        return original_template_render(self, context, request)
+    finally:
+        metrics.template_time += time.perf_counter() - started_at
+
+
+def install_template_timing():
+    Template.render = instrumented_template_render
+
+
+# Допустимое число запросов для имени URL из settings.QUERY_BUDGETS (None - без ограничения)
+def get_query_budget(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+
+# Строка в JSON-lines журнал запросов settings.INSTRUMENTATION_LOG
+def write_request_log(record):
+    path = getattr(settings, 'INSTRUMENTATION_LOG', None)
+    if not path:
+        return
+    line = json.dumps(record, ensure_ascii=False)
+    with log_lock:
+        with open(path, 'a', encoding='utf-8') as log:
+            log.write(line + '\n')
+
+
+# -------------------------------------------------------------------------------------
+
+# Для тестов: выполняет GET запрос и падает, если вьюшка сделала больше запросов к базе,
+# чем разрешено ей в settings.QUERY_BUDGETS
+class QueryBudgetMixin:
+    def assertWithinQueryBudget(self, path, data=None, **extra):
+        url_name = resolve(urlsplit(path).path).url_name
+        budget = get_query_budget(url_name)
+        if budget is None:
+            self.fail(f'Для {url_name!r} не задан лимит запросов в QUERY_BUDGETS')
+
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in connections]
+            response = self.client.get(path, data, **extra)
+
+        queries = [query['sql'] for context in contexts for query in context.captured_queries]
+        if len(queries) > budget:
+            duplicates = '\n'.join(f'{count} x {fingerprint}'
+                                   for fingerprint, count in get_duplicates(map(get_sql_fingerprint, queries)))
+            self.fail(f'{url_name}: {len(queries)} запросов при лимите {budget}\n'
+                      + '\n'.join(queries) + (f'\nПовторы:\n{duplicates}' if duplicates else ''))
+        return response
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.benchmark import ConcurrencyBenchmark, get_async_benchmark_urls
+from apps.synthetic import SYNTHETIC_PREFIX
+
+
+# Сравнение sync вьюшек (WSGI) и async вьюшек (ASGI) при одновременных запросах на синтетическом каталоге.
+# По умолчанию оба пути гоняются в процессе. Для замера на настоящих серверах запустите, например,
+# gunicorn root.wsgi и uvicorn root.asgi:application (или daphne) и передайте их адреса в --base-url
+class Command(BaseCommand):
+    help = 'Пропускная способность и задержки sync вьюшек под WSGI против async вьюшек под ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на страницу')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных запросов')
+        parser.add_argument('--warm', action='store_true', help='Не очищать кэш перед запросами')
+        parser.add_argument('--prefix', default=SYNTHETIC_PREFIX)
+        parser.add_argument('--user', help='Логин для страниц со входом, по умолчанию <prefix>-user-0')
+        parser.add_argument('--base-url', action='append', default=[],
+                            help='Адрес запущенного сервера, можно указать несколько раз')
+
+    def handle(self, *args, **options):
+        urls = get_async_benchmark_urls(options['prefix'])
+        if not urls:
+            raise CommandError('Синтетический каталог не найден, сначала запустите generate_catalog')
+
+        for base_url in options['base_url'] or [None]:
+            benchmark = ConcurrencyBenchmark(urls, options['requests'], options['concurrency'],
+                                             cold=not options['warm'],
+                                             username=options['user'] or f'{options["prefix"]}-user-0',
+                                             base_url=base_url)
+            if not benchmark.is_logged_in:
+                self.stderr.write('Не удалось войти, страницы со входом пропущены')
+            report = benchmark.run()
+
+            self.stdout.write(f'Сервер: {report["server"]}, одновременных запросов: {report["concurrency"]}')
+            self.stdout.write(f'{"страница":<16}{"путь":>6}{"статус":>8}{"запр/с":>10}{"p50":>10}{"p95":>10}'
+                              f'{"p99":>10}{"запросов":>10}')
+            for name, result in report['urls'].items():
+                for kind in ('wsgi', 'asgi'):
+                    row = result[kind]
+                    status = ','.join(map(str, row['status']))
+                    queries = '-' if row['queries'] is None else row['queries']
+                    self.stdout.write(f'{name:<16}{kind:>6}{status:>8}{row["rps"]:>10.1f}{row["p50"]:>10.2f}'
+                                      f'{row["p95"]:>10.2f}{row["p99"]:>10.2f}{queries:>10}')
+                self.stdout.write(self.style.SUCCESS(f'{name:<16}  async/sync: x{result["speedup"]:.2f}'))
@@ -0,0 +1,103 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, close_old_connections, OperationalError
+from django.test import RequestFactory, override_settings
+
+from apps.models import Category, Product, Customer, Order, OrderProduct
+from apps.utils import CartForAuthenticatedUser
+
+# Настройки базы до root/database.py: журнал DELETE с полным fsync и новое соединение на каждый запрос
+BASELINE_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full'}
+
+
+# Нагрузочное сравнение изменений корзины (add_or_delete) из нескольких потоков:
+# исходные настройки базы против настроек из окружения (WAL, busy_timeout, постоянные соединения).
+# Каждая операция оформлена как отдельный запрос: соединения закрываются по CONN_MAX_AGE между ними
+class Command(BaseCommand):
+    help = 'Пропускная способность изменений корзины: исходные настройки базы против настроенных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=200, help='Изменений корзины на поток')
+        parser.add_argument('--products', type=int, default=20)
+
+    def handle(self, *args, **options):
+        category = Category.objects.create(title='Bench cart', slug='bench-cart')
+        products = [
+            Product.objects.create(title=f'Bench cart {number}', price=1000, quantity=10 ** 6, category=category,
+                                   slug=f'bench-cart-{number}', color_name='-', color_code='-').pk
+            for number in range(options['products'])
+        ]
+        password = make_password(None)
+        users = User.objects.bulk_create([User(username=f'bench-cart-{number}', password=password)
+                                          for number in range(options['threads'])])
+        configured = settings.DATABASES['default'].get('CONN_MAX_AGE', 0)
+        try:
+            profiles = [('исходные настройки', BASELINE_PRAGMAS, 0),
+                        ('настройки из окружения', settings.SQLITE_PRAGMAS, configured)]
+            results = {}
+            for name, pragmas, conn_max_age in profiles:
+                results[name] = self.run_profile(users, products, options['operations'], pragmas, conn_max_age)
+                self.stdout.write(f'{connection.vendor}, {name}: {results[name][0]:.0f} операций/с, '
+                                  f'"database is locked" {results[name][1]}')
+
+            baseline, tuned = (result[0] for result in results.values())
+            self.stdout.write(self.style.SUCCESS(f'Ускорение: x{tuned / baseline:.2f}'))
+        finally:
+            connections.close_all()
+            OrderProduct.objects.filter(order__customer__user__in=users).delete()
+            Order.objects.filter(customer__user__in=users).delete()
+            Customer.objects.filter(user__in=users).delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            category.delete()
+
+    def run_profile(self, users, products, operations, pragmas, conn_max_age):
+        database = connections.settings['default']
+        previous_max_age = database['CONN_MAX_AGE']
+        # journal_mode меняется только когда других соединений с файлом нет
+        connections.close_all()
+        database['CONN_MAX_AGE'] = conn_max_age
+        locked = []
+
+        def worker(user):
+            factory = RequestFactory()
+            try:
+                for number in range(operations):
+                    request = factory.get('/')
+                    request.user = user
+                    request._messages = CookieStorage(request)
+                    action = 'add' if number % 2 == 0 else 'delete'
+                    product_id = random.choice(products) if action == 'add' else product_id
+                    while True:
+                        try:
+                            close_old_connections()
+                            CartForAuthenticatedUser(request, product_id, action)
+                            break
+                        except OperationalError:  # database is locked - повторяем
+                            locked.append(1)
+                            time.sleep(0.001)
+                        finally:
+                            close_old_connections()
+            finally:
+                connection.close()
+
+        try:
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                started = time.perf_counter()
+                workers = [threading.Thread(target=worker, args=(user,)) for user in users]
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                connections.close_all()
+        finally:
+            database['CONN_MAX_AGE'] = previous_max_age
+        return len(users) * operations / elapsed, len(locked)
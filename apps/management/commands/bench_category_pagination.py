@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+
+from apps.catalog import get_category_products, invalidate_category_tree
+from apps.models import Category, Product
+from apps.pagination import KeysetPaginator
+
+
+class BenchmarkRollback(Exception):
+    pass
+
+
+# Команда для сравнения OFFSET и keyset пагинации на синтетическом каталоге.
+# Все созданные данные откатываются после замера.
+class Command(BaseCommand):
+    help = 'Замер скорости пагинации страницы категории на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--subcategories', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=12)
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000])
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise BenchmarkRollback
+        except BenchmarkRollback:
+            invalidate_category_tree()
+
+    def run(self, options):
+        root = Category.objects.create(title='Bench', slug='bench-root')
+        subcategories = Category.objects.bulk_create([
+            Category(title=f'Bench {i}', slug=f'bench-{i}', parent=root)
+            for i in range(options['subcategories'])
+        ])
+        invalidate_category_tree()
+
+        products = [
+            Product(title=f'Bench product {i}', price=i, effective_price=i, quantity=1, color_name='-',
+                    color_code='-', slug=f'bench-product-{i}', category=subcategories[i % len(subcategories)])
+            for i in range(options['products'])
+        ]
+        Product.objects.bulk_create(products, batch_size=1000)
+        self.stdout.write(f'Создано товаров: {len(products)}')
+
+        queryset = get_category_products(root).order_by(*KeysetPaginator.ordering)
+        page_size = options['page_size']
+
+        for number in options['pages']:
+            started = time.perf_counter()
+            paginator = Paginator(queryset, page_size)
+            if number > paginator.num_pages:
+                break
+            list(paginator.page(number).object_list)
+            offset_time = time.perf_counter() - started
+
+            # Доходим до нужной страницы по курсору, замеряем только последний запрос
+            keyset = KeysetPaginator(queryset, page_size)
+            cursor = self.cursor_for_page(queryset, page_size, number)
+            started = time.perf_counter()
+            keyset.get_page(cursor)
+            keyset_time = time.perf_counter() - started
+
+            self.stdout.write(f'Страница {number}: offset {offset_time * 1000:.2f} мс, '
+                              f'keyset {keyset_time * 1000:.2f} мс')
+
+    @staticmethod
+    def cursor_for_page(queryset, page_size, number):
+        if number == 1:
+            return None
+        last = queryset.order_by(*KeysetPaginator.ordering)[(number - 1) * page_size - 1]
+        return KeysetPaginator(queryset, page_size).encode_cursor(last)
@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.catalog import invalidate_category_tree
+from apps.models import Category, Product, ProductDescription, Brand
+from apps.search import index_products, search_products, autocomplete
+
+WORDS = ['телевизор', 'ноутбук', 'смартфон', 'диван', 'кресло', 'шкаф', 'стол', 'кровать', 'матрас', 'комод',
+         'samsung', 'apple', 'xiaomi', 'lg', 'sony', 'белый', 'чёрный', 'серый', 'дуб', 'орех']
+
+
+class BenchmarkRollback(Exception):
+    pass
+
+
+# Замер скорости поиска на синтетическом каталоге. Созданные данные откатываются
+class Command(BaseCommand):
+    help = 'Замер задержки полнотекстового поиска на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise BenchmarkRollback
+        except BenchmarkRollback:
+            invalidate_category_tree()
+
+    def run(self, options):
+        rnd = random.Random(42)
+        categories = Category.objects.bulk_create([Category(title=f'Bench {i}', slug=f'bench-search-{i}')
+                                                   for i in range(20)])
+        Brand.objects.bulk_create([Brand(title=rnd.choice(WORDS[10:15]), category=category)
+                                   for category in categories])
+
+        started = time.perf_counter()
+        for start in range(0, options['products'], options['batch_size']):
+            count = min(options['batch_size'], options['products'] - start)
+            products = Product.objects.bulk_create([
+                Product(title=' '.join(rnd.sample(WORDS, 3)), price=i, effective_price=i,
+                        category=rnd.choice(categories), slug=f'bench-search-{start + i}',
+                        color_name=rnd.choice(WORDS[15:]), color_code='-')
+                for i in range(count)
+            ])
+            ProductDescription.objects.bulk_create([
+                ProductDescription(product=product, parameter='Материал', parameter_info=rnd.choice(WORDS[15:]))
+                for product in products
+            ])
+            index_products([product.pk for product in products])
+        self.stdout.write(f'Индексация {options["products"]} товаров: {time.perf_counter() - started:.1f} с')
+
+        self.report('Поиск', [lambda: search_products(' '.join(rnd.sample(WORDS, 2)))
+                              for _ in range(options['queries'])])
+        self.report('Поиск, 50-я страница', [lambda: search_products(rnd.choice(WORDS), 20, 20 * 50)
+                                             for _ in range(options['queries'])])
+        self.report('Автодополнение', [lambda: autocomplete(rnd.choice(WORDS)[:3])
+                                       for _ in range(options['queries'])])
+
+    def report(self, name, calls):
+        timings = []
+        for call in calls:
+            started = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'{name}: p50 {statistics.median(timings):.2f} мс, p95 {p95:.2f} мс')
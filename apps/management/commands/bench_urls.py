@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.benchmark import BenchmarkRunner, get_benchmark_urls, save_baseline, load_baseline, compare_reports
+from apps.synthetic import SYNTHETIC_PREFIX
+
+
+# Команда для замера страниц сайта на синтетическом каталоге (сначала generate_catalog):
+# перцентили времени ответа, запросы к базе и память, сравнение с сохранённым базовым прогоном
+class Command(BaseCommand):
+    help = 'Замер p50/p95/p99, числа запросов и памяти для страниц сайта на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на страницу')
+        parser.add_argument('--cold', action='store_true', help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--prefix', default=SYNTHETIC_PREFIX)
+        parser.add_argument('--user', help='Логин для страниц со входом, по умолчанию <prefix>-user-0')
+        parser.add_argument('--url', action='append', default=[], help='Дополнительный адрес для замера')
+        parser.add_argument('--save', metavar='PATH', help='Сохранить результат как базовый прогон')
+        parser.add_argument('--compare', metavar='PATH', help='Сравнить с базовым прогоном')
+
+    def handle(self, *args, **options):
+        urls = get_benchmark_urls(options['prefix'])
+        if not urls:
+            raise CommandError('Синтетический каталог не найден, сначала запустите generate_catalog')
+        urls += [(url, url, False) for url in options['url']]
+
+        runner = BenchmarkRunner(urls, options['requests'], options['cold'],
+                                 username=options['user'] or f'{options["prefix"]}-user-0')
+        if not runner.is_logged_in:
+            self.stderr.write('Не удалось войти, страницы со входом пропущены')
+        report = runner.run()
+
+        changes = compare_reports(report, load_baseline(options['compare'])) if options['compare'] else {}
+        self.stdout.write(f'{"страница":<16}{"статус":>8}{"p50":>10}{"p95":>10}{"p99":>10}{"запросов":>10}'
+                          f'{"память КБ":>12}')
+        for name, result in report['urls'].items():
+            status = ','.join(map(str, result['status']))
+            if result.get('error'):
+                self.stdout.write(f'{name:<16}{status:>8}  ошибка, страница не замерялась')
+                continue
+            self.stdout.write(f'{name:<16}{status:>8}{result["p50"]:>10.2f}{result["p95"]:>10.2f}'
+                              f'{result["p99"]:>10.2f}{result["queries"]:>10}{result["peak_kb"]:>12.1f}')
+            if name in changes:
+                self.stdout.write(' ' * 16 + '  к базе: ' + ', '.join(
+                    f'{metric} {change:+.1f}%' for metric, change in changes[name].items()
+                ))
+        self.stdout.write(f'Пиковая память процесса: {report["max_rss_mb"]} МБ')
+
+        if options['save']:
+            save_baseline(options['save'], report)
+            self.stdout.write(self.style.SUCCESS(f'Базовый прогон сохранён в {options["save"]}'))
+
+        failed = [name for name, result in report['urls'].items() if result.get('error')]
+        if failed:
+            raise CommandError(f'Страницы с ошибкой не вошли в замер: {", ".join(failed)}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from apps.catalog import build_recommendations, bump_catalog_version
+from apps.models import Product
+
+
+# Команда для пакетной пересборки рекомендаций товаров, результат хранится в Product.recommended_ids
+class Command(BaseCommand):
+    help = 'Пересобирает списки похожих товаров для всех товаров каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=3)
+        parser.add_argument('--siblings', action='store_true', help='Брать товары и из соседних подкатегорий')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch = []
+        total = 0
+        for product in Product.objects.only('pk', 'category_id').iterator(chunk_size=options['batch_size']):
+            batch.append(product)
+            if len(batch) >= options['batch_size']:
+                total += build_recommendations(batch, options['count'], options['siblings'])
+                batch = []
+        if batch:
+            total += build_recommendations(batch, options['count'], options['siblings'])
+        # Страницы товаров в кэше показывают старые рекомендации, меняем версию каталога
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f'Рекомендации пересобраны для {total} товаров'))
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.models import (Category, Product, ProductVariantGroup, Gallery, Brand, FavoriteProducts, Customer,
+                         Order, OrderProduct)
+from apps.query_plans import QueryCollector, explain, find_full_scans
+
+
+class ExplainRollback(Exception):
+    pass
+
+
+# Прогоняет страницы сайта, для каждого SELECT смотрит план запроса и падает,
+# если где-то есть полный проход по таблице. Тестовые данные откатываются
+class Command(BaseCommand):
+    help = 'EXPLAIN QUERY PLAN для запросов страниц, ошибка при полном сканировании таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', default=[], help='Дополнительный адрес для проверки')
+        parser.add_argument('--verbose-plans', action='store_true', help='Печатать планы всех запросов')
+
+    def handle(self, *args, **options):
+        problems = []
+        try:
+            # Client ходит с хостом testserver, как в тестах
+            with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                problems = self.run(options)
+                raise ExplainRollback
+        except ExplainRollback:
+            cache.clear()
+
+        if problems:
+            raise CommandError(f'Полное сканирование таблиц в {len(problems)} запросах')
+        self.stdout.write(self.style.SUCCESS('Полных сканирований таблиц нет'))
+
+    def run(self, options):
+        user = self.create_sample_data()
+        client = Client()
+        client.force_login(user)
+
+        checks = [(url, lambda url=url: self.get_page(client, url)) for url in self.get_urls() + options['url']]
+        checks += self.get_querysets(user)
+
+        problems = []
+        for name, check in checks:
+            # Без кэша, иначе часть запросов страницы не выполнится
+            cache.clear()
+            # Сессия cached_db в работе лежит в кэше: подгружаем её заранее, чтобы не считать в бюджет страницы
+            client.session.load()
+            collector = QueryCollector()
+            with connection.execute_wrapper(collector):
+                check()
+
+            self.stdout.write(f'{name}: {len(collector.queries)} запросов')
+            for sql, params in collector.queries:
+                plan = explain(sql, params)
+                scans = find_full_scans(plan)
+                if options['verbose_plans'] or scans:
+                    self.stdout.write(f'  {sql}')
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+                for line in scans:
+                    self.stdout.write(self.style.ERROR(f'  полное сканирование: {line}'))
+                if scans:
+                    problems.append((name, sql))
+        return problems
+
+    def get_page(self, client, url):
+        response = client.get(url)
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+
+    # Минимальный каталог, чтобы все страницы выполнили свои запросы
+    def create_sample_data(self):
+        root = Category.objects.create(title='Explain', slug='explain-root')
+        category = Category.objects.create(title='Explain child', slug='explain-child', parent=root)
+        Brand.objects.create(title='Explain brand', category=category)
+        group = ProductVariantGroup.objects.create(title='Explain model', slug='explain-model')
+        products = []
+        for color in ('red', 'blue'):
+            product = Product.objects.create(title=f'Explain {color}', price=1000, quantity=5, category=category,
+                                             slug=f'explain-{color}', color_name=color, color_code=color,
+                                             variant_group=group)
+            Gallery.objects.create(product=product, image=f'products/explain-{color}.png')
+            products.append(product)
+
+        user = User.objects.create_user('explain-queries')
+        customer = Customer.objects.create(user=user)
+        order = Order.objects.create(customer=customer)
+        OrderProduct.objects.create(order=order, product=products[0], quantity=1)
+        FavoriteProducts.objects.create(user=user, product=products[0])
+        return user
+
+    def get_urls(self):
+        return [
+            reverse('index'),
+            reverse('category_page', kwargs={'slug': 'explain-root'}),
+            reverse('category_page', kwargs={'slug': 'explain-root'}) + '?color=red',
+            reverse('product_detail', kwargs={'slug': 'explain-red'}),
+            reverse('product_color', kwargs={'model_product': 'explain-model', 'color_code': 'blue'}),
+            reverse('search') + '?q=explain',
+            reverse('search_autocomplete') + '?q=expl',
+            reverse('favorite'),
+            reverse('my_cart'),
+            reverse('checkout'),
+        ]
+
+    # Запросы горячих путей без своей страницы: изменение строки корзины и фоновое снятие резервов
+    def get_querysets(self, user):
+        querysets = {
+            'Строка товара в корзине': lambda: OrderProduct.objects.filter(order__customer__user=user,
+                                                                           product__slug='explain-red'),
+            'Просроченные резервы': lambda: OrderProduct.objects.filter(order__is_completed=False,
+                                                                        reserved_at__lt=timezone.now()),
+        }
+        return [(name, lambda queryset=queryset: list(queryset())) for name, queryset in querysets.items()]
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.fake_stripe import FakeStripeServer
+
+
+# Локальная заглушка Stripe API. Запуск вместе с сайтом:
+#   STRIPE_API_BASE=http://127.0.0.1:12111 python manage.py runserver
+#   python manage.py fake_stripe --webhook-url http://127.0.0.1:8000/payment/webhook/
+class Command(BaseCommand):
+    help = 'Запускает локальную заглушку Stripe API для разработки и нагрузочных тестов без сети'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--webhook-url', default=None, help='Куда отправлять события об оплате')
+
+    def handle(self, *args, **options):
+        server = FakeStripeServer((options['host'], options['port']), options['webhook_url'],
+                                  settings.STRIPE_WEBHOOK_SECRET)
+        self.stdout.write(self.style.SUCCESS(f'Заглушка Stripe: {server.base_url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.synthetic import SyntheticCatalog, delete_synthetic_catalog, SYNTHETIC_PREFIX, SYNTHETIC_PASSWORD
+
+
+# Команда для генерации воспроизводимого синтетического каталога под нагрузочные замеры (bench_urls)
+class Command(BaseCommand):
+    help = 'Создаёт синтетический каталог: категории, товары, картинки, характеристики, пользователей с корзинами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roots', type=int, default=4, help='Корневых категорий')
+        parser.add_argument('--depth', type=int, default=2, help='Уровней подкатегорий')
+        parser.add_argument('--children', type=int, default=3, help='Подкатегорий у каждой категории')
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--images', type=int, default=3, help='Картинок у товара')
+        parser.add_argument('--descriptions', type=int, default=5, help='Характеристик у товара')
+        parser.add_argument('--colors', type=int, default=3, help='Цветов у модели товара')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--favorites', type=int, default=5, help='Избранных товаров у пользователя')
+        parser.add_argument('--cart-lines', type=int, default=3, help='Товаров в корзине пользователя')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default=SYNTHETIC_PREFIX)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить каталог с тем же prefix')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            delete_synthetic_catalog(options['prefix'])
+
+        catalog = SyntheticCatalog(
+            roots=options['roots'], depth=options['depth'], children=options['children'],
+            products=options['products'], images=options['images'], descriptions=options['descriptions'],
+            colors=options['colors'], users=options['users'], favorites=options['favorites'],
+            cart_lines=options['cart_lines'], seed=options['seed'], prefix=options['prefix'],
+            batch_size=options['batch_size'],
+        )
+        started = time.perf_counter()
+        with transaction.atomic():
+            summary = catalog.generate()
+
+        self.stdout.write(', '.join(f'{name}: {count}' for name, count in summary.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Каталог создан за {time.perf_counter() - started:.1f} с. '
+            f'Пользователи {options["prefix"]}-user-N, пароль {SYNTHETIC_PASSWORD}'
+        ))
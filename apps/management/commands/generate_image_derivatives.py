@@ -0,0 +1,35 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from apps.images import generate_derivatives, load_manifest
+from apps.models import Gallery, Category
+
+
+# Картинки с готовым манифестом пропускаем, остальные генерируются и сохраняют манифест,
+# по которому их потом найдут веб-процессы
+def safe_generate(name):
+    try:
+        return name, load_manifest(name) or generate_derivatives(name)
+    except FileNotFoundError:
+        return name, None
+
+
+# Команда для заблаговременной генерации уменьшенных копий всех картинок в пуле процессов
+class Command(BaseCommand):
+    help = 'Генерирует миниатюры, webp/avif варианты и размеры для srcset картинок товаров и категорий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        names = set(Gallery.objects.exclude(image='').values_list('image', flat=True))
+        names |= set(Category.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True))
+
+        done = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            for name, derivatives in executor.map(safe_generate, sorted(names), chunksize=8):
+                done += 1 if derivatives else 0
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано картинок: {done} из {len(names)}'))
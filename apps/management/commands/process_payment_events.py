@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.payments import process_payment_events
+
+
+# Обработчик очереди событий вебхука Stripe: завершает оплаченные заказы
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь событий оплаты (PaymentEvent)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, опрашивая очередь')
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между опросами, секунд')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_payment_events(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Обработано событий: {processed}')
+            if not options['loop']:
+                break
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps.search import rebuild_index
+
+
+# Команда для полной переиндексации поиска по товарам
+class Command(BaseCommand):
+    help = 'Пересобирает поисковые документы и полнотекстовый индекс всех товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано товаров: {total}'))
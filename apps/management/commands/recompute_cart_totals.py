@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from apps.models import Order, OrderProduct
+from apps.utils import lines_total_price, recalculate_order_totals
+
+
+# Команда для пересчёта сохранённых итогов корзин по строкам заказов
+class Command(BaseCommand):
+    help = 'Проверяет total_price/total_quantity заказов и пересчитывает расходящиеся по строкам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить итоги и завершиться с ошибкой при расхождении')
+        parser.add_argument('--all', action='store_true', help='Включая выполненные заказы')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all() if options['all'] else Order.objects.filter(is_completed=False)
+
+        totals = {
+            row['order']: row
+            for row in OrderProduct.objects.filter(order__in=orders, product__isnull=False)
+            .values('order')
+            .annotate(price=lines_total_price(), quantity=Sum('quantity'))
+        }
+
+        mismatched = []
+        for order in orders.only('pk', 'total_price', 'total_quantity').iterator(chunk_size=options['batch_size']):
+            row = totals.get(order.pk, {})
+            price = row.get('price') or 0
+            quantity = row.get('quantity') or 0
+            if order.total_price != price or order.total_quantity != quantity:
+                mismatched.append(order.pk)
+
+        if options['check']:
+            if mismatched:
+                raise CommandError(f'Итоги расходятся у {len(mismatched)} заказов: '
+                                   f'{", ".join(str(pk) for pk in mismatched[:20])}')
+            self.stdout.write(self.style.SUCCESS('Итоги всех заказов верны'))
+            return
+
+        # Итоги пишем UPDATE с подзапросами по текущим строкам, а не посчитанными выше значениями:
+        # изменение корзины между чтением и записью иначе было бы затёрто
+        batch_size = options['batch_size']
+        for start in range(0, len(mismatched), batch_size):
+            recalculate_order_totals(Order.objects.filter(pk__in=mismatched[start:start + batch_size]))
+        self.stdout.write(self.style.SUCCESS(f'Исправлено заказов: {len(mismatched)}'))
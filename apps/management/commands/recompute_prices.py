@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.pricing import recompute_effective_prices
+
+
+# Команда для пересчёта цен со скидкой. Запускается по расписанию, чтобы подхватывать
+# правила, у которых наступила дата начала или конца действия
+class Command(BaseCommand):
+    help = 'Пересчитывает Product.effective_price по действующим правилам скидок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = recompute_effective_prices(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Обновлено цен: {updated}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.stock import release_expired_reservations
+
+
+# Команда для снятия просроченных резервов товаров в корзинах (запускать по cron)
+class Command(BaseCommand):
+    help = 'Возвращает на склад товары из корзин, не менявшихся дольше CART_RESERVATION_TTL'
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Снято резервов: {released}'))
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+
+from apps.models import Category, Product
+from apps.stock import reserve_stock
+
+
+# Нагрузочная проверка резервов на настроенной базе (SQLite или Postgres).
+# Создаёт временный товар, резервирует его из нескольких потоков и проверяет что нет перепродажи
+class Command(BaseCommand):
+    help = 'Многопоточная проверка резервирования товара без перепродажи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=200, help='Попыток резерва на поток')
+        parser.add_argument('--stock', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        category = Category.objects.create(title='Stress', slug='stress-stock')
+        product = Product.objects.create(title='Stress', price=1, quantity=options['stock'], category=category,
+                                         slug='stress-stock-product', color_name='-', color_code='-')
+        reserved = []
+        retries = []
+
+        def worker():
+            try:
+                for _ in range(options['attempts']):
+                    while True:
+                        try:
+                            if reserve_stock(product.pk):
+                                reserved.append(1)
+                            break
+                        except OperationalError:  # database is locked - повторяем
+                            retries.append(1)
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            workers = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            product.refresh_from_db()
+            expected = min(options['stock'], options['threads'] * options['attempts'])
+            self.stdout.write(f'{connection.vendor}: резервов {len(reserved)}, остаток {product.quantity}, '
+                              f'повторов {len(retries)}, {len(reserved) / elapsed:.0f} резервов/с')
+            if len(reserved) != expected or product.quantity != options['stock'] - len(reserved):
+                raise CommandError('Обнаружена перепродажа или потерянное обновление')
+            self.stdout.write(self.style.SUCCESS('Перепродажи нет'))
+        finally:
+            category.delete()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.catalog import sync_primary_images
+
+
+# Команда для пересчёта главных картинок всех товаров одним запросом
+class Command(BaseCommand):
+    help = 'Заполняет Product.primary_image первой картинкой галереи по position'
+
+    def handle(self, *args, **options):
+        updated = sync_primary_images()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {updated}'))
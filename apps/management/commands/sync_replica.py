@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from apps.routers import PRIMARY_DB, get_replicas
+
+
+# Команда для локальной проверки реплик на SQLite: копирует файл основной базы в файлы реплик
+# (DATABASE_REPLICAS). На Postgres реплики обновляет сама репликация, команда не нужна
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик, имитируя репликацию'
+
+    def handle(self, *args, **options):
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError('Реплики не настроены, задайте DATABASE_REPLICAS')
+        primary = connections[PRIMARY_DB]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Команда нужна только для SQLite')
+
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.ensure_connection()
+            # backup API копирует согласованный снимок, в том числе из WAL
+            primary.connection.backup(replica.connection)
+            replica.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias}: {replica.settings_dict["NAME"]} обновлена'))
@@ -0,0 +1,132 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .catalog import get_catalog_version
+from .routers import RoutingState, routing_state
+from .instrumentation import (RequestMetrics, current_metrics, install_query_recording, install_template_timing,
+                              get_query_budget, write_request_log, logger)
+from .utils import get_cart
+
+
+# База для наших middleware: работают и под WSGI, и под ASGI. Под ASGI цепочка остаётся асинхронной,
+# иначе Django переключал бы каждый запрос в общий sync-поток и async вьюшки теряли бы смысл.
+# Подклассы задают wrap(request) - контекст вокруг вызова вьюшки и process_response
+class SyncAndAsyncMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.wrap(request) as state:
+            response = self.get_response(request)
+        return self.process_response(request, response, state)
+
+    async def __acall__(self, request):
+        with self.wrap(request) as state:
+            response = await self.get_response(request)
+        return self.process_response(request, response, state)
+
+    def wrap(self, request):
+        return nullcontext()
+
+    def process_response(self, request, response, state):
+        return response
+
+
+# Корзина запроса: создаётся при первом обращении к request.cart и дальше переиспользуется,
+# так что покупатель, заказ и строки корзины ищутся не больше одного раза за запрос
+class CartMiddleware(SyncAndAsyncMiddleware):
+    def wrap(self, request):
+        request.cart = SimpleLazyObject(lambda: get_cart(request))
+        return nullcontext()
+
+
+# Сколько стоит каждый запрос: число запросов к базе, время в базе и в шаблонах, повторяющиеся SQL.
+# Результат уходит в заголовок Server-Timing и в журнал settings.INSTRUMENTATION_LOG,
+# превышение лимита запросов из settings.QUERY_BUDGETS пишется в лог предупреждением
+class InstrumentationMiddleware(SyncAndAsyncMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        install_query_recording()
+        install_template_timing()
+
+    @contextmanager
+    def wrap(self, request):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', False):
+            yield None
+            return
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            yield metrics
+        finally:
+            current_metrics.reset(token)
+
+    def process_response(self, request, response, metrics):
+        if metrics is None:
+            return response
+        metrics.finish()
+
+        request.metrics = metrics
+        if getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = get_query_budget(url_name)
+        over_budget = budget is not None and metrics.queries > budget
+        if over_budget:
+            logger.warning('%s: %s запросов при лимите %s (%s)', url_name, metrics.queries, budget, request.path)
+
+        write_request_log({
+            'method': request.method,
+            'path': request.path,
+            'url_name': url_name,
+            'status': response.status_code,
+            'budget': budget,
+            'over_budget': over_budget,
+            **metrics.as_dict(),
+        })
+        return response
+
+
+# Версия каталога - время его последнего изменения в микросекундах
+def is_catalog_changed_recently():
+    return time.time_ns() // 1000 - get_catalog_version() < settings.REPLICA_PIN_SECONDS * 1_000_000
+
+
+# Чтение своих записей при репликах: запросы с изменениями (не GET/HEAD) и запросы в течение
+# REPLICA_PIN_SECONDS после записи читают с основной базы. Срок хранится в cookie.
+# Так же REPLICA_PIN_SECONDS после любого изменения каталога все читают с основной базы: кэши под новой
+# версией каталога (страницы, фасеты, цвета, дерево категорий) живут до следующего изменения,
+# и собранные с отстающей реплики они так и остались бы устаревшими
+class ReplicaPinMiddleware(SyncAndAsyncMiddleware):
+    cookie_name = 'primary_pin'
+
+    @contextmanager
+    def wrap(self, request):
+        pinned = (request.method not in ('GET', 'HEAD', 'OPTIONS') or self.cookie_name in request.COOKIES
+                  or is_catalog_changed_recently())
+        state = RoutingState(pinned=pinned)
+        token = routing_state.set(state)
+        try:
+            yield state
+        finally:
+            routing_state.reset(token)
+
+    def process_response(self, request, response, state):
+        if state.written:
+            response.set_cookie(self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
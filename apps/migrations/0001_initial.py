@@ -0,0 +1,174 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city_name', models.CharField(max_length=100, verbose_name='Название города')),
+            ],
+            options={
+                'verbose_name': 'Город',
+                'verbose_name_plural': 'Города',
+            },
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=150, verbose_name='Название категории')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='categories/', verbose_name='Картинка')),
+                ('slug', models.SlugField(null=True, unique=True)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subcategories', to='apps.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Категория',
+                'verbose_name_plural': 'Категории',
+            },
+        ),
+        migrations.CreateModel(
+            name='Brand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=150, verbose_name='Название Бренда')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='brand', to='apps.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Бренд',
+                'verbose_name_plural': 'Бренды',
+            },
+        ),
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.CharField(default='', max_length=255, verbose_name='Имя покупателя')),
+                ('last_name', models.CharField(default='', max_length=255, verbose_name='Фамилия покупателя')),
+                ('email', models.EmailField(blank=True, max_length=254, null=True, verbose_name='Почта покупателя')),
+                ('user', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Покупатель',
+                'verbose_name_plural': 'Покупатели',
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата заказа')),
+                ('is_completed', models.BooleanField(default=False, verbose_name='Выполнен ли заказ')),
+                ('shipping', models.BooleanField(default=True, verbose_name='Доставка')),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='apps.customer')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=150, verbose_name='Название товара')),
+                ('price', models.FloatField(verbose_name='Цена')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Количество')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('credit', models.CharField(blank=True, max_length=250, null=True, verbose_name='Рассрочка')),
+                ('discount', models.CharField(blank=True, max_length=250, null=True, verbose_name='Скидка')),
+                ('slug', models.SlugField(null=True, unique=True)),
+                ('color_name', models.CharField(max_length=150, verbose_name='Навзание цыета')),
+                ('color_code', models.CharField(max_length=150, verbose_name='Код цвета')),
+                ('length', models.CharField(blank=True, max_length=100, null=True, verbose_name='Длина')),
+                ('width', models.CharField(blank=True, max_length=100, null=True, verbose_name='Ширина')),
+                ('height', models.CharField(blank=True, max_length=100, null=True, verbose_name='Высота')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='products', to='apps.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Товар',
+                'verbose_name_plural': 'Товары',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(blank=True, default=0, null=True, verbose_name='Количество')),
+                ('added_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('order', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='apps.order', verbose_name='Заказ №')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='apps.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Заказанный товар',
+                'verbose_name_plural': 'Заказанные товары',
+            },
+        ),
+        migrations.CreateModel(
+            name='Gallery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='products/', verbose_name='Картинка товара')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='apps.product')),
+            ],
+            options={
+                'verbose_name': 'Картинка Товара',
+                'verbose_name_plural': 'Картинки Товаров',
+            },
+        ),
+        migrations.CreateModel(
+            name='FavoriteProducts',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='apps.product', verbose_name='Избранный товар')),
+            ],
+            options={
+                'verbose_name': 'Избранное',
+                'verbose_name_plural': 'Избранные товары',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameter', models.CharField(max_length=150, verbose_name='Название параметра')),
+                ('parameter_info', models.CharField(max_length=400, verbose_name='Описание параметра')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameters', to='apps.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Описание Товара',
+                'verbose_name_plural': 'Описание Товаров',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShippingAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=300, verbose_name='Адрес улица/дом')),
+                ('region', models.CharField(max_length=255, verbose_name='Регион/Область')),
+                ('phone', models.CharField(max_length=255, verbose_name='Номер телефона')),
+                ('comment', models.CharField(blank=True, max_length=500, null=True, verbose_name='Комментарий к заказу')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата доставки')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='apps.city', verbose_name='Город доставки')),
+                ('customer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='apps.customer')),
+                ('order', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='apps.order')),
+            ],
+            options={
+                'verbose_name': 'Адрес доставки',
+                'verbose_name_plural': 'Адреса доставок',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.FloatField(default=0, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_quantity',
+            field=models.IntegerField(default=0, verbose_name='Количество товаров'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0002_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='reserved_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата резерва'),
+        ),
+    ]
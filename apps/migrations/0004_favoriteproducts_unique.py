@@ -0,0 +1,28 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:59
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+# Перед созданием ограничения удаляем дубли, оставляя самую раннюю запись
+def remove_duplicate_favorites(apps, schema_editor):
+    FavoriteProducts = apps.get_model('apps', 'FavoriteProducts')
+    keep = FavoriteProducts.objects.values('user', 'product').annotate(keep_id=Min('id')).values('keep_id')
+    FavoriteProducts.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0003_orderproduct_reserved_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_favorites, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favoriteproducts',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_favorite_product'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+# Заполняем главную картинку у уже существующих товаров одним UPDATE
+def backfill_primary_images(apps, schema_editor):
+    Product = apps.get_model('apps', 'Product')
+    Gallery = apps.get_model('apps', 'Gallery')
+    first_image = Gallery.objects.filter(product=OuterRef('pk')).order_by('position', 'pk').values('pk')[:1]
+    Product.objects.update(primary_image=Subquery(first_image))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0004_favoriteproducts_unique'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='gallery',
+            options={'ordering': ['position', 'pk'], 'verbose_name': 'Картинка Товара', 'verbose_name_plural': 'Картинки Товаров'},
+        ),
+        migrations.AddField(
+            model_name='gallery',
+            name='position',
+            field=models.PositiveIntegerField(default=0, verbose_name='Порядок'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='apps.gallery', verbose_name='Главная картинка'),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop),
+    ]
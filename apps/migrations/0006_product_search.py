@@ -0,0 +1,89 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_FTS_TABLE = 'apps_productsearch_fts'
+SEARCH_TABLE = 'apps_productsearchdocument'
+
+
+# Полнотекстовый индекс зависит от базы: FTS5 для SQLite, tsvector + GIN для Postgres.
+# DDL записан здесь, а не берётся из apps/search.py, чтобы миграция не менялась вместе с кодом поиска
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+            f"USING fts5(document, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"ALTER TABLE {SEARCH_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED"
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_search_vector_idx ON {SEARCH_TABLE} USING gin (search_vector)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'ALTER TABLE {SEARCH_TABLE} DROP COLUMN IF EXISTS search_vector')
+
+
+# Документы для уже существующих товаров, иначе поиск ничего не находит, пока товары не пересохранят.
+# Текст документа собирается так же, как в apps/search.py на момент этой миграции
+def backfill_search_documents(apps, schema_editor, batch_size=1000):
+    Product = apps.get_model('apps', 'Product')
+    Brand = apps.get_model('apps', 'Brand')
+    ProductSearchDocument = apps.get_model('apps', 'ProductSearchDocument')
+
+    brands = {}
+    for category_id, title in Brand.objects.filter(category__isnull=False).values_list('category_id', 'title'):
+        brands.setdefault(category_id, []).append(title)
+
+    products = Product.objects.select_related('category').prefetch_related('parameters').order_by('pk')
+    for start in range(0, products.count(), batch_size):
+        documents = {}
+        for product in products[start:start + batch_size]:
+            parts = [product.title, product.category.title, product.color_name]
+            parts += brands.get(product.category_id, [])
+            for parameter in product.parameters.all():
+                parts += [parameter.parameter, parameter.parameter_info]
+            documents[product.pk] = ' '.join(part for part in parts if part)
+
+        ProductSearchDocument.objects.bulk_create(
+            [ProductSearchDocument(product_id=pk, document=document) for pk, document in documents.items()]
+        )
+        if schema_editor.connection.vendor == 'sqlite':
+            with schema_editor.connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, document) VALUES (%s, %s)',
+                                   list(documents.items()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0005_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='apps.product', verbose_name='Товар')),
+                ('document', models.TextField(verbose_name='Текст для поиска')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковые документы',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:04
+
+import re
+
+from django.db import migrations, models
+
+
+def parse_dimension(value):
+    match = re.search(r'\d+(?:[.,]\d+)?', value or '')
+    return float(match.group().replace(',', '.')) if match else None
+
+
+# Заполняем числовые размеры у уже существующих товаров
+def backfill_dimensions(apps, schema_editor):
+    Product = apps.get_model('apps', 'Product')
+    batch = []
+    for product in Product.objects.only('length', 'width', 'height').iterator(chunk_size=1000):
+        product.length_value = parse_dimension(product.length)
+        product.width_value = parse_dimension(product.width)
+        product.height_value = parse_dimension(product.height)
+        batch.append(product)
+        if len(batch) >= 1000:
+            Product.objects.bulk_update(batch, ['length_value', 'width_value', 'height_value'])
+            batch = []
+    Product.objects.bulk_update(batch, ['length_value', 'width_value', 'height_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0006_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='height_value',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='Высота, число'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='length_value',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='Длина, число'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='width_value',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='Ширина, число'),
+        ),
+        migrations.RunPython(backfill_dimensions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0007_product_dimension_values'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariantGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255, verbose_name='Модель')),
+                ('slug', models.SlugField(unique=True, verbose_name='Слаг модели')),
+            ],
+            options={
+                'verbose_name': 'Модель товара',
+                'verbose_name_plural': 'Модели товаров',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='variant_group',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='variants', to='apps.productvariantgroup', verbose_name='Модель'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['variant_group', 'color_code'], name='product_variant_color_idx'),
+        ),
+    ]
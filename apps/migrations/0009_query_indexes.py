@@ -0,0 +1,63 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+# Перед созданием ограничения сливаем дубли строк заказа в самую раннюю, складывая количество
+def merge_duplicate_order_lines(apps, schema_editor):
+    OrderProduct = apps.get_model('apps', 'OrderProduct')
+    duplicates = (OrderProduct.objects.filter(order__isnull=False, product__isnull=False)
+                  .values('order', 'product')
+                  .annotate(keep_id=Min('id'), total=Sum('quantity'), lines=Count('id'))
+                  .filter(lines__gt=1))
+    for row in duplicates:
+        OrderProduct.objects.filter(pk=row['keep_id']).update(quantity=row['total'])
+        OrderProduct.objects.filter(order=row['order'], product=row['product']).exclude(pk=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0008_product_variant_group'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='favoriteproducts',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='orderproduct',
+            name='order',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='apps.order', verbose_name='Заказ №'),
+        ),
+        migrations.AlterField(
+            model_name='orderproduct',
+            name='reserved_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата резерва'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='apps.category', verbose_name='Категория'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['customer'], name='order_open_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_order_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderproduct',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_order_product'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:10
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+# Цены из float округляем до копеек, итоги открытых корзин пересчитываем по строкам в базе,
+# чтобы накопленная погрешность float не переехала в новые поля
+def convert_money(apps, schema_editor):
+    Product = apps.get_model('apps', 'Product')
+    Order = apps.get_model('apps', 'Order')
+    OrderProduct = apps.get_model('apps', 'OrderProduct')
+
+    Product.objects.update(price=Round('price', 2))
+    Order.objects.update(total_price=Round('total_price', 2))
+
+    lines = (OrderProduct.objects.filter(order=OuterRef('pk'), product__isnull=False)
+             .order_by().values('order')
+             .annotate(total=Sum(F('quantity') * F('product__price'))).values('total'))
+    Order.objects.filter(is_completed=False).update(
+        total_price=Coalesce(Subquery(lines), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0009_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма заказа'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Цена'),
+        ),
+        migrations.RunPython(convert_money, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:13
+
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+MONEY_PLACES = Decimal('0.01')
+
+
+# Скидка вида '10%' (процент) или '150 000' (сумма). Возвращает (процент, сумма)
+def parse_discount(value):
+    match = re.search(r'(\d[\d ]*(?:[.,]\d+)?)\s*(%?)', value or '')
+    if not match:
+        return None, None
+    number = Decimal(match.group(1).replace(' ', '').replace(',', '.'))
+    return (number, None) if match.group(2) else (None, number)
+
+
+# Цена со скидкой на момент миграции: копейки округляются вверх от половины, ниже нуля не бывает.
+# Считаем здесь, а не через apps.money, чтобы миграция не зависела от текущего кода
+def discounted(price, percent, fixed):
+    price = Decimal(price).quantize(MONEY_PLACES, rounding=ROUND_HALF_UP)
+    if percent is not None:
+        price -= (price * percent / 100).quantize(MONEY_PLACES, rounding=ROUND_HALF_UP)
+    if fixed is not None:
+        price -= fixed.quantize(MONEY_PLACES, rounding=ROUND_HALF_UP)
+    return max(price, Decimal(0)).quantize(MONEY_PLACES)
+
+
+# Текстовые скидки товаров переносим в правила на товар и сразу считаем effective_price
+def convert_discounts(apps, schema_editor):
+    Product = apps.get_model('apps', 'Product')
+    DiscountRule = apps.get_model('apps', 'DiscountRule')
+
+    Product.objects.update(effective_price=F('price'))
+
+    rules = []
+    products = []
+    for product in Product.objects.exclude(discount__isnull=True).exclude(discount='').only('price', 'discount'):
+        percent, fixed = parse_discount(product.discount)
+        if percent is None and fixed is None:
+            continue
+        rules.append(DiscountRule(title=f'Скидка {product.discount}'[:255], product=product,
+                                  kind='percent' if percent is not None else 'fixed',
+                                  value=percent if percent is not None else fixed))
+        product.effective_price = min(product.price, discounted(product.price, percent, fixed))
+        products.append(product)
+    DiscountRule.objects.bulk_create(rules)
+    Product.objects.bulk_update(products, ['effective_price'])
+
+    # Итоги открытых корзин были посчитаны по price, пересчитываем по effective_price
+    Order = apps.get_model('apps', 'Order')
+    OrderProduct = apps.get_model('apps', 'OrderProduct')
+    lines = OrderProduct.objects.filter(order=OuterRef('pk'), product__isnull=False).order_by().values('order')
+    Order.objects.filter(is_completed=False).update(total_price=Coalesce(
+        Subquery(lines.annotate(total=Sum(F('quantity') * F('product__effective_price'))).values('total')),
+        Value(0), output_field=models.DecimalField(max_digits=14, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0010_money_decimal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255, verbose_name='Название')),
+                ('kind', models.CharField(choices=[('percent', 'Процент'), ('fixed', 'Сумма')], default='percent', max_length=20, verbose_name='Тип скидки')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Размер скидки')),
+                ('starts_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало действия')),
+                ('ends_at', models.DateTimeField(blank=True, null=True, verbose_name='Конец действия')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Включено')),
+            ],
+            options={
+                'verbose_name': 'Правило скидки',
+                'verbose_name_plural': 'Правила скидок',
+            },
+        ),
+        migrations.CreateModel(
+            name='InstallmentPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255, verbose_name='Название')),
+                ('months', models.PositiveSmallIntegerField(verbose_name='Срок, месяцев')),
+                ('markup_percent', models.DecimalField(decimal_places=2, default=0, max_digits=5, verbose_name='Переплата, %')),
+                ('min_price', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Минимальная цена товара')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Включено')),
+            ],
+            options={
+                'verbose_name': 'План рассрочки',
+                'verbose_name_plural': 'Планы рассрочки',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Цена со скидкой'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='credit',
+            field=models.CharField(blank=True, max_length=250, null=True, verbose_name='Рассрочка (текст)'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='discount',
+            field=models.CharField(blank=True, max_length=250, null=True, verbose_name='Скидка (текст)'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'effective_price', 'id'], name='product_category_price_idx'),
+        ),
+        migrations.AddField(
+            model_name='discountrule',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discount_rules', to='apps.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='discountrule',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discount_rules', to='apps.product', verbose_name='Товар'),
+        ),
+        migrations.AddField(
+            model_name='installmentplan',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='installment_plans', to='apps.category', verbose_name='Категория'),
+        ),
+        migrations.RunPython(convert_discounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0011_pricing_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=255, unique=True, verbose_name='Ключ идемпотентности')),
+                ('session_id', models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='Сессия Stripe')),
+                ('session_url', models.URLField(blank=True, default='', max_length=2000, verbose_name='Ссылка на оплату')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Сумма')),
+                ('shipping', models.JSONField(blank=True, default=dict, verbose_name='Доставка')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='apps.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Платёж',
+                'verbose_name_plural': 'Платежи',
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='Событие Stripe')),
+                ('type', models.CharField(max_length=255, verbose_name='Тип события')),
+                ('payload', models.JSONField(verbose_name='Данные события')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата обработки')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток обработки')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+            ],
+            options={
+                'verbose_name': 'Событие оплаты',
+                'verbose_name_plural': 'События оплаты',
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created_at'], name='paymentevent_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0012_payments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Ошибка'), ('refund', 'Требует возврата')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+    ]
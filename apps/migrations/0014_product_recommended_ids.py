@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0013_payment_refund_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='recommended_ids',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Похожие товары'),
+        ),
+    ]
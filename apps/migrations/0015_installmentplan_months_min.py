@@ -0,0 +1,30 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+# Планы с нулевым сроком ломали карточки товаров: выключаем их, иначе ограничение не создастся
+def disable_zero_month_plans(apps, schema_editor):
+    InstallmentPlan = apps.get_model('apps', 'InstallmentPlan')
+    InstallmentPlan.objects.filter(months=0).update(months=1, is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0014_product_recommended_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='installmentplan',
+            name='months',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Срок, месяцев'),
+        ),
+        migrations.RunPython(disable_zero_month_plans, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='installmentplan',
+            constraint=models.CheckConstraint(check=models.Q(('months__gte', 1)), name='installment_plan_months_gte_1'),
+        ),
+    ]
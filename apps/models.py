@@ -1,10 +1,23 @@
+import re
+
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .money import (MONEY_MAX_DIGITS, MONEY_TOTAL_MAX_DIGITS, MONEY_DECIMAL_PLACES, to_money, apply_discount,
+                    split_installments)
+
 
 # Create your models here.
 
+# Функция для получения числа из размера вида '120 см' или '1,5'
+def parse_dimension(value):
+    match = re.search(r'\d+(?:[.,]\d+)?', value or '')
+    return float(match.group().replace(',', '.')) if match else None
+
+
 class Category(models.Model):
     title = models.CharField(max_length=150, verbose_name='Название категории')
     image = models.ImageField(upload_to='categories/', null=True, blank=True, verbose_name='Картинка')
@@ -34,13 +47,20 @@ class Category(models.Model):
 # Модель товара
 class Product(models.Model):
     title = models.CharField(max_length=150, verbose_name='Название товара')
-    price = models.FloatField(verbose_name='Цена')
+    price = models.DecimalField(max_digits=MONEY_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES,
+                                verbose_name='Цена')
     quantity = models.IntegerField(default=0, verbose_name='Количество')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
-    credit = models.CharField(max_length=250, null=True, blank=True, verbose_name='Рассрочка')
-    discount = models.CharField(max_length=250, null=True, blank=True, verbose_name='Скидка')
+    # Старые текстовые поля, цены считаются по DiscountRule и InstallmentPlan
+    credit = models.CharField(max_length=250, null=True, blank=True, verbose_name='Рассрочка (текст)')
+    discount = models.CharField(max_length=250, null=True, blank=True, verbose_name='Скидка (текст)')
+    # Цена с учётом скидок, пересчитывается пакетно при изменении правил (apps/pricing.py).
+    # По ней работают сортировка, фильтры по цене и суммы корзин
+    effective_price = models.DecimalField(max_digits=MONEY_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES,
+                                          default=0, editable=False, verbose_name='Цена со скидкой')
+    # Индекс по категории не нужен отдельно, его покрывает product_category_created_idx
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products',
-                                 verbose_name='Категория')
+                                 db_index=False, verbose_name='Категория')
     slug = models.SlugField(unique=True, null=True)
     # memory = models.CharField(max_length=250,  verbose_name='Память')
     color_name = models.CharField(max_length=150, verbose_name='Навзание цыета')
@@ -49,20 +69,70 @@ class Product(models.Model):
     length = models.CharField(max_length=100, null=True, blank=True, verbose_name='Длина')
     width = models.CharField(max_length=100, null=True, blank=True, verbose_name='Ширина')
     height = models.CharField(max_length=100, null=True, blank=True, verbose_name='Высота')
+    # Размеры числом, заполняются из текстовых полей при сохранении - по ним работают фильтры
+    length_value = models.FloatField(null=True, blank=True, db_index=True, editable=False, verbose_name='Длина, число')
+    width_value = models.FloatField(null=True, blank=True, db_index=True, editable=False, verbose_name='Ширина, число')
+    height_value = models.FloatField(null=True, blank=True, db_index=True, editable=False, verbose_name='Высота, число')
     # model_product = models.CharField(max_length=255, verbose_name='Модель', null=True, blank=True)
+    # Группа цветовых вариантов одной модели товара
+    # Отдельный индекс по FK не нужен, его покрывает составной индекс (variant_group, color_code)
+    variant_group = models.ForeignKey('ProductVariantGroup', on_delete=models.SET_NULL, null=True, blank=True,
+                                      db_index=False, related_name='variants', verbose_name='Модель')
+    # Главная картинка товара, поддерживается сигналами Gallery, чтобы карточки не делали запрос на картинку
+    primary_image = models.ForeignKey('Gallery', on_delete=models.SET_NULL, null=True, blank=True,
+                                      related_name='+', editable=False, verbose_name='Главная картинка')
+    # Готовые похожие товары (id), пересобираются командой build_recommendations.
+    # Лежат в самой строке товара, поэтому видны всем процессам и приходят вместе с товаром
+    recommended_ids = models.JSONField(null=True, blank=True, editable=False, verbose_name='Похожие товары')
 
 
 
     def get_absolute_url(self):
         return reverse('product_detail', kwargs={'slug': self.slug})
 
+    # Цена со скидкой на момент загрузки: при сохранении по ней видно, поменялась ли она
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_effective_price = instance.__dict__.get('effective_price')
+        return instance
+
+    # Если цена со скидкой изменилась, итоги открытых корзин с этим товаром считаются заново
+    def save(self, *args, **kwargs):
+        self.length_value = parse_dimension(self.length)
+        self.width_value = parse_dimension(self.width)
+        self.height_value = parse_dimension(self.height)
+        from .pricing import calculate_effective_price
+        from .utils import recalculate_order_totals, get_open_orders_with_products
+        self.effective_price = calculate_effective_price(self)
+        update_fields = kwargs.get('update_fields')
+        price_changed = (not self._state.adding
+                         and (update_fields is None or 'effective_price' in update_fields)
+                         and self.effective_price != getattr(self, '_loaded_effective_price', None))
+        super().save(*args, **kwargs)
+        if price_changed:
+            recalculate_order_totals(get_open_orders_with_products([self.pk]))
+        self._loaded_effective_price = self.effective_price
+
+    # Метод для получения цены со скидкой, None если скидки нет
+    def get_discount_price(self):
+        return self.effective_price if self.effective_price < self.price else None
+
+    # Метод для получения минимального ежемесячного платежа по доступным рассрочкам
+    def get_credit_payment(self):
+        from .pricing import get_installments
+        payments = [payment for plan, payment in get_installments(self)]
+        return min(payments) if payments else None
+
+    # Метод для получения главной картинки товара
+    def get_primary_image(self):
+        return self.primary_image if self.primary_image_id else None
+
     # Метод для получения картинки товара
     def get_image_product(self):
-        if self.images:
-            try:
-                return self.images.first().image.url
-            except:
-                return '-'
+        image = self.get_primary_image()
+        if image and image.image:
+            return image.image.url
         else:
             return '-'
 
@@ -72,16 +142,110 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        indexes = [
+            # Страница категории: фильтр по category_id и keyset сортировка (-created_at, -pk)
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+            # Сортировка и фильтр по цене внутри категории
+            models.Index(fields=['category', 'effective_price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['variant_group', 'color_code'], name='product_variant_color_idx'),
+        ]
+
+
+# Модель группы вариантов: один и тот же товар в разных цветах
+class ProductVariantGroup(models.Model):
+    title = models.CharField(max_length=255, verbose_name='Модель')
+    slug = models.SlugField(unique=True, verbose_name='Слаг модели')
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = 'Модель товара'
+        verbose_name_plural = 'Модели товаров'
+
+
+# Правило скидки: процент или сумма, на товар, категорию (с подкатегориями) или весь каталог
+class DiscountRule(models.Model):
+    PERCENT = 'percent'
+    FIXED = 'fixed'
+    KINDS = [
+        (PERCENT, 'Процент'),
+        (FIXED, 'Сумма'),
+    ]
+
+    title = models.CharField(max_length=255, verbose_name='Название')
+    kind = models.CharField(max_length=20, choices=KINDS, default=PERCENT, verbose_name='Тип скидки')
+    value = models.DecimalField(max_digits=MONEY_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES,
+                                verbose_name='Размер скидки')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='discount_rules', verbose_name='Категория')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='discount_rules', verbose_name='Товар')
+    starts_at = models.DateTimeField(null=True, blank=True, verbose_name='Начало действия')
+    ends_at = models.DateTimeField(null=True, blank=True, verbose_name='Конец действия')
+    is_active = models.BooleanField(default=True, verbose_name='Включено')
+
+    # Метод для проверки что правило действует в момент now
+    def is_current(self, now):
+        return (self.starts_at is None or self.starts_at <= now) and (self.ends_at is None or now < self.ends_at)
+
+    # Метод для получения цены после скидки
+    def apply(self, price):
+        if self.kind == self.PERCENT:
+            return apply_discount(price, percent=self.value)
+        return apply_discount(price, fixed=self.value)
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = 'Правило скидки'
+        verbose_name_plural = 'Правила скидок'
+
+
+# План рассрочки: срок, переплата в процентах и минимальная цена товара
+class InstallmentPlan(models.Model):
+    title = models.CharField(max_length=255, verbose_name='Название')
+    # Срок делится на платежи, поэтому не меньше месяца
+    months = models.PositiveSmallIntegerField(validators=[MinValueValidator(1)], verbose_name='Срок, месяцев')
+    markup_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0, verbose_name='Переплата, %')
+    min_price = models.DecimalField(max_digits=MONEY_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES, default=0,
+                                    verbose_name='Минимальная цена товара')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='installment_plans', verbose_name='Категория')
+    is_active = models.BooleanField(default=True, verbose_name='Включено')
+
+    # Метод для получения ежемесячного платежа (первый, самый большой платёж)
+    def monthly_payment(self, price):
+        total = to_money(price * (100 + self.markup_percent) / 100)
+        return split_installments(total, self.months)[0]
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = 'План рассрочки'
+        verbose_name_plural = 'Планы рассрочки'
+        constraints = [
+            models.CheckConstraint(check=models.Q(months__gte=1), name='installment_plan_months_gte_1')
+        ]
 
 
 # Меодель Галереи картинок товаров
 class Gallery(models.Model):
     image = models.ImageField(upload_to='products/', verbose_name='Картинка товара')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
+    position = models.PositiveIntegerField(default=0, verbose_name='Порядок')
+
+    # Метод для получения уменьшенной копии картинки нужной ширины и формата
+    def get_image_url(self, width=None, fmt=None):
+        from .images import get_image_url
+        return get_image_url(self.image, width, fmt)
 
     class Meta:
         verbose_name = 'Картинка Товара'
         verbose_name_plural = 'Картинки Товаров'
+        ordering = ['position', 'pk']
 
 
 # Модель описания товара
@@ -112,10 +276,24 @@ class Brand(models.Model):
 
 
 
+# Поисковый документ товара: название, категория, бренды и параметры одной строкой.
+# Поддерживается сигналами, поверх него строится полнотекстовый индекс (apps/search.py)
+class ProductSearchDocument(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='search_document', verbose_name='Товар')
+    document = models.TextField(verbose_name='Текст для поиска')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Поисковый документ'
+        verbose_name_plural = 'Поисковые документы'
+
+
 # Модел Избранное
 class FavoriteProducts(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Избранный товар')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
+    # Поиск по пользователю идёт по уникальному индексу (user, product)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name='Пользователь')
 
     def __str__(self):
         return f'Товар:{self.product}, пользователя: {self.user.username}'
@@ -124,6 +302,9 @@ class FavoriteProducts(models.Model):
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные товары'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_favorite_product')
+        ]
 
 
 # -------------------------------------------------------------------------------------
@@ -152,6 +333,10 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата заказа')
     is_completed = models.BooleanField(default=False, verbose_name='Выполнен ли заказ')
     shipping = models.BooleanField(default=True, verbose_name='Доставка')
+    # Итоги корзины храним в заказе и меняем атомарно через F() при каждом изменении корзины
+    total_price = models.DecimalField(max_digits=MONEY_TOTAL_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES,
+                                      default=0, verbose_name='Сумма заказа')
+    total_quantity = models.IntegerField(default=0, verbose_name='Количество товаров')
 
     def __str__(self):
         return f'Заказа №: {self.pk}'
@@ -160,19 +345,19 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            # Корзина покупателя - его единственный незавершённый заказ
+            models.Index(fields=['customer'], condition=models.Q(is_completed=False), name='order_open_customer_idx'),
+        ]
 
     # Метод для получения суммы заказа
     @property  # Декоратер чтобы можно было вызывать в другом классе
     def get_cart_total_price(self):
-        order_products = self.orderproduct_set.all()
-        total_price = sum([product.get_total_price for product in order_products])
-        return total_price
+        return self.total_price
 
     @property  # Декоратер чтобы можно было вызывать в другом классе
     def get_cart_total_quantity(self):
-        order_products = self.orderproduct_set.all()
-        total_quantity = sum([product.quantity for product in order_products])
-        return total_quantity
+        return self.total_quantity
 
 
 
@@ -180,9 +365,11 @@ class Order(models.Model):
 
 class OrderProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, verbose_name='Товар')
-    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, verbose_name='Заказ №')
+    # Поиск по заказу идёт по уникальному индексу (order, product)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, db_index=False, verbose_name='Заказ №')
     quantity = models.IntegerField(default=0, null=True, blank=True, verbose_name='Количество')
     added_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
+    reserved_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Дата резерва')
 
     def __str__(self):
         return self.product.title
@@ -191,15 +378,77 @@ class OrderProduct(models.Model):
     class Meta:
         verbose_name = 'Заказанный товар'
         verbose_name_plural = 'Заказанные товары'
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_product')
+        ]
 
     # Метод для получения сумму зказанного товара
     @property
     def get_total_price(self):
-        total_price = self.product.price * self.quantity
+        total_price = self.product.effective_price * self.quantity
         return total_price
 
 
 
+# Платёж за заказ: одна сессия оплаты Stripe. Ключ идемпотентности не даёт создать
+# вторую сессию на ту же корзину при повторной отправке формы
+class Payment(models.Model):
+    PENDING = 'pending'
+    PAID = 'paid'
+    FAILED = 'failed'
+    # Деньги списаны, но заказ по этому платежу не завершён (оплачен другим платежом, корзина изменилась)
+    REFUND = 'refund'
+    STATUSES = [
+        (PENDING, 'Ожидает оплаты'),
+        (PAID, 'Оплачен'),
+        (FAILED, 'Ошибка'),
+        (REFUND, 'Требует возврата'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments', verbose_name='Заказ')
+    idempotency_key = models.CharField(max_length=255, unique=True, verbose_name='Ключ идемпотентности')
+    session_id = models.CharField(max_length=255, unique=True, null=True, blank=True, verbose_name='Сессия Stripe')
+    session_url = models.URLField(max_length=2000, blank=True, default='', verbose_name='Ссылка на оплату')
+    amount = models.DecimalField(max_digits=MONEY_TOTAL_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES,
+                                 verbose_name='Сумма')
+    # Данные формы доставки, ShippingAddress создаётся только после подтверждения оплаты
+    shipping = models.JSONField(default=dict, blank=True, verbose_name='Доставка')
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING, verbose_name='Статус')
+    error = models.TextField(blank=True, default='', verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    def __str__(self):
+        return f'Платёж {self.session_id or self.pk} заказа №{self.order_id}'
+
+    class Meta:
+        verbose_name = 'Платёж'
+        verbose_name_plural = 'Платежи'
+
+
+# Очередь событий вебхука Stripe: вебхук только сохраняет событие, обработчик забирает необработанные.
+# event_id уникален, поэтому повторная доставка того же события ничего не меняет
+class PaymentEvent(models.Model):
+    event_id = models.CharField(max_length=255, unique=True, verbose_name='Событие Stripe')
+    type = models.CharField(max_length=255, verbose_name='Тип события')
+    payload = models.JSONField(verbose_name='Данные события')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата обработки')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток обработки')
+    error = models.TextField(blank=True, default='', verbose_name='Ошибка')
+
+    def __str__(self):
+        return f'{self.type} {self.event_id}'
+
+    class Meta:
+        verbose_name = 'Событие оплаты'
+        verbose_name_plural = 'События оплаты'
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(processed_at__isnull=True),
+                         name='paymentevent_pending_idx'),
+        ]
+
+
 # Модель Доставки
 class ShippingAddress(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True)
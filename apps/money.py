@@ -0,0 +1,51 @@
+from decimal import Decimal, ROUND_HALF_UP, ROUND_DOWN
+
+# Деньги храним в DecimalField с копейками (тийинами), в Stripe отправляем целое число минимальных единиц
+MONEY_MAX_DIGITS = 12
+MONEY_TOTAL_MAX_DIGITS = 14
+MONEY_DECIMAL_PLACES = 2
+MONEY_PLACES = Decimal('0.01')
+MINOR_UNITS = 100
+
+
+# Приводим число к деньгам. float сначала переводим в строку, чтобы не тащить хвост двоичной дроби
+def to_money(value):
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value or 0).quantize(MONEY_PLACES, rounding=ROUND_HALF_UP)
+
+
+# Сумма в минимальных единицах валюты для платёжных систем
+def to_minor_units(amount):
+    return int(to_money(amount) * MINOR_UNITS)
+
+
+def from_minor_units(amount):
+    return to_money(Decimal(amount) / MINOR_UNITS)
+
+
+# Цена со скидкой в процентах или фиксированной суммой. Не бывает меньше нуля
+def apply_discount(amount, percent=None, fixed=None):
+    amount = to_money(amount)
+    if percent:
+        amount -= to_money(amount * Decimal(percent) / 100)
+    if fixed:
+        amount -= to_money(fixed)
+    return max(amount, Decimal(0)).quantize(MONEY_PLACES)
+
+
+# Делим сумму на платежи рассрочки так, чтобы в сумме они давали ровно исходную сумму:
+# лишние копейки уходят в первые платежи
+def split_installments(amount, months):
+    amount = to_money(amount)
+    base = (amount / months).quantize(MONEY_PLACES, rounding=ROUND_DOWN)
+    remainder = int((amount - base * months) * MINOR_UNITS)
+    return [base + MONEY_PLACES if month < remainder else base for month in range(months)]
+
+
+# 1234567.5 -> '1 234 567,50', копейки показываем только если они есть
+def format_money(amount):
+    amount = to_money(amount)
+    rubles = f'{int(amount):_}'.replace('_', ' ')
+    kopecks = int((abs(amount) % 1) * MINOR_UNITS)
+    return f'{rubles},{kopecks:02d}' if kopecks else rubles
@@ -0,0 +1,94 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .catalog import get_catalog_version
+
+PAGE_CACHE_KEY = 'catalog:page:{}:{}'
+
+
+# Кэш целых страниц каталога для гостей.
+# Ключ и ETag строятся из версии каталога, поэтому повторный запрос получает 304 без рендера шаблона
+class CatalogPageCacheMixin:
+    page_cache_timeout = settings.CATALOG_PAGE_CACHE_TIMEOUT
+
+    def is_page_cacheable(self, request):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return False
+        # Непоказанные сообщения выводятся на странице, такие ответы не кэшируем
+        return 'messages' not in request.COOKIES and '_messages' not in request.session
+
+    def get_page_key(self, request, version):
+        # Значок корзины гостя - часть страницы, поэтому кол-во товаров входит в ключ
+        cart_quantity = request.cart.get_total_quantity() if hasattr(request, 'cart') else 0
+        value = f'{version}:{request.get_full_path()}:{cart_quantity}'
+        return hashlib.md5(value.encode()).hexdigest()
+
+    # Готовый ответ из кэша (304 или сохранённая страница) и данные для сохранения новой страницы
+    def get_cached_page(self, request):
+        if not self.is_page_cacheable(request):
+            return None, None
+
+        version = get_catalog_version()
+        page_key = self.get_page_key(request, version)
+        state = {
+            'etag': quote_etag(page_key),
+            'last_modified': int(version // 1_000_000),
+            'cache_key': PAGE_CACHE_KEY.format(self.__class__.__name__, page_key),
+        }
+
+        response = get_conditional_response(request, etag=state['etag'], last_modified=state['last_modified'])
+        if response is not None:
+            return response, None
+
+        cached = cache.get(state['cache_key'])
+        if cached is not None:
+            return self.add_cache_headers(HttpResponse(cached['content'], content_type=cached['content_type']),
+                                          state), None
+        return None, state
+
+    def store_page(self, response, state):
+        if state is None:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code != 200:
+            return response
+        cache.set(state['cache_key'], {'content': response.content, 'content_type': response['Content-Type']},
+                  self.page_cache_timeout)
+        return self.add_cache_headers(response, state)
+
+    @staticmethod
+    def add_cache_headers(response, state):
+        response['ETag'] = state['etag']
+        response['Last-Modified'] = http_date(state['last_modified'])
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        response, state = self.get_cached_page(request)
+        if response is not None:
+            return response
+        return self.store_page(super().dispatch(request, *args, **kwargs), state)
+
+
+# Тот же кэш страниц для async вьюшек. Проверка кэша обращается к сессии, корзине и пользователю,
+# поэтому выполняется в sync-потоке
+def async_catalog_page_cache(view):
+    page_cache = type(view.__name__, (CatalogPageCacheMixin,), {})()
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        response, state = await sync_to_async(page_cache.get_cached_page)(request)
+        if response is not None:
+            return response
+        response = await view(request, *args, **kwargs)
+        return await sync_to_async(page_cache.store_page)(response, state)
+    return wrapper
@@ -0,0 +1,78 @@
+import base64
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+# Страница keyset-пагинации: без COUNT(*) и OFFSET, следующая страница ищется по курсору
+class KeysetPage:
+    def __init__(self, object_list, has_next, next_cursor, cursor=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def has_previous(self):
+        return self.cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+# Пагинатор по (поле, pk). По умолчанию по (created_at, pk) от новых товаров к старым,
+# ordering=('effective_price', 'pk') - по цене. Направление pk должно совпадать с направлением поля
+class KeysetPaginator:
+    ordering = ('-created_at', '-pk')
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering or self.ordering
+        self.field = self.ordering[0].lstrip('-')
+        self.descending = self.ordering[0].startswith('-')
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field)
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return base64.urlsafe_b64encode(f'{value}|{obj.pk}'.encode()).decode()
+
+    # Значение из курсора приводим к типу поля модели (datetime, Decimal, ...)
+    def decode_cursor(self, cursor):
+        try:
+            value = base64.urlsafe_b64decode(cursor.encode()).decode()
+            value, pk = value.rsplit('|', 1)
+            field = self.queryset.model._meta.get_field(self.field)
+            return field.to_python(value), int(pk)
+        except (ValueError, UnicodeError, ValidationError):
+            return None
+
+    def filter_queryset(self, cursor):
+        queryset = self.queryset.order_by(*self.ordering)
+        position = self.decode_cursor(cursor) if cursor else None
+        if position:
+            value, pk = position
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(Q(**{f'{self.field}__{lookup}': value}) |
+                                       Q(**{self.field: value, f'pk__{lookup}': pk}))
+        return queryset, cursor if position else None
+
+    def make_page(self, object_list, cursor):
+        has_next = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        next_cursor = self.encode_cursor(object_list[-1]) if has_next else None
+        return KeysetPage(object_list, has_next, next_cursor, cursor)
+
+    # Берём на один товар больше, чтобы узнать есть ли следующая страница
+    def get_page(self, cursor=None):
+        queryset, cursor = self.filter_queryset(cursor)
+        return self.make_page(list(queryset[:self.per_page + 1]), cursor)
+
+    async def aget_page(self, cursor=None):
+        queryset, cursor = self.filter_queryset(cursor)
+        return self.make_page([obj async for obj in queryset[:self.per_page + 1]], cursor)
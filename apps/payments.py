@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import weakref
+from functools import lru_cache
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Order, OrderProduct, Payment, PaymentEvent, ShippingAddress
+from .money import to_minor_units
+from .utils import get_order_totals
+
+
+# Шлюз к Stripe. Если установлен httpx - запросы асинхронные, иначе синхронный requests в отдельном потоке.
+# Синхронный клиент один на процесс. Асинхронный клиент привязан к event loop, а под WSGI
+# async_to_sync запускает каждый запрос в новом loop, поэтому клиент создаётся на каждый loop
+class StripeGateway:
+    def __init__(self):
+        self.is_async = importlib.util.find_spec('httpx') is not None
+        self.client = None
+        if not self.is_async:
+            self.client = self.make_client(stripe.RequestsClient(timeout=settings.STRIPE_TIMEOUT))
+        self.loop_clients = weakref.WeakKeyDictionary()
+
+    def make_client(self, http_client):
+        base_addresses = {'api': settings.STRIPE_API_BASE} if settings.STRIPE_API_BASE else None
+        # Повторы при сетевых ошибках безопасны: Stripe узнаёт повтор по ключу идемпотентности
+        return stripe.StripeClient(settings.STRIPE_SECRET_KEY, http_client=http_client,
+                                   base_addresses=base_addresses, max_network_retries=settings.STRIPE_MAX_RETRIES)
+
+    def get_async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self.loop_clients.get(loop)
+        if client is None:
+            client = self.loop_clients[loop] = self.make_client(stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT))
+        return client
+
+    async def create_checkout_session(self, params, idempotency_key):
+        options = {'idempotency_key': idempotency_key}
+        if self.is_async:
+            return await self.get_async_client().v1.checkout.sessions.create_async(params, options)
+        create = sync_to_async(self.client.v1.checkout.sessions.create, thread_sensitive=False)
+        return await create(params, options)
+
+    # Проверяем подпись и разбираем событие вебхука
+    def construct_event(self, payload, signature):
+        event = stripe.Webhook.construct_event(payload, signature, settings.STRIPE_WEBHOOK_SECRET)
+        return event.to_dict()
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    return import_string(settings.PAYMENT_GATEWAY)()
+
+
+# -------------------------------------------------------------------------------------
+
+# Ключ идемпотентности зависит от заказа и его содержимого: повторная отправка формы
+# даёт ту же сессию оплаты, а изменённая корзина - новую
+def get_idempotency_key(order, amount):
+    lines = sorted(OrderProduct.objects.filter(order=order, product__isnull=False)
+                   .values_list('product_id', 'quantity'))
+    digest = hashlib.sha256(json.dumps([to_minor_units(amount), lines]).encode()).hexdigest()[:32]
+    return f'checkout-{order.pk}-{digest}'
+
+
+# Данные формы доставки для сохранения в платеже (JSON): вместо объектов их id
+def serialize_shipping(cleaned_data):
+    shipping = {}
+    for name, value in cleaned_data.items():
+        if hasattr(value, 'pk'):
+            shipping[f'{name}_id'] = value.pk
+        else:
+            shipping[name] = value
+    return shipping
+
+
+# Платёж создан под текущее содержимое заказа: ключ тот же или это повторная попытка с тем же ключом
+def payment_matches_order(payment, key):
+    return payment.idempotency_key == key or payment.idempotency_key.startswith(f'{key}-')
+
+
+# Платёж под текущую корзину: существующий ожидающий, если корзина не менялась, иначе новый.
+# Если платёж под эту корзину уже не ждёт оплаты (сессия истекла, ошибка), создаётся новая попытка
+# со своим ключом - иначе Stripe вернул бы старую сессию. Остальные ожидающие платежи заказа
+# отменяются, чтобы по старой ссылке нельзя было оплатить прежнюю корзину.
+# Возвращает None если корзина пустая
+def get_or_create_payment(order, shipping):
+    totals = get_order_totals(order)
+    if not totals['total_quantity']:
+        return None
+    key = get_idempotency_key(order, totals['total_price'])
+    attempts = Payment.objects.filter(order=order, idempotency_key__startswith=key)
+    payment = attempts.order_by('-pk').first()
+
+    if payment is None or payment.status != Payment.PENDING:
+        attempt = attempts.count()
+        payment, _ = Payment.objects.get_or_create(
+            idempotency_key=f'{key}-{attempt}' if attempt else key,
+            defaults={'order': order, 'amount': totals['total_price'], 'shipping': shipping}
+        )
+        (Payment.objects.filter(order=order, status=Payment.PENDING).exclude(pk=payment.pk)
+         .update(status=Payment.FAILED, error='Корзина изменилась, создан новый платёж', updated_at=timezone.now()))
+    elif payment.shipping != shipping:
+        payment.shipping = shipping
+        payment.save(update_fields=['shipping', 'updated_at'])
+    return payment
+
+
+def get_checkout_params(payment, success_url, cancel_url):
+    return {
+        'line_items': [{
+            'price_data': {
+                'currency': settings.STRIPE_CURRENCY,
+                'product_data': {
+                    'name': 'Товары DigitalStore'
+                },
+                'unit_amount': to_minor_units(payment.amount)  # Stripe ждёт сумму в минимальных единицах
+            },
+            'quantity': 1
+        }],
+        'mode': 'payment',
+        'client_reference_id': str(payment.order_id),
+        'metadata': {'payment_id': str(payment.pk)},
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+    }
+
+
+# Ссылка на оплату. Сессия Stripe создаётся один раз на платёж
+async def start_checkout(payment, success_url, cancel_url):
+    if payment.session_url:
+        return payment.session_url
+
+    session = await get_gateway().create_checkout_session(
+        get_checkout_params(payment, success_url, cancel_url), payment.idempotency_key
+    )
+    payment.session_id = session.id
+    payment.session_url = session.url
+    await payment.asave(update_fields=['session_id', 'session_url', 'updated_at'])
+    return payment.session_url
+
+
+# -------------------------------------------------------------------------------------
+
+# Вебхук: проверяем подпись и кладём событие в очередь. Повтор того же события игнорируется
+def enqueue_payment_event(payload, signature):
+    event = get_gateway().construct_event(payload, signature)
+    event, created = PaymentEvent.objects.get_or_create(
+        event_id=event['id'], defaults={'type': event['type'], 'payload': event}
+    )
+    return event
+
+
+# Оплата подтверждена: заказ завершён, адрес доставки сохраняется. Повторный вызов ничего не делает.
+# Заказ блокируется на время проверки. Если заказ уже оплачен другим платежом или корзина изменилась
+# после создания платежа, заказ не завершается, а платёж помечается к возврату
+def complete_payment(session):
+    payment = Payment.objects.select_for_update().filter(session_id=session['id']).first()
+    if payment is None or payment.status in (Payment.PAID, Payment.REFUND):
+        return payment
+
+    if session.get('amount_total') != to_minor_units(payment.amount):
+        payment.status = Payment.FAILED
+        payment.error = f'Сумма оплаты {session.get("amount_total")} не совпадает с суммой платежа'
+        payment.save(update_fields=['status', 'error', 'updated_at'])
+        return payment
+
+    order = Order.objects.select_for_update().get(pk=payment.order_id)
+    if order.is_completed:
+        error = 'Заказ уже оплачен другим платежом'
+    elif not payment_matches_order(payment, get_idempotency_key(order, get_order_totals(order)['total_price'])):
+        error = 'Корзина изменилась после создания платежа'
+    else:
+        error = None
+    if error:
+        payment.status = Payment.REFUND
+        payment.error = error
+        payment.save(update_fields=['status', 'error', 'updated_at'])
+        return payment
+
+    payment.status = Payment.PAID
+    payment.save(update_fields=['status', 'updated_at'])
+    order.is_completed = True
+    order.save(update_fields=['is_completed'])
+    if payment.shipping:
+        ShippingAddress.objects.create(customer_id=order.customer_id, order_id=order.pk, **payment.shipping)
+    return payment
+
+
+def expire_payment(session):
+    Payment.objects.filter(session_id=session['id'], status=Payment.PENDING).update(
+        status=Payment.FAILED, error='Сессия оплаты истекла', updated_at=timezone.now()
+    )
+
+
+def handle_payment_event(event):
+    session = event['payload']['data']['object']
+    if event['type'] in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
+        if session.get('payment_status') == 'paid':
+            complete_payment(session)
+    elif event['type'] in ('checkout.session.expired', 'checkout.session.async_payment_failed'):
+        expire_payment(session)
+
+
+# Обработчик очереди: забирает необработанные события по порядку, каждое в своей транзакции.
+# На Postgres несколько обработчиков не мешают друг другу за счёт SKIP LOCKED
+def process_payment_events(limit=100, max_attempts=5):
+    processed = 0
+    for pk in list(PaymentEvent.objects.filter(processed_at__isnull=True, attempts__lt=max_attempts)
+                   .order_by('created_at').values_list('pk', flat=True)[:limit]):
+        try:
+            with transaction.atomic():
+                event = (PaymentEvent.objects.select_for_update(skip_locked=True)
+                         .filter(pk=pk, processed_at__isnull=True).values('type', 'payload').first())
+                if event is None:
+                    continue
+                handle_payment_event(event)
+                PaymentEvent.objects.filter(pk=pk).update(processed_at=timezone.now(), attempts=F('attempts') + 1)
+            processed += 1
+        except Exception as error:
+            PaymentEvent.objects.filter(pk=pk).update(attempts=F('attempts') + 1, error=str(error))
+    return processed
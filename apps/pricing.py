@@ -0,0 +1,127 @@
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .catalog import get_category_tree, bump_catalog_version
+from .models import Product, DiscountRule, InstallmentPlan
+from .money import to_money
+
+PRICING_PLANS_CACHE_KEY = 'pricing:plans'
+PRICING_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_installment_plans():
+    plans = cache.get(PRICING_PLANS_CACHE_KEY)
+    if plans is None:
+        plans = list(InstallmentPlan.objects.filter(is_active=True).order_by('months'))
+        cache.set(PRICING_PLANS_CACHE_KEY, plans, PRICING_CACHE_TIMEOUT)
+    return plans
+
+
+async def aget_installment_plans():
+    plans = await cache.aget(PRICING_PLANS_CACHE_KEY)
+    if plans is None:
+        plans = [plan async for plan in InstallmentPlan.objects.filter(is_active=True).order_by('months')]
+        await cache.aset(PRICING_PLANS_CACHE_KEY, plans, PRICING_CACHE_TIMEOUT)
+    return plans
+
+
+def invalidate_pricing():
+    cache.delete(PRICING_PLANS_CACHE_KEY)
+
+
+# Категория товара и все её предки: правило категории действует и на подкатегории
+def get_category_chain(category_id, tree=None):
+    tree = tree or get_category_tree()
+    return {category_id} | {category.pk for category in tree.ancestors_by_pk.get(category_id, [])}
+
+
+# Правила разложенные по области действия, чтобы не перебирать все правила для каждого товара
+class PricingRules:
+    def __init__(self, rules, now=None):
+        now = now or timezone.now()
+        self.common = []
+        self.by_category = {}
+        self.by_product = {}
+        for rule in rules:
+            if not rule.is_current(now):
+                continue
+            if rule.product_id:
+                self.by_product.setdefault(rule.product_id, []).append(rule)
+            elif rule.category_id:
+                self.by_category.setdefault(rule.category_id, []).append(rule)
+            else:
+                self.common.append(rule)
+
+    def for_product(self, product_id, category_ids):
+        rules = self.common + self.by_product.get(product_id, [])
+        for category_id in category_ids:
+            rules = rules + self.by_category.get(category_id, [])
+        return rules
+
+    # Итоговая цена - самая выгодная для покупателя из подходящих правил, скидки не суммируются
+    def effective_price(self, product_id, category_id, price, tree=None):
+        price = to_money(price)
+        rules = self.for_product(product_id, get_category_chain(category_id, tree))
+        return min([rule.apply(price) for rule in rules] + [price])
+
+
+# Итоговая цена одного товара, вызывается из Product.save(). Цена сохраняется и идёт в суммы корзин,
+# поэтому правила читаются из базы: кэш другого процесса мог не узнать об их изменении
+def calculate_effective_price(product):
+    category_ids = get_category_chain(product.category_id)
+    rules = DiscountRule.objects.filter(
+        Q(product=None, category=None) | Q(product_id=product.pk) | Q(category_id__in=category_ids),
+        is_active=True,
+    )
+    return PricingRules(list(rules)).effective_price(product.pk, product.category_id, product.price)
+
+
+# Пакетный пересчёт effective_price. Без products - весь каталог.
+# Меняются только изменившиеся цены, после чего итоги открытых корзин с этими товарами считаются заново
+def recompute_effective_prices(products=None, now=None, batch_size=1000):
+    from .utils import recalculate_order_totals, get_open_orders_with_products
+
+    rules = PricingRules(list(DiscountRule.objects.filter(is_active=True)), now)
+    tree = get_category_tree()
+    products = Product.objects.all() if products is None else products
+
+    changed = []
+    rows = products.order_by().values_list('pk', 'category_id', 'price', 'effective_price')
+    for pk, category_id, price, effective_price in rows.iterator(chunk_size=batch_size):
+        new_price = rules.effective_price(pk, category_id, price, tree)
+        if new_price != effective_price:
+            changed.append(Product(pk=pk, effective_price=new_price))
+
+    if changed:
+        Product.objects.bulk_update(changed, ['effective_price'], batch_size=batch_size)
+        for start in range(0, len(changed), batch_size):
+            product_ids = [product.pk for product in changed[start:start + batch_size]]
+            recalculate_order_totals(get_open_orders_with_products(product_ids))
+        bump_catalog_version()
+    return len(changed)
+
+
+# Товары, на которые действует правило: товар, категория с подкатегориями или весь каталог
+def get_rule_products(rule):
+    if rule.product_id:
+        return Product.objects.filter(pk=rule.product_id)
+    if rule.category_id:
+        tree = get_category_tree()
+        descendants = tree.descendants_by_pk.get(rule.category_id, [])
+        category_ids = [rule.category_id] + [category.pk for category in descendants]
+        return Product.objects.filter(category_id__in=category_ids)
+    return Product.objects.all()
+
+
+# Варианты рассрочки для товара: (план, ежемесячный платёж), от самого короткого срока
+def get_installments(product):
+    category_ids = get_category_chain(product.category_id)
+    installments = []
+    for plan in get_installment_plans():
+        if plan.category_id and plan.category_id not in category_ids:
+            continue
+        if product.effective_price < plan.min_price:
+            continue
+        installments.append((plan, plan.monthly_payment(product.effective_price)))
+    return installments
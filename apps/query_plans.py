@@ -0,0 +1,50 @@
+import re
+
+from django.db import connection
+
+# Таблицы, которые читаются целиком намеренно: дерево категорий, правила скидок и планы рассрочки
+# маленькие, грузятся один раз и живут в кэше. Справочник городов целиком нужен списку в оформлении заказа
+FULL_SCAN_ALLOWED = ('apps_category', 'apps_discountrule', 'apps_installmentplan', 'apps_city')
+
+# Строки плана с полным проходом по таблице. Проход по индексу и по FTS таблице полным не считаем
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'^SCAN (?P<table>\w+)(?: AS \w+)?$'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+
+
+# Собирает SELECT запросы, которые выполняются внутри connection.execute_wrapper
+class QueryCollector:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+# План запроса строками: EXPLAIN QUERY PLAN на SQLite, EXPLAIN на Postgres
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # На маленьких таблицах Postgres всегда выбирает Seq Scan, поэтому запрещаем его,
+            # и он остаётся в плане только там, где подходящего индекса нет
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+# Строки плана с полным проходом по таблицам не из allowed
+def find_full_scans(plan, allowed=FULL_SCAN_ALLOWED):
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        return []
+    scans = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match and match.group('table') not in allowed:
+            scans.append(line.strip())
+    return scans
@@ -0,0 +1,69 @@
+import random
+from contextvars import ContextVar
+
+from django.db import connections
+
+PRIMARY_DB = 'default'
+REPLICA_PREFIX = 'replica'
+# С реплик читается только каталог. Всё остальное (корзина, заказы, избранное, оплата, сессии,
+# пользователи) читается с основной базы: покупатель должен сразу видеть свои изменения,
+# а реплика может отставать - только что вошедший пользователь оказался бы разлогинен
+REPLICA_MODELS = {
+    'apps.category', 'apps.product', 'apps.gallery', 'apps.productdescription', 'apps.brand',
+    'apps.productvariantgroup', 'apps.discountrule', 'apps.installmentplan', 'apps.productsearchdocument',
+}
+
+
+# Состояние маршрутизации текущего запроса: pinned - все чтения идут на основную базу,
+# written - в этом запросе уже была запись (выставляется роутером)
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.written = False
+
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+def get_routing_state():
+    state = routing_state.get()
+    if state is None:
+        # Вне запроса (команды, воркеры) состояние своё на поток и живёт до его конца
+        state = RoutingState()
+        routing_state.set(state)
+    return state
+
+
+def get_replicas():
+    return [alias for alias in connections.settings if alias.startswith(REPLICA_PREFIX)]
+
+
+# Роутер основная база + реплики (реплики в DATABASES с алиасами replica_N, root/database.py).
+# Каталог читается со случайной реплики. Любая запись идёт в основную базу и до конца запроса
+# переключает на неё и чтения, а ReplicaPinMiddleware держит покупателя на основной базе
+# ещё REPLICA_PIN_SECONDS после записи, чтобы он видел свои изменения
+class PrimaryReplicaRouter:
+    def __init__(self, replicas=None):
+        self.replicas = get_replicas() if replicas is None else replicas
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or model._meta.label_lower not in REPLICA_MODELS:
+            return PRIMARY_DB
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Связанные объекты читаем из той же базы, что и сам объект
+            return instance._state.db
+        if get_routing_state().pinned or get_routing_state().written:
+            return PRIMARY_DB
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        get_routing_state().written = True
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # Схема создаётся только в основной базе, на реплики она приходит репликацией
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY_DB
@@ -0,0 +1,183 @@
+import re
+
+from django.db import connection
+
+from .catalog import get_products_queryset
+from .models import Product, ProductSearchDocument, Brand
+
+SQLITE_FTS_TABLE = 'apps_productsearch_fts'
+POSTGRES_SEARCH_CONFIG = 'simple'
+
+
+# Слова запроса без служебных символов FTS
+def get_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+# Полнотекстовый индекс на SQLite FTS5 (таблица создаётся миграцией 0006). rowid виртуальной таблицы = id товара
+class SqliteSearchBackend:
+    def update(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s',
+                               [(pk,) for pk in documents])
+            cursor.executemany(f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, document) VALUES (%s, %s)',
+                               list(documents.items()))
+
+    def delete(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_FTS_TABLE}')
+
+    @staticmethod
+    def build_query(terms, prefix):
+        # Каждое слово в кавычках, чтобы пользовательский ввод не ломал синтаксис MATCH
+        quoted = ['"{}"'.format(term.replace('"', '""')) for term in terms]
+        if prefix:
+            quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, terms, limit, offset=0, prefix=False):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [self.build_query(terms, prefix), limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+# Полнотекстовый индекс на Postgres: генерируемая колонка tsvector и GIN индекс по ней (миграция 0006)
+class PostgresSearchBackend:
+    table = ProductSearchDocument._meta.db_table
+
+    # tsvector пересчитывается самим Postgres при изменении документа
+    def update(self, documents):
+        pass
+
+    def delete(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, terms, limit, offset=0, prefix=False):
+        query = ' & '.join(terms) + (':*' if prefix else '')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT product_id FROM {self.table}, to_tsquery(%s, %s) query '
+                f'WHERE search_vector @@ query ORDER BY ts_rank(search_vector, query) DESC, product_id '
+                f'LIMIT %s OFFSET %s',
+                [POSTGRES_SEARCH_CONFIG, query, limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+# Запасной вариант для остальных баз: поиск подстрокой по документу
+class SimpleSearchBackend:
+    def update(self, documents):
+        pass
+
+    def delete(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, terms, limit, offset=0, prefix=False):
+        documents = ProductSearchDocument.objects.all()
+        for term in terms:
+            documents = documents.filter(document__icontains=term)
+        return list(documents.order_by('pk').values_list('pk', flat=True)[offset:offset + limit])
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, SimpleSearchBackend)()
+
+
+# -------------------------------------------------------------------------------------
+
+# Собираем тексты документов для набора товаров за фиксированное кол-во запросов
+def build_documents(product_ids):
+    products = Product.objects.filter(pk__in=product_ids).select_related('category').prefetch_related('parameters')
+    products = list(products)
+
+    brands = {}
+    for category_id, title in Brand.objects.filter(
+            category_id__in={product.category_id for product in products}).values_list('category_id', 'title'):
+        brands.setdefault(category_id, []).append(title)
+
+    documents = {}
+    for product in products:
+        parts = [product.title, product.category.title, product.color_name]
+        parts += brands.get(product.category_id, [])
+        for parameter in product.parameters.all():
+            parts += [parameter.parameter, parameter.parameter_info]
+        documents[product.pk] = ' '.join(part for part in parts if part)
+    return documents
+
+
+# Обновляем документы и индекс для указанных товаров
+def index_products(product_ids):
+    product_ids = set(product_ids)
+    if not product_ids:
+        return 0
+
+    documents = build_documents(product_ids)
+    ProductSearchDocument.objects.bulk_create(
+        [ProductSearchDocument(product_id=pk, document=document) for pk, document in documents.items()],
+        update_conflicts=True, unique_fields=['product'], update_fields=['document', 'updated_at']
+    )
+    backend = get_backend()
+    backend.update(documents)
+    # Товары, которых уже нет, убираем из индекса
+    backend.delete(product_ids - set(documents))
+    return len(documents)
+
+
+def unindex_products(product_ids):
+    get_backend().delete(product_ids)
+
+
+# Полная переиндексация каталога пачками
+def rebuild_index(batch_size=1000):
+    get_backend().clear()
+    ProductSearchDocument.objects.all().delete()
+
+    total = 0
+    batch = []
+    for pk in Product.objects.values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            total += index_products(batch)
+            batch = []
+    total += index_products(batch)
+    return total
+
+
+# Поиск товаров. Возвращает товары в порядке релевантности и признак следующей страницы
+def search_products(query, limit=20, offset=0, prefix=False):
+    terms = get_terms(query)
+    if not terms:
+        return [], False
+
+    ids = get_backend().search(terms, limit + 1, offset, prefix)
+    has_next = len(ids) > limit
+    ids = ids[:limit]
+
+    products = get_products_queryset().in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products], has_next
+
+
+# Подсказки при вводе: названия товаров по началу последнего слова
+def autocomplete(query, limit=8):
+    products, has_next = search_products(query, limit, prefix=True)
+    return [product.title for product in products]
@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog import invalidate_category_tree, invalidate_category_product_ids, bump_catalog_version, sync_primary_images
+from .models import Category, Product, Gallery, ProductDescription, Brand, DiscountRule, InstallmentPlan
+from .pricing import invalidate_pricing, recompute_effective_prices, get_rule_products
+from .search import index_products, unindex_products
+from root.database import apply_sqlite_pragmas
+
+
+# При изменении категорий сбрасываем закэшированное дерево
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    invalidate_category_tree()
+
+
+# Товар могли перенести в другую категорию: запоминаем, в какой он был до сохранения
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, raw=False, **kwargs):
+    previous = None
+    if instance.pk and not raw:
+        previous = Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+    instance._previous_category_id = previous
+
+
+# При изменении товара сбрасываем кэш id товаров его категории и той, из которой его перенесли
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    invalidate_category_product_ids(instance.category_id)
+    previous = getattr(instance, '_previous_category_id', None)
+    if previous is not None and previous != instance.category_id:
+        invalidate_category_product_ids(previous)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    invalidate_category_product_ids(instance.category_id)
+
+
+# Главная картинка товара - первая по position, пересчитываем при изменении галереи
+@receiver(post_save, sender=Gallery)
+@receiver(post_delete, sender=Gallery)
+def gallery_changed(sender, instance, **kwargs):
+    sync_primary_images(Product.objects.filter(pk=instance.product_id))
+
+
+# Любое изменение каталога меняет его версию, кэш страниц и фрагментов становится устаревшим
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Gallery)
+@receiver(post_delete, sender=Gallery)
+@receiver(post_save, sender=ProductDescription)
+@receiver(post_delete, sender=ProductDescription)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Поддерживаем поисковый индекс в актуальном состоянии
+@receiver(post_save, sender=Product)
+def product_search_changed(sender, instance, **kwargs):
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_search_deleted(sender, instance, **kwargs):
+    unindex_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductDescription)
+def description_search_changed(sender, instance, **kwargs):
+    index_products([instance.product_id])
+
+
+# Характеристики и бренды удаляются и каскадом вместе с товаром или категорией. Переиндексация сразу
+# вернула бы документ удаляемого товара, поэтому делаем её после коммита, когда товара уже нет
+@receiver(post_delete, sender=ProductDescription)
+def description_search_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: index_products([instance.product_id]))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def category_search_changed(sender, instance, **kwargs):
+    category_id = instance.pk if sender is Category else instance.category_id
+    if category_id:
+        index_products(Product.objects.filter(category_id=category_id).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Brand)
+def brand_search_deleted(sender, instance, **kwargs):
+    if instance.category_id:
+        transaction.on_commit(lambda: category_search_changed(Brand, instance))
+
+
+
+# Правило могли перенести на другой товар или категорию: запоминаем, на что оно действовало до сохранения
+@receiver(pre_save, sender=DiscountRule)
+def discount_rule_saving(sender, instance, **kwargs):
+    instance._previous_rule = DiscountRule.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+# Правила скидок поменялись - после коммита пересчитываем effective_price товаров, на которые они действуют
+# сейчас и на которые действовали до изменения
+@receiver(post_save, sender=DiscountRule)
+@receiver(post_delete, sender=DiscountRule)
+def discount_rule_changed(sender, instance, **kwargs):
+    invalidate_pricing()
+    products = get_rule_products(instance)
+    previous = getattr(instance, '_previous_rule', None)
+    if previous is not None:
+        products = products | get_rule_products(previous)
+    transaction.on_commit(lambda: recompute_effective_prices(products))
+
+
+# Платежи рассрочки показываются в карточках, поэтому меняем версию каталога
+@receiver(post_save, sender=InstallmentPlan)
+@receiver(post_delete, sender=InstallmentPlan)
+def installment_plan_changed(sender, **kwargs):
+    invalidate_pricing()
+    bump_catalog_version()
+
+
+# WAL, busy_timeout и прочие PRAGMA для каждого нового соединения SQLite
+connection_created.connect(apply_sqlite_pragmas, dispatch_uid='apply_sqlite_pragmas')
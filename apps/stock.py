@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Case, When, Value
+from django.utils import timezone
+
+from .models import Product, Order, OrderProduct
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f'Недостаточно товара на складе: {product_ids}')
+
+
+# Резервируем товар одним условным UPDATE: списываем только если хватает остатка
+def reserve_stock(product_id, quantity=1):
+    updated = Product.objects.filter(pk=product_id, quantity__gte=quantity).update(
+        quantity=F('quantity') - quantity
+    )
+    return bool(updated)
+
+
+# Возвращаем товар на склад
+def release_stock(product_id, quantity=1):
+    Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity)
+
+
+# Резервируем сразу несколько строк {id товара: кол-во}. Либо всё, либо ничего
+def reserve_stock_many(lines):
+    failed = []
+    with transaction.atomic():
+        # Идём по id по порядку, чтобы параллельные резервы брали блокировки одинаково
+        for product_id in sorted(lines):
+            if lines[product_id] > 0 and not reserve_stock(product_id, lines[product_id]):
+                failed.append(product_id)
+        if failed:
+            transaction.set_rollback(True)
+    if failed:
+        raise OutOfStock(failed)
+
+
+# Возвращаем на склад несколько строк одним UPDATE
+def release_stock_many(lines):
+    lines = {product_id: quantity for product_id, quantity in lines.items() if product_id and quantity}
+    if not lines:
+        return
+    Product.objects.filter(pk__in=lines).update(quantity=F('quantity') + Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in lines.items()],
+        default=Value(0)
+    ))
+
+
+# Снимаем резервы строк корзин, которые не менялись дольше CART_RESERVATION_TTL
+def release_expired_reservations(now=None):
+    ttl = settings.CART_RESERVATION_TTL
+    if not ttl:
+        return 0
+
+    deadline = (now or timezone.now()) - timedelta(seconds=ttl)
+    with transaction.atomic():
+        expired = OrderProduct.objects.select_for_update(of=('self',)).filter(order__is_completed=False, reserved_at__lt=deadline)
+        lines = list(expired.values_list('pk', 'order_id', 'product_id', 'quantity'))
+        if not lines:
+            return 0
+
+        stock = {}
+        for pk, order_id, product_id, quantity in lines:
+            stock[product_id] = stock.get(product_id, 0) + quantity
+        release_stock_many(stock)
+
+        OrderProduct.objects.filter(pk__in=[line[0] for line in lines]).delete()
+        # Итоги затронутых заказов считаем заново по оставшимся строкам в базе
+        from .utils import recalculate_order_totals
+        recalculate_order_totals(Order.objects.filter(pk__in={line[1] for line in lines}))
+    return len(lines)
@@ -0,0 +1,165 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from .catalog import invalidate_category_tree, invalidate_category_product_ids, bump_catalog_version, \
+    sync_primary_images
+from .models import (Category, Product, ProductVariantGroup, Gallery, ProductDescription, FavoriteProducts,
+                     Customer, Order, OrderProduct)
+from .search import index_products
+from .utils import recalculate_order_totals
+
+SYNTHETIC_PREFIX = 'syn'
+SYNTHETIC_PASSWORD = 'synthetic-password'
+COLORS = [('Чёрный', '#000000'), ('Белый', '#ffffff'), ('Серый', '#808080'), ('Синий', '#1e3a8a'),
+          ('Красный', '#b91c1c'), ('Зелёный', '#15803d')]
+PARAMETERS = ['Материал', 'Гарантия', 'Страна производства', 'Вес', 'Мощность', 'Объём', 'Размер экрана', 'Цвет']
+
+
+# Синтетический каталог для нагрузочных замеров. При одном и том же seed и размерах
+# получается один и тот же каталог, всё создаётся через bulk_create пачками по batch_size.
+# Все слаги и логины начинаются с prefix, по нему каталог и удаляется
+class SyntheticCatalog:
+    def __init__(self, roots=4, depth=2, children=3, products=1000, images=3, descriptions=5, colors=3,
+                 users=20, favorites=5, cart_lines=3, seed=0, prefix=SYNTHETIC_PREFIX, batch_size=1000):
+        self.roots = roots
+        self.depth = depth
+        self.children = children
+        self.products = products
+        self.images = images
+        self.descriptions = descriptions
+        self.colors = max(1, min(colors, len(COLORS)))
+        self.users = users
+        self.favorites = favorites
+        self.cart_lines = cart_lines
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+
+    def generate(self):
+        leaves = self.create_categories()
+        product_ids = self.create_products(leaves)
+        self.create_galleries(product_ids)
+        self.create_descriptions(product_ids)
+        users = self.create_users()
+        self.create_favorites(users, product_ids)
+        self.create_carts(users, product_ids)
+
+        invalidate_category_tree()
+        for category in leaves:
+            invalidate_category_product_ids(category.pk)
+        for start in range(0, len(product_ids), self.batch_size):
+            index_products(product_ids[start:start + self.batch_size])
+        bump_catalog_version()
+        return {
+            'categories': Category.objects.filter(slug__startswith=f'{self.prefix}-').count(),
+            'products': len(product_ids),
+            'images': Gallery.objects.filter(product_id__in=product_ids).count() if product_ids else 0,
+            'users': len(users),
+        }
+
+    # Дерево: roots корневых категорий, у каждой по children подкатегорий на depth уровней.
+    # Товары лежат в листьях. Возвращает листья
+    def create_categories(self):
+        level = Category.objects.bulk_create([
+            Category(title=f'Категория {number}', slug=f'{self.prefix}-{number}') for number in range(self.roots)
+        ])
+        for _ in range(self.depth):
+            level = Category.objects.bulk_create([
+                Category(title=f'{parent.title}.{number}', slug=f'{parent.slug}-{number}', parent=parent)
+                for parent in level for number in range(self.children)
+            ], batch_size=self.batch_size)
+        return level
+
+    # Товары по очереди раскладываются по листьям, каждые colors подряд - одна модель в разных цветах.
+    # bulk_create не вызывает save(), поэтому effective_price заполняем сами (скидочных правил тут нет)
+    def create_products(self, leaves):
+        product_ids = []
+        # Пачка кратна colors, чтобы модель не разрывалась между пачками
+        step = max(self.batch_size - self.batch_size % self.colors, self.colors)
+        for start in range(0, self.products, step):
+            numbers = range(start, min(start + step, self.products))
+            groups = {}
+            if self.colors > 1:
+                groups = {number: ProductVariantGroup(title=f'Модель {number}', slug=f'{self.prefix}-model-{number}')
+                          for number in numbers if number % self.colors == 0}
+                ProductVariantGroup.objects.bulk_create(groups.values())
+
+            products = []
+            for number in numbers:
+                color_name, color_code = COLORS[number % self.colors]
+                price = Decimal(self.random.randrange(100, 20_000)) * 1000
+                products.append(Product(
+                    title=f'Товар {number} {color_name}', price=price, effective_price=price,
+                    quantity=self.random.randrange(0, 50), category=leaves[number % len(leaves)],
+                    slug=f'{self.prefix}-product-{number}', color_name=color_name, color_code=color_code,
+                    variant_group=groups.get(number - number % self.colors),
+                ))
+            product_ids += [product.pk for product in Product.objects.bulk_create(products)]
+        return product_ids
+
+    # Картинки только записями в Gallery, файлов нет: для замеров важны запросы, а не отдача медиа
+    def create_galleries(self, product_ids):
+        images = (Gallery(product_id=product_id, image=f'products/{self.prefix}-{product_id}-{position}.png',
+                          position=position)
+                  for product_id in product_ids for position in range(self.images))
+        self.bulk_create(Gallery, images)
+        sync_primary_images(Product.objects.filter(pk__in=product_ids))
+
+    def create_descriptions(self, product_ids):
+        descriptions = (ProductDescription(product_id=product_id, parameter=parameter,
+                                           parameter_info=f'{parameter} {self.random.randrange(1, 1000)}')
+                        for product_id in product_ids
+                        for parameter in self.random.sample(PARAMETERS, min(self.descriptions, len(PARAMETERS))))
+        self.bulk_create(ProductDescription, descriptions)
+
+    # Пароль у всех один, хэшируем его один раз
+    def create_users(self):
+        password = make_password(SYNTHETIC_PASSWORD)
+        users = User.objects.bulk_create([
+            User(username=f'{self.prefix}-user-{number}', password=password) for number in range(self.users)
+        ], batch_size=self.batch_size)
+        return users
+
+    def create_favorites(self, users, product_ids):
+        favorites = (FavoriteProducts(user=user, product_id=product_id)
+                     for user in users
+                     for product_id in self.random.sample(product_ids, min(self.favorites, len(product_ids))))
+        self.bulk_create(FavoriteProducts, favorites)
+
+    # Открытая корзина у каждого пользователя, итоги заказов считаются одним UPDATE
+    def create_carts(self, users, product_ids):
+        customers = Customer.objects.bulk_create([Customer(user=user) for user in users],
+                                                 batch_size=self.batch_size)
+        orders = Order.objects.bulk_create([Order(customer=customer) for customer in customers],
+                                           batch_size=self.batch_size)
+        lines = (OrderProduct(order=order, product_id=product_id, quantity=self.random.randrange(1, 4))
+                 for order in orders
+                 for product_id in self.random.sample(product_ids, min(self.cart_lines, len(product_ids))))
+        self.bulk_create(OrderProduct, lines)
+        recalculate_order_totals(Order.objects.filter(customer__user__username__startswith=f'{self.prefix}-user-'))
+
+    def bulk_create(self, model, objects):
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+
+# Удаляем ранее созданный синтетический каталог вместе с пользователями и их корзинами
+def delete_synthetic_catalog(prefix=SYNTHETIC_PREFIX):
+    users = User.objects.filter(username__startswith=f'{prefix}-user-')
+    OrderProduct.objects.filter(order__customer__user__in=users).delete()
+    Order.objects.filter(customer__user__in=users).delete()
+    Customer.objects.filter(user__in=users).delete()
+    users.delete()
+    ProductVariantGroup.objects.filter(slug__startswith=f'{prefix}-model-').delete()
+    Category.objects.filter(slug__startswith=f'{prefix}-', parent=None).delete()
+    invalidate_category_tree()
+    bump_catalog_version()
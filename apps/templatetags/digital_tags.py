@@ -1,41 +1,67 @@
 from django import template
-from digital.models import Product, Category, FavoriteProducts
+from apps.catalog import get_category_tree, get_products_queryset, get_variant_swatches
+from apps.images import get_image_url, get_image_srcset, get_supported_formats
+from apps.money import format_money
+from django.conf import settings
 
 
 register = template.Library()
 
 
-# Функция которая будит возвращать последний товар категории
-
-@register.simple_tag()
-def get_products(category):
-    products = Product.objects.filter(category=category)[::-1]
-    return products
-
 # Функция которая будит возвращать категории на html
 @register.simple_tag()
 def get_categories():
-    return Category.objects.filter(parent=None)
+    return get_category_tree().roots
 
 # Функция для полученяи цветов товара модели
 
 @register.simple_tag()
-def get_colors(model_product):
-    products = Product.objects.filter(model_product=model_product)
-    list_colors = [i.color_code for i in products]
+def get_colors(product):
+    list_colors = [color_code for color_code, color_name, slug in get_variant_swatches(product)]
     return list_colors
 
 
+# Цветовые варианты товара для переключателя цветов: (код цвета, название, слаг)
+@register.simple_tag()
+def get_variants(product):
+    return get_variant_swatches(product)
+
+
 
 # Функция для получения нормальной цены
 @register.simple_tag()
 def get_normal_price(price):
-    return f'{int(price):_}'.replace('_', ' ')
+    return format_money(price)
 
 @register.simple_tag()
 def get_favorite_products(user):
-    fav_products = FavoriteProducts.objects.filter(user=user)
-    products = [i.product for i in fav_products]
+    products = get_products_queryset().filter(favoriteproducts__user=user)
     return products
 
 
+
+
+
+# URL уменьшенной картинки: {% image_url category.image 200 'webp' %}
+@register.simple_tag()
+def image_url(field_file, width=None, fmt=None):
+    return get_image_url(field_file, width, fmt)
+
+
+@register.simple_tag()
+def image_srcset(field_file, fmt=None):
+    return get_image_srcset(field_file, fmt)
+
+
+# <picture> с avif/webp вариантами и srcset для карточки товара
+@register.inclusion_tag('digital/components/_picture.html')
+def product_picture(product, css_class=''):
+    image = product.get_primary_image()
+    field_file = image.image if image else None
+    return {
+        'src': get_image_url(field_file, settings.IMAGE_CARD_WIDTH),
+        'srcset': get_image_srcset(field_file),
+        'sources': [(f'image/{fmt}', get_image_srcset(field_file, fmt)) for fmt in get_supported_formats()],
+        'sizes': settings.IMAGE_CARD_SIZES,
+        'css_class': css_class,
+    }
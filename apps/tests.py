@@ -1,3 +1,1332 @@
-from django.test import TestCase
+import json
+from unittest.mock import patch
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+import tempfile
+from pathlib import Path
+from io import BytesIO, StringIO
+
+from django.core.cache import cache
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.db import connection, connections, IntegrityError, OperationalError
+from django.db.models import Sum
+from django.conf import settings
+from asgiref.sync import async_to_sync
+from django.http import QueryDict, HttpResponse
+from django.test import Client, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import context_processors
+from .catalog import CATALOG_VERSION_CACHE_KEY, get_category_ids, get_products_queryset, get_category_tree, get_related_products, bump_catalog_version, get_variant_swatches
+from .facets import FacetFilters, get_facets
+from .checks import check_shared_cache, check_shared_cache_deploy
+from .images import get_image_srcset, get_manifest_path
+from .favorites import FAVORITE_IDS_CACHE_TIMEOUT, toggle_favorite, get_favorite_ids
+from .models import (Category, Product, Gallery, Order, OrderProduct, FavoriteProducts, Brand, ProductDescription,
+                     ProductSearchDocument, ProductVariantGroup, DiscountRule, InstallmentPlan, Payment, PaymentEvent,
+                     City, ShippingAddress)
+from .search import search_products, autocomplete
+from .query_plans import explain, find_full_scans
+from .fake_stripe import start_fake_stripe
+from .payments import get_gateway, process_payment_events
+from .pagination import KeysetPaginator
+from .middleware import CartMiddleware, ReplicaPinMiddleware
+from .routers import PrimaryReplicaRouter, RoutingState, routing_state
+from .instrumentation import QueryBudgetMixin, get_sql_fingerprint
+from .synthetic import SyntheticCatalog, delete_synthetic_catalog
+from root.cache import get_caches
+from root.database import get_databases, get_sqlite_pragmas
+from .benchmark import BenchmarkRunner, get_benchmark_urls, percentile, compare_reports
+from .utils import CartForAuthenticatedUser, clear_order, get_cart_data, get_order_totals, recalculate_order_totals, SESSION_CART_KEY
+from .money import to_minor_units, format_money, split_installments, apply_discount
+from .pricing import recompute_effective_prices
+from .stock import (reserve_stock, reserve_stock_many, release_stock_many, release_expired_reservations,
+                    OutOfStock)
+
 
 # Create your tests here.
+
+# Вспомогательная функция для создания товара с картинкой
+def create_product(category, number):
+    product = Product.objects.create(title=f'Товар {number}', price=1000 + number, quantity=5,
+                                     category=category, slug=f'product-{category.pk}-{number}',
+                                     color_name='Чёрный', color_code='#000000')
+    Gallery.objects.create(product=product, image=f'products/test-{number}.png')
+    return product
+
+
+class HomepageQueriesTest(TestCase):
+    def setUp(self):
+        self.categories = [Category.objects.create(title=f'Категория {i}', slug=f'category-{i}')
+                           for i in range(3)]
+
+    def count_index_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_products(self):
+        for category in self.categories:
+            create_product(category, 0)
+        self.count_index_queries()  # прогреваем кэш дерева категорий
+        bump_catalog_version()  # сбрасываем кэш страницы, чтобы она отрендерилась заново
+        small = self.count_index_queries()
+
+        for category in self.categories:
+            for number in range(1, 15):
+                create_product(category, number)
+        large = self.count_index_queries()
+
+        self.assertEqual(small, large)
+
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(title='Мебель', slug='furniture')
+        self.child = Category.objects.create(title='Кухня', slug='kitchen', parent=self.root)
+        self.leaf = Category.objects.create(title='Стулья', slug='chairs', parent=self.child)
+
+    def test_tree_relations(self):
+        tree = get_category_tree()
+        self.assertEqual(tree.roots, [self.root])
+        self.assertEqual(tree.descendants('furniture'), [self.child, self.leaf])
+        self.assertEqual(tree.ancestors('chairs'), [self.root, self.child])
+        self.assertEqual(tree.breadcrumbs('kitchen'), [self.root, self.child])
+        self.assertEqual(tree.breadcrumbs('missing'), [])
+
+    def test_warm_cache_costs_no_queries(self):
+        get_category_tree()
+        with self.assertNumQueries(0):
+            get_category_tree().breadcrumbs('chairs')
+
+    def test_tree_is_replaced_on_save_and_delete(self):
+        get_category_tree()
+        Category.objects.create(title='Столы', slug='tables', parent=self.child)
+        self.assertEqual([c.slug for c in get_category_tree().subcategories('kitchen')], ['chairs', 'tables'])
+
+        self.leaf.delete()
+        self.assertIsNone(get_category_tree().get('chairs'))
+
+
+class CategoryPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(title='Техника', slug='tech')
+        self.child = Category.objects.create(title='Телефоны', slug='phones', parent=self.root)
+        self.products = [create_product(self.child, number) for number in range(30)]
+
+    def test_subcategory_products_are_listed(self):
+        response = self.client.get(reverse('category_page', kwargs={'slug': 'tech'}))
+        self.assertEqual(len(response.context['products']), 12)
+
+    @override_settings(CATALOG_PAGE_SIZE=5)
+    def test_page_size_follows_settings(self):
+        response = self.client.get(reverse('category_page', kwargs={'slug': 'tech'}))
+        self.assertEqual(len(response.context['products']), 5)
+
+    def test_keyset_pages_cover_catalog_without_count(self):
+        url = reverse('category_page', kwargs={'slug': 'tech'})
+        seen = []
+        cursor = ''
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, {'cursor': cursor, 'page_size': 24} if cursor else {'page_size': 24})
+            self.assertFalse(any('COUNT(*)' in query['sql'] for query in ctx.captured_queries))
+            seen.extend(product.pk for product in response.context['products'])
+            cursor = response.context['page_obj'].next_cursor
+            if not cursor:
+                break
+
+        self.assertEqual(sorted(seen), sorted(product.pk for product in self.products))
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+class RelatedProductsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Ноутбуки', slug='laptops')
+        self.products = [create_product(self.category, number) for number in range(10)]
+
+    def test_sample_is_distinct_and_excludes_product(self):
+        product = self.products[0]
+        for _ in range(20):
+            related = get_related_products(product)
+            self.assertEqual(len(related), 3)
+            self.assertEqual(len({p.pk for p in related}), 3)
+            self.assertNotIn(product, related)
+
+    def test_single_product_category(self):
+        category = Category.objects.create(title='Пусто', slug='single')
+        product = create_product(category, 100)
+        self.assertEqual(get_related_products(product), [])
+
+    def test_moved_product_leaves_old_category(self):
+        product = self.products[0]
+        get_related_products(self.products[1])
+        other = Category.objects.create(title='Планшеты', slug='tablets')
+        product.category = other
+        product.save()
+        for _ in range(10):
+            self.assertNotIn(product, get_related_products(self.products[1]))
+
+    def test_warm_cache_needs_only_product_queries(self):
+        get_related_products(self.products[0])
+        # товары вместе с главными картинками одним запросом
+        with self.assertNumQueries(1):
+            get_related_products(self.products[1])
+
+    def test_product_detail_page(self):
+        response = self.client.get(reverse('product_detail', kwargs={'slug': self.products[0].slug}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 3)
+
+    def test_recommendations_command(self):
+        call_command('build_recommendations', stdout=StringIO())
+        # Другой процесс: своего кэша нет, товар читается из базы
+        cache.clear()
+        product = get_products_queryset().get(pk=self.products[0].pk)
+        self.assertEqual(len(product.recommended_ids), 3)
+        with self.assertNumQueries(1):
+            related = get_related_products(product)
+        self.assertEqual([p.pk for p in related], product.recommended_ids)
+
+
+class CartTotalsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='secret-pass-123')
+        self.client.force_login(self.user)
+        category = Category.objects.create(title='Телевизоры', slug='tv')
+        self.first = create_product(category, 1)
+        self.second = create_product(category, 2)
+
+    def to_cart(self, product, action='add'):
+        self.client.get(reverse('to_cart', kwargs={'pk': product.pk, 'action': action}))
+
+    def get_order(self):
+        return Order.objects.get(customer__user=self.user)
+
+    def test_totals_follow_cart_changes(self):
+        self.to_cart(self.first)
+        self.to_cart(self.first)
+        self.to_cart(self.second)
+        self.to_cart(self.first, 'delete')
+
+        order = self.get_order()
+        self.assertEqual(order.total_quantity, 2)
+        self.assertEqual(order.total_price, self.first.price + self.second.price)
+
+        self.client.get(reverse('clear_cart'))
+        order = self.get_order()
+        self.assertEqual((order.total_quantity, order.total_price), (0, 0))
+
+    def test_removing_missing_line_keeps_totals(self):
+        self.to_cart(self.first, 'delete')
+        self.assertEqual(self.get_order().total_quantity, 0)
+        self.assertFalse(OrderProduct.objects.exists())
+
+    def test_recompute_command(self):
+        self.to_cart(self.first)
+        self.to_cart(self.second)
+        Order.objects.update(total_price=0, total_quantity=0)
+
+        with self.assertRaises(CommandError):
+            call_command('recompute_cart_totals', '--check', stdout=StringIO())
+        call_command('recompute_cart_totals', stdout=StringIO())
+        call_command('recompute_cart_totals', '--check', stdout=StringIO())
+        self.assertEqual(self.get_order().total_quantity, 2)
+
+    def test_recompute_keeps_concurrent_cart_change(self):
+        self.to_cart(self.first)
+        Order.objects.update(total_quantity=0)
+        changed = []
+
+        # Покупатель добавляет товар сразу после того, как команда прочитала суммы по строкам
+        def add_after_sum(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not changed and 'SUM' in sql and 'apps_orderproduct' in sql:
+                changed.append(sql)
+                self.to_cart(self.second)
+            return result
+
+        with connection.execute_wrapper(add_after_sum):
+            call_command('recompute_cart_totals', stdout=StringIO())
+        self.assertTrue(changed)
+        self.assertEqual(self.get_order().total_quantity, 2)
+        self.assertEqual(self.get_order().total_price, self.first.price + self.second.price)
+
+    def test_totals_are_exact(self):
+        Product.objects.filter(pk=self.first.pk).update(price=Decimal('0.10'), effective_price=Decimal('0.10'))
+        for _ in range(3):
+            self.to_cart(self.first)
+        order = self.get_order()
+        self.assertEqual(order.total_price, Decimal('0.30'))
+        self.assertEqual(get_order_totals(order), {'total_price': Decimal('0.30'), 'total_quantity': 3})
+
+        Order.objects.update(total_price=0)
+        recalculate_order_totals(Order.objects.all())
+        self.assertEqual(self.get_order().total_price, Decimal('0.30'))
+
+
+class MoneyTest(TestCase):
+    def test_minor_units_and_format(self):
+        self.assertEqual(to_minor_units(Decimal('1234.56')), 123456)
+        self.assertEqual(to_minor_units(0.1 + 0.2), 30)
+        self.assertEqual(format_money(Decimal('1234567')), '1 234 567')
+        self.assertEqual(format_money(Decimal('1234567.5')), '1 234 567,50')
+
+    def test_discount_and_installments(self):
+        self.assertEqual(apply_discount(Decimal('1000'), percent=15), Decimal('850.00'))
+        self.assertEqual(apply_discount(Decimal('1000'), fixed=1500), Decimal('0.00'))
+        self.assertEqual(split_installments(Decimal('850.00'), 3), [Decimal('283.34'), Decimal('283.33'),
+                                                                    Decimal('283.33')])
+
+
+class PricingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(title='Мебель', slug='furniture')
+        self.sofas = Category.objects.create(title='Диваны', slug='sofas', parent=self.root)
+        self.cheap = Product.objects.create(title='Диван', price=Decimal('1000'), quantity=5, category=self.sofas,
+                                            slug='cheap')
+        self.expensive = Product.objects.create(title='Диван+', price=Decimal('3000'), category=self.sofas,
+                                                slug='expensive')
+
+    def prices(self):
+        return dict(Product.objects.values_list('slug', 'effective_price'))
+
+    def test_rules_recompute_effective_price(self):
+        self.assertEqual(self.prices(), {'cheap': Decimal('1000'), 'expensive': Decimal('3000')})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DiscountRule.objects.create(title='-10% на мебель', kind=DiscountRule.PERCENT, value=10,
+                                        category=self.root)
+        self.assertEqual(self.prices(), {'cheap': Decimal('900'), 'expensive': Decimal('2700')})
+
+        # Выбирается самая выгодная скидка, а не сумма скидок
+        with self.captureOnCommitCallbacks(execute=True):
+            DiscountRule.objects.create(title='-500', kind=DiscountRule.FIXED, value=500, product=self.expensive)
+        self.assertEqual(self.prices(), {'cheap': Decimal('900'), 'expensive': Decimal('2500')})
+
+        # Правило вне дат действия не применяется
+        with self.captureOnCommitCallbacks(execute=True):
+            DiscountRule.objects.filter(category=self.root).get().delete()
+            DiscountRule.objects.create(title='Будущая', value=50, starts_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.prices(), {'cheap': Decimal('1000'), 'expensive': Decimal('2500')})
+
+        self.assertEqual(recompute_effective_prices(now=timezone.now() + timedelta(days=2)), 2)
+        self.assertEqual(self.prices(), {'cheap': Decimal('500'), 'expensive': Decimal('1500')})
+
+    def test_cart_totals_follow_effective_price(self):
+        user = User.objects.create_user(username='buyer', password='secret-pass-123')
+        self.client.force_login(user)
+        self.client.get(reverse('to_cart', kwargs={'pk': self.cheap.pk, 'action': 'add'}))
+        with self.captureOnCommitCallbacks(execute=True):
+            DiscountRule.objects.create(title='-20%', value=20, product=self.cheap)
+        order = Order.objects.get(customer__user=user)
+        self.assertEqual(order.total_price, Decimal('800'))
+
+        # Цена изменена прямо в товаре
+        product = Product.objects.get(pk=self.cheap.pk)
+        product.price = Decimal('2000')
+        product.save()
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('1600'))
+
+    def test_retargeted_rule_restores_old_prices(self):
+        chairs = Category.objects.create(title='Стулья', slug='chairs', parent=self.root)
+        chair = Product.objects.create(title='Стул', price=Decimal('100'), category=chairs, slug='chair')
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = DiscountRule.objects.create(title='-10% на диваны', value=10, category=self.sofas)
+        self.assertEqual(self.prices()['cheap'], Decimal('900'))
+
+        rule.category = chairs
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.save()
+        self.assertEqual(self.prices(), {'cheap': Decimal('1000'), 'expensive': Decimal('3000'),
+                                         'chair': Decimal('90')})
+
+    def test_product_save_reads_rules_from_db(self):
+        self.cheap.save()
+        # Правило создано в другом процессе: сигналы здесь не сработали
+        DiscountRule.objects.bulk_create([DiscountRule(title='-10%', value=10, category=self.root)])
+        self.cheap.save()
+        self.assertEqual(self.prices()['cheap'], Decimal('900'))
+
+    def test_installment_plan_needs_at_least_one_month(self):
+        plan = InstallmentPlan(title='Без срока', months=0)
+        with self.assertRaises(ValidationError):
+            plan.full_clean()
+        with self.assertRaises(IntegrityError):
+            plan.save()
+
+    @override_settings(CATALOG_PAGE_SIZES=(1,))
+    def test_installments_and_price_sorting(self):
+        InstallmentPlan.objects.create(title='3 месяца', months=3, markup_percent=3)
+        self.assertEqual(self.cheap.get_credit_payment(), Decimal('343.34'))
+
+        url = reverse('category_page', kwargs={'slug': 'furniture'})
+        response = self.client.get(url, {'sort': '-price', 'page_size': 1})
+        self.assertEqual([p.slug for p in response.context['products']], ['expensive'])
+        response = self.client.get(url, {'sort': '-price', 'page_size': 1,
+                                         'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual([p.slug for p in response.context['products']], ['cheap'])
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Склад', slug='stock')
+        self.first = create_product(category, 1)
+        self.second = create_product(category, 2)
+
+    def test_reserve_only_while_in_stock(self):
+        results = [reserve_stock(self.first.pk) for _ in range(7)]
+        self.assertEqual(results.count(True), 5)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.quantity, 0)
+
+    def test_reserve_many_is_all_or_nothing(self):
+        with self.assertRaises(OutOfStock) as error:
+            reserve_stock_many({self.first.pk: 2, self.second.pk: 6})
+        self.assertEqual(error.exception.product_ids, [self.second.pk])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.quantity, 5)
+
+        reserve_stock_many({self.first.pk: 2, self.second.pk: 5})
+        with self.assertNumQueries(1):
+            release_stock_many({self.first.pk: 2, self.second.pk: 1})
+        self.assertEqual(Product.objects.get(pk=self.second.pk).quantity, 1)
+
+    @override_settings(CART_RESERVATION_TTL=60)
+    def test_expired_reservations_are_released(self):
+        user = User.objects.create_user(username='slow', password='secret-pass-123')
+        self.client.force_login(user)
+        self.client.get(reverse('to_cart', kwargs={'pk': self.first.pk, 'action': 'add'}))
+        OrderProduct.objects.update(reserved_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(Product.objects.get(pk=self.first.pk).quantity, 5)
+        self.assertEqual(Order.objects.get().total_quantity, 0)
+
+
+class StockStressTest(TransactionTestCase):
+    threads = 8
+    attempts = 25
+
+    def test_no_overselling_under_concurrency(self):
+        category = Category.objects.create(title='Хит', slug='hot')
+        product = create_product(category, 1)
+        Product.objects.filter(pk=product.pk).update(quantity=50)
+        reserved = []
+
+        def worker():
+            try:
+                for _ in range(self.attempts):
+                    while True:
+                        try:
+                            if reserve_stock(product.pk):
+                                reserved.append(1)
+                            break
+                        except OperationalError:  # таблица занята другим потоком, пробуем ещё раз
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(reserved), 50)
+        self.assertEqual(product.quantity, 0)
+
+
+class ClearCartTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cleaner', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(title='Всё', slug='all')
+
+    def fill_cart(self, size):
+        start = Product.objects.count()
+        products = [create_product(self.category, start + i) for i in range(size)]
+        for product in products:
+            self.client.get(reverse('to_cart', kwargs={'pk': product.pk, 'action': 'add'}))
+            self.client.get(reverse('to_cart', kwargs={'pk': product.pk, 'action': 'add'}))
+        return products
+
+    def clear_queries(self):
+        order = Order.objects.get(customer__user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            clear_order(order, restore_stock=True)
+        return len(ctx.captured_queries)
+
+    def test_clear_restores_stock_in_constant_queries(self):
+        products = self.fill_cart(2)
+        small = self.clear_queries()
+
+        products += self.fill_cart(20)
+        large = self.clear_queries()
+
+        self.assertEqual(small, large)
+        self.assertFalse(OrderProduct.objects.exists())
+        self.assertEqual({p.quantity for p in Product.objects.filter(pk__in=[p.pk for p in products])}, {5})
+        self.assertEqual(Order.objects.get(customer__user=self.user).total_quantity, 0)
+
+    def test_clear_cart_view(self):
+        self.fill_cart(3)
+        self.client.get(reverse('clear_cart'))
+        self.assertFalse(OrderProduct.objects.exists())
+        self.assertEqual(set(Product.objects.values_list('quantity', flat=True)), {5})
+
+
+class SessionCartTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='guest', password='secret-pass-123')
+        category = Category.objects.create(title='Гость', slug='guest')
+        self.first = create_product(category, 1)
+        self.second = create_product(category, 2)
+
+    def to_cart(self, product, action='add'):
+        return self.client.get(reverse('to_cart', kwargs={'pk': product.pk, 'action': action}))
+
+    # Пишется только сама сессия, покупатели, заказы и резервы товаров не создаются
+    def test_anonymous_cart_does_not_write_to_db(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.to_cart(self.first)
+            self.to_cart(self.first)
+            self.to_cart(self.second)
+            self.to_cart(self.second, 'delete')
+        writes = [query['sql'] for query in ctx.captured_queries if not query['sql'].startswith('SELECT')]
+        self.assertTrue(writes)
+        self.assertTrue(all('django_session' in sql or sql.startswith(('SAVEPOINT', 'RELEASE')) for sql in writes))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.client.session[SESSION_CART_KEY], {str(self.first.pk): 2})
+
+    def test_logout_invalidates_session_on_server(self):
+        self.client.post(reverse('login'), {'username': 'guest', 'password': 'secret-pass-123'})
+        stolen = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.logout()
+
+        # Старая кука после выхода больше не даёт доступа
+        other = Client()
+        other.cookies[settings.SESSION_COOKIE_NAME] = stolen
+        response = other.get(reverse('index'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_cart_is_merged_on_login(self):
+        self.to_cart(self.first)
+        self.to_cart(self.first)
+        self.to_cart(self.second)
+
+        self.client.post(reverse('login'), {'username': 'guest', 'password': 'secret-pass-123'})
+
+        order = Order.objects.get(customer__user=self.user)
+        self.assertEqual(dict(order.orderproduct_set.values_list('product_id', 'quantity')),
+                         {self.first.pk: 2, self.second.pk: 1})
+        self.assertEqual(order.total_quantity, 3)
+        self.assertEqual(order.total_price, self.first.price * 2 + self.second.price)
+        self.assertEqual(Product.objects.get(pk=self.first.pk).quantity, 3)
+        self.assertNotIn(SESSION_CART_KEY, self.client.session)
+
+
+class RequestCartTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='memo', password='secret-pass-123')
+        category = Category.objects.create(title='Память', slug='memo')
+        product = create_product(category, 1)
+        self.client.force_login(self.user)
+        self.client.get(reverse('to_cart', kwargs={'pk': product.pk, 'action': 'add'}))
+
+    def make_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        CartMiddleware(lambda request: None)(request)
+        return request
+
+    def test_cart_is_resolved_once_per_request(self):
+        request = self.make_request()
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                get_cart_data(request)
+                request.cart.get_customer()
+
+    def test_badge_is_lazy(self):
+        request = self.make_request()
+        with self.assertNumQueries(0):
+            context = context_processors.cart(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(str(context['cart_total_quantity']), '1')
+
+
+class CatalogPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Кэш', slug='cached')
+        self.product = create_product(self.category, 1)
+        self.url = reverse('category_page', kwargs={'slug': 'cached'})
+
+    def test_anonymous_page_is_cached_until_catalog_changes(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+
+        Product.objects.filter(pk=self.product.pk).update(title='Новое название')
+        self.product.refresh_from_db()
+        self.product.save()
+        self.assertContains(self.client.get(self.url), 'Новое название')
+
+    def test_conditional_get_returns_304(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        Gallery.objects.create(product=self.product, image='products/new.png')
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_authenticated_users_are_not_page_cached(self):
+        user = User.objects.create_user(username='member', password='secret-pass-123')
+        self.client.force_login(user)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class FavoritesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='fan', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(title='Любимое', slug='loved')
+        self.products = [create_product(self.category, number) for number in range(5)]
+
+    def test_toggle_adds_and_removes(self):
+        product = self.products[0]
+        self.assertTrue(toggle_favorite(self.user, product))
+        self.assertEqual(get_favorite_ids(self.user), {product.pk})
+        self.assertFalse(toggle_favorite(self.user, product))
+        self.assertEqual(get_favorite_ids(self.user), set())
+
+    def test_favorite_ids_are_cached(self):
+        get_favorite_ids(self.user)
+        with self.assertNumQueries(0):
+            get_favorite_ids(self.user)
+
+    def test_toggle_is_seen_by_other_workers(self):
+        product = self.products[0]
+        self.client.get(reverse('save_favorite', kwargs={'slug': product.slug}))
+        # Другой воркер со своим пустым кэшем читает избранное из базы
+        cache.clear()
+        self.assertEqual(get_favorite_ids(self.user), {product.pk})
+
+        # Сброс кэша другого воркера сюда не дошёл: старое значение живёт недолго
+        with patch('apps.favorites.cache.delete'):
+            self.client.get(reverse('save_favorite', kwargs={'slug': product.slug}))
+        self.assertEqual(get_favorite_ids(self.user), {product.pk})
+        later = time.time() + FAVORITE_IDS_CACHE_TIMEOUT + 1
+        with patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(get_favorite_ids(self.user), set())
+
+    def test_favorite_page_and_hearts(self):
+        for product in self.products[:3]:
+            self.client.get(reverse('save_favorite', kwargs={'slug': product.slug}))
+
+        self.assertEqual(set(FavoriteProducts.objects.values_list('product_id', flat=True)),
+                         {product.pk for product in self.products[:3]})
+        response = self.client.get(reverse('category_page', kwargs={'slug': 'loved'}))
+        self.assertContains(response, 'products__item-heart _active', count=3)
+
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageDerivativesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 600), 'red').save(buffer, 'PNG')
+        category = Category.objects.create(title='Фото', slug='photo')
+        self.product = Product.objects.create(title='Фото', price=10, category=category, slug='photo',
+                                              color_name='-', color_code='-')
+        self.gallery = Gallery.objects.create(product=self.product,
+                                              image=SimpleUploadedFile('photo.png', buffer.getvalue()))
+
+    def test_thumbnails_are_generated_lazily(self):
+        url = self.gallery.get_image_url(400, 'webp')
+        self.assertRegex(url, r'/media/derivatives/[0-9a-f]{16}_400\.webp$')
+        with default_storage.open(url.replace('/media/', '', 1)) as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (400, 200))
+        self.assertIn('800w', get_image_srcset(self.gallery.image))
+
+    def upload(self, size, color):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'PNG')
+        cache.clear()
+        return Gallery.objects.create(product=self.product, image=SimpleUploadedFile('new.png', buffer.getvalue()))
+
+    def test_small_image_is_not_upscaled(self):
+        srcset = get_image_srcset(self.upload((600, 300), 'blue').image)
+        self.assertEqual([item.split()[1] for item in srcset.split(', ')], ['200w', '400w', '600w'])
+
+    def test_encoding_errors_skip_format(self):
+        with patch('apps.images.encode', side_effect=OSError('encoder not available')):
+            gallery = self.upload((300, 300), 'green')
+            self.assertEqual(gallery.get_image_url(200), gallery.image.url)
+
+    def test_svg_falls_back_to_original(self):
+        self.gallery.image = SimpleUploadedFile('icon.svg', b'<svg xmlns="http://www.w3.org/2000/svg"/>')
+        self.gallery.save()
+        self.assertEqual(self.gallery.get_image_url(200), self.gallery.image.url)
+
+    def test_batch_command(self):
+        call_command('generate_image_derivatives', '--workers', '2', stdout=StringIO())
+        # Веб-процесс со своим пустым кэшем находит готовые варианты по манифесту, не открывая картинку
+        cache.clear()
+        with self.assertNumQueries(0), patch('apps.images.Image.open') as image_open:
+            self.assertIn('_200.', self.gallery.get_image_url(200))
+        image_open.assert_not_called()
+
+    def test_existing_files_are_not_encoded_again(self):
+        self.gallery.get_image_url(200)
+        default_storage.delete(get_manifest_path(self.gallery.image.name))
+        cache.clear()
+        with patch('apps.images.encode') as encode:
+            self.assertIn('_200.', self.gallery.get_image_url(200))
+        encode.assert_not_called()
+
+
+
+class PrimaryImageTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Галерея', slug='gallery')
+        self.product = Product.objects.create(title='Фото', price=10, category=category, slug='gallery-product',
+                                              color_name='-', color_code='-')
+
+    def primary(self):
+        return Product.objects.get(pk=self.product.pk).primary_image_id
+
+    def test_primary_image_follows_gallery(self):
+        second = Gallery.objects.create(product=self.product, image='products/b.png', position=2)
+        self.assertEqual(self.primary(), second.pk)
+
+        first = Gallery.objects.create(product=self.product, image='products/a.png', position=1)
+        self.assertEqual(self.primary(), first.pk)
+
+        first.delete()
+        self.assertEqual(self.primary(), second.pk)
+        second.delete()
+        self.assertIsNone(self.primary())
+
+    def test_card_image_comes_with_product_query(self):
+        Gallery.objects.create(product=self.product, image='products/a.png')
+        with self.assertNumQueries(1):
+            product = get_products_queryset().get(pk=self.product.pk)
+            self.assertEqual(product.get_image_product(), '/media/products/a.png')
+
+    def test_backfill_command(self):
+        image = Gallery.objects.create(product=self.product, image='products/a.png')
+        Product.objects.update(primary_image=None)
+        call_command('sync_primary_images', stdout=StringIO())
+        self.assertEqual(self.primary(), image.pk)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Телевизоры', slug='tvs')
+        Brand.objects.create(title='Samsung', category=self.category)
+        self.tv = Product.objects.create(title='Телевизор QLED 55', price=100, category=self.category,
+                                         slug='qled', color_name='Чёрный', color_code='#000')
+        self.other = Product.objects.create(title='Телевизор OLED 65', price=200, category=self.category,
+                                            slug='oled', color_name='Серый', color_code='#777')
+        ProductDescription.objects.create(product=self.tv, parameter='Диагональ', parameter_info='55 дюймов')
+
+    def titles(self, query, **kwargs):
+        return [product.title for product in search_products(query, **kwargs)[0]]
+
+    def test_search_over_title_parameters_and_brand(self):
+        self.assertEqual(self.titles('qled'), ['Телевизор QLED 55'])
+        self.assertEqual(self.titles('дюймов'), ['Телевизор QLED 55'])
+        self.assertEqual(len(self.titles('samsung телевизор')), 2)
+        self.assertEqual(self.titles('"unbalanced AND ('), [])
+
+    def test_index_follows_changes(self):
+        self.other.title = 'Проектор'
+        self.other.save()
+        self.assertEqual(self.titles('проектор'), ['Проектор'])
+        self.other.delete()
+        self.assertEqual(self.titles('проектор'), [])
+
+    def test_autocomplete_and_view(self):
+        self.assertEqual(sorted(autocomplete('тел')), ['Телевизор OLED 65', 'Телевизор QLED 55'])
+
+        response = self.client.get(reverse('search'), {'q': 'oled'})
+        self.assertEqual([p.pk for p in response.context['products']], [self.other.pk])
+        response = self.client.get(reverse('search_autocomplete'), {'q': 'qle'})
+        self.assertEqual(response.json(), {'results': ['Телевизор QLED 55']})
+
+    def test_rebuild_command(self):
+        ProductSearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(ProductSearchDocument.objects.count(), 2)
+        self.assertEqual(self.titles('qled'), ['Телевизор QLED 55'])
+
+
+class FacetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(title='Мебель', slug='furniture')
+        self.sofas = Category.objects.create(title='Диваны', slug='sofas', parent=self.root)
+        self.tables = Category.objects.create(title='Столы', slug='tables', parent=self.root)
+        self.brand = Brand.objects.create(title='Ikea', category=self.sofas)
+        self.url = reverse('category_page', kwargs={'slug': 'furniture'})
+        self.add(self.sofas, 'red', 300_000, '200 см')
+        self.add(self.sofas, 'blue', 700_000, '180 см')
+        self.add(self.tables, 'red', 2_000_000, '120,5')
+
+    def add(self, category, color, price, length):
+        return Product.objects.create(title=f'{category.title} {color}', price=price, category=category,
+                                      slug=f'{category.slug}-{color}', color_name=color, color_code=color,
+                                      length=length)
+
+    def facets(self, **params):
+        response = self.client.get(self.url, params)
+        return response.context['facets'], [p.title for p in response.context['products']]
+
+    def test_dimensions_are_parsed(self):
+        self.assertEqual(sorted(Product.objects.values_list('length_value', flat=True)), [120.5, 180, 200])
+
+    def test_counts_and_filters(self):
+        facets, products = self.facets()
+        self.assertEqual({c['value']: c['count'] for c in facets['colors']}, {'red': 2, 'blue': 1})
+        self.assertEqual({b['title']: b['count'] for b in facets['brands']}, {'Ikea': 2})
+        self.assertEqual({p['value']: p['count'] for p in facets['prices']}, {0: 1, 1: 1, 2: 1})
+
+        facets, products = self.facets(color='red')
+        self.assertEqual(sorted(products), ['Диваны red', 'Столы red'])
+        # счётчики цвета не зависят от выбранного цвета, остальные фасеты - зависят
+        self.assertEqual({c['value']: c['count'] for c in facets['colors']}, {'red': 2, 'blue': 1})
+        self.assertEqual({b['title']: b['count'] for b in facets['brands']}, {'Ikea': 1})
+
+        facets, products = self.facets(brand=self.brand.pk, price=1)
+        self.assertEqual(products, ['Диваны blue'])
+
+        facets, products = self.facets(length_min='150', length_max='190')
+        self.assertEqual(products, ['Диваны blue'])
+
+    def test_facet_index_is_one_query_and_cached(self):
+        filters = FacetFilters(QueryDict())
+        category_ids = get_category_ids(self.root)
+        with self.assertNumQueries(2):  # GROUP BY по товарам и бренды
+            get_facets(category_ids, filters)
+        with self.assertNumQueries(0):
+            get_facets(category_ids, filters)
+
+        # Названия брендов хранятся в закэшированном индексе, переименование его сбрасывает
+        self.brand.title = 'Hoff'
+        self.brand.save()
+        self.assertEqual([brand['title'] for brand in get_facets(category_ids, filters)['brands']], ['Hoff'])
+
+
+class ProductVariantsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Диваны', slug='sofas')
+        self.group = ProductVariantGroup.objects.create(title='Диван Лофт', slug='loft')
+        for color in ('red', 'blue', 'green'):
+            Product.objects.create(title=f'Диван Лофт {color}', price=1000, category=self.category,
+                                   slug=f'loft-{color}', color_name=color, color_code=color,
+                                   variant_group=self.group)
+
+    def test_swatches_are_cached_per_group(self):
+        product = get_products_queryset().get(slug='loft-red')
+        with self.assertNumQueries(1):
+            swatches = get_variant_swatches(product)
+        self.assertEqual([color for color, name, slug in swatches], ['blue', 'green', 'red'])
+        with self.assertNumQueries(0):
+            get_variant_swatches(product)
+
+    def test_swatches_refresh_after_product_change(self):
+        product = Product.objects.get(slug='loft-red')
+        get_variant_swatches(product)
+        Product.objects.filter(slug='loft-green').get().delete()
+        self.assertEqual([slug for color, name, slug in get_variant_swatches(product)], ['loft-blue', 'loft-red'])
+
+    def test_product_by_color(self):
+        response = self.client.get(reverse('product_color', kwargs={'model_product': 'loft', 'color_code': 'blue'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product'].slug, 'loft-blue')
+        self.assertEqual(len(response.context['variants']), 3)
+
+        response = self.client.get(reverse('product_color', kwargs={'model_product': 'loft', 'color_code': 'pink'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlansTest(TestCase):
+    def test_full_scan_is_detected(self):
+        sql, params = Product.objects.filter(title='Диван').query.sql_with_params()
+        self.assertTrue(find_full_scans(explain(sql, params)))
+
+        sql, params = Product.objects.filter(category_id=1).order_by('-created_at', '-pk').query.sql_with_params()
+        self.assertEqual(find_full_scans(explain(sql, params)), [])
+
+    def test_explain_queries_command(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('Полных сканирований таблиц нет', out.getvalue())
+        self.assertFalse(Product.objects.exists())
+
+    def test_order_lines_are_unique(self):
+        category = Category.objects.create(title='Диваны', slug='sofas')
+        product = create_product(category, 1)
+        order = Order.objects.create()
+        OrderProduct.objects.create(order=order, product=product, quantity=1)
+        with self.assertRaises(IntegrityError):
+            OrderProduct.objects.create(order=order, product=product, quantity=1)
+
+
+class InstrumentationTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        parent = Category.objects.create(title='Техника', slug='tech')
+        self.category = Category.objects.create(title='Телефоны', slug='phones', parent=parent)
+        group = ProductVariantGroup.objects.create(title='Телефон', slug='phone')
+        self.products = [create_product(self.category, number) for number in range(15)]
+        # Карточки на главной (товары корневой категории) с рассрочкой
+        create_product(parent, 100)
+        InstallmentPlan.objects.create(title='3 месяца', months=3)
+        for number, product in enumerate(self.products):
+            product.variant_group = group
+            product.color_code = f'#{number:06d}'
+            product.save()
+        self.client.force_login(User.objects.create_user('buyer', password='password'))
+        self.client.get(reverse('to_cart', kwargs={'pk': self.products[0].pk, 'action': 'add'}))
+
+    def test_views_fit_query_budgets(self):
+        product = self.products[0]
+        paths = [
+            reverse('index'),
+            reverse('category_page', kwargs={'slug': 'tech'}),
+            reverse('product_detail', kwargs={'slug': product.slug}),
+            reverse('product_color', kwargs={'model_product': 'phone', 'color_code': product.color_code}),
+            reverse('search') + '?q=Товар',
+            reverse('search_autocomplete') + '?q=Тов',
+        ]
+        # Каждая страница - первое посещение нового пользователя, без заранее созданной корзины
+        for number, path in enumerate(paths):
+            cache.clear()
+            self.client.force_login(User.objects.create_user(f'visitor-{number}', password='password'))
+            with self.subTest(path=path):
+                self.assertEqual(self.assertWithinQueryBudget(path).status_code, 200)
+                self.assertFalse(Order.objects.filter(customer__user__username=f'visitor-{number}').exists())
+
+    @override_settings(QUERY_BUDGETS={'index': 1})
+    def test_budget_exceeded_fails(self):
+        with self.assertRaisesRegex(AssertionError, 'при лимите 1'):
+            self.assertWithinQueryBudget(reverse('index'))
+
+    def test_server_timing_and_log(self):
+        with tempfile.NamedTemporaryFile(suffix='.jsonl') as log:
+            with override_settings(INSTRUMENTATION_LOG=log.name, INSTRUMENTATION_SERVER_TIMING=True,
+                                   QUERY_BUDGETS={'category_page': 1}):
+                response = self.client.get(reverse('category_page', kwargs={'slug': 'phones'}))
+            record = json.loads(log.read().decode().splitlines()[-1])
+
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertEqual(record['url_name'], 'category_page')
+        self.assertEqual(record['queries'], response.wsgi_request.metrics.queries)
+        self.assertTrue(record['over_budget'])
+        self.assertGreater(record['template_ms'], 0)
+
+    # Под ASGI запросы выполняются не в потоке event loop, но всё равно попадают в метрики запроса
+    async def test_async_view_queries_are_counted(self):
+        response = await self.async_client.get(reverse('async_category_page', kwargs={'slug': 'phones'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.asgi_request.metrics.queries, 0)
+        self.assertGreater(response.asgi_request.metrics.db_time, 0)
+
+    def test_sql_fingerprint(self):
+        self.assertEqual(get_sql_fingerprint('SELECT * FROM t WHERE id IN (%s, %s) LIMIT 21'),
+                         get_sql_fingerprint('SELECT  * FROM t WHERE id IN (%s) LIMIT 1'))
+
+
+class SyntheticCatalogTest(TestCase):
+    def generate(self, **kwargs):
+        return SyntheticCatalog(roots=2, depth=2, children=2, products=30, users=2, batch_size=7, **kwargs).generate()
+
+    def test_catalog_is_reproducible(self):
+        self.assertEqual(self.generate(), {'categories': 14, 'products': 30, 'images': 90, 'users': 2})
+        prices = list(Product.objects.order_by('slug').values_list('slug', 'price'))
+        self.assertEqual(Product.objects.filter(primary_image__isnull=True).count(), 0)
+        self.assertEqual(Product.objects.filter(variant_group__slug='syn-model-3').count(), 3)
+        self.assertTrue(search_products('Товар')[0])
+
+        delete_synthetic_catalog()
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.generate()
+        self.assertEqual(list(Product.objects.order_by('slug').values_list('slug', 'price')), prices)
+
+    def test_benchmark_runner(self):
+        self.generate()
+        order = Order.objects.get(customer__user__username='syn-user-0')
+        self.assertEqual(order.total_quantity, order.orderproduct_set.aggregate(total=Sum('quantity'))['total'])
+
+        urls = [url for url in get_benchmark_urls() if url[0] in ('index', 'category_root', 'product_detail')]
+        urls.append(('missing', '/product_detail/missing/', False))
+        report = BenchmarkRunner(urls, requests=3, cold=True).run()
+        self.assertEqual(report['urls']['missing'], {'path': '/product_detail/missing/', 'status': [404],
+                                                     'error': True})
+        del report['urls']['missing']
+        self.assertEqual(set(report['urls']), {'index', 'category_root', 'product_detail'})
+        for result in report['urls'].values():
+            self.assertEqual(result['status'], [200])
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+
+        # Корзина и оформление заказа отдаются без ошибок
+        urls = [url for url in get_benchmark_urls() if url[0] in ('favorite', 'my_cart', 'checkout')]
+        pages = BenchmarkRunner(urls, requests=1, username='syn-user-0').run()['urls']
+        self.assertEqual({name: result['status'] for name, result in pages.items()},
+                         {'favorite': [200], 'my_cart': [200], 'checkout': [200]})
+
+        baseline = {'urls': {'index': dict(report['urls']['index'], queries=report['urls']['index']['queries'] * 2)}}
+        self.assertEqual(compare_reports(report, baseline)['index']['queries'], -50.0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+
+
+class CacheConfigTest(TestCase):
+    def test_caches_from_env(self):
+        cache_settings = get_caches({})['default']
+        self.assertEqual(cache_settings['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertEqual(cache_settings['OPTIONS']['MAX_ENTRIES'], 50_000)
+
+        cache_settings = get_caches({'CACHE_BACKEND': 'redis', 'CACHE_LOCATION': 'redis://cache:6379/1'})['default']
+        self.assertEqual(cache_settings['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(cache_settings['LOCATION'], 'redis://cache:6379/1')
+        with self.assertRaises(ValueError):
+            get_caches({'CACHE_BACKEND': 'file'})
+
+    def test_local_cache_with_several_workers(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with patch.dict('os.environ', {'WEB_CONCURRENCY': '4'}):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['apps.E001'])
+            with override_settings(CACHES=get_caches({'CACHE_BACKEND': 'memcached'})):
+                self.assertEqual(check_shared_cache(None), [])
+        self.assertEqual([warning.id for warning in check_shared_cache_deploy(None)], ['apps.W001'])
+
+
+class DatabaseConfigTest(TestCase):
+    def test_sqlite_from_env(self):
+        database = get_databases(Path('/srv'), {'SQLITE_BUSY_TIMEOUT': '2000'})['default']
+        self.assertEqual(database['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(database['NAME'], Path('/srv/db.sqlite3'))
+        self.assertEqual(database['OPTIONS']['timeout'], 2)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertEqual(get_sqlite_pragmas({'SQLITE_BUSY_TIMEOUT': '2000'})['busy_timeout'], 2000)
+
+        databases = get_databases(Path('/srv'), {'DATABASE_REPLICAS': '/srv/replica.sqlite3'})
+        self.assertEqual(databases['replica_0']['NAME'], '/srv/replica.sqlite3')
+        self.assertEqual(databases['replica_0']['TEST'], {'MIRROR': 'default'})
+
+    def test_postgres_from_env(self):
+        database = get_databases(Path('/srv'), {'DATABASE_ENGINE': 'postgresql', 'DATABASE_NAME': 'shop',
+                                                'DATABASE_CONN_MAX_AGE': '300'})['default']
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['NAME'], 'shop')
+        self.assertEqual(database['CONN_MAX_AGE'], 300)
+        with self.assertRaises(ValueError):
+            get_databases(Path('/srv'), {'DATABASE_ENGINE': 'oracle'})
+
+    def test_sqlite_pragmas_applied(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = get_databases(Path(directory), {})['default']
+            wrapper = type(connections['default'])({**connection.settings_dict, **database, 'TEST': {}}, 'pragmas')
+            try:
+                with override_settings(SQLITE_PRAGMAS=get_sqlite_pragmas({})):
+                    wrapper.ensure_connection()
+                with wrapper.cursor() as cursor:
+                    values = []
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                        cursor.execute(f'PRAGMA {name}')
+                        values.append(cursor.fetchone()[0])
+            finally:
+                wrapper.close()
+        self.assertEqual(values, ['wal', 1, 5000])
+
+
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter(replicas=['replica_0'])
+        self.token = routing_state.set(RoutingState())
+        # Каталог давно не менялся, реплики успели его получить
+        cache.set(CATALOG_VERSION_CACHE_KEY, (time.time_ns() // 1000) - 3600 * 1_000_000, None)
+
+    def tearDown(self):
+        routing_state.reset(self.token)
+
+    def test_catalog_reads_go_to_replica_until_write(self):
+        self.assertEqual(self.router.db_for_read(Product), 'replica_0')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertEqual(self.router.db_for_read(FavoriteProducts), 'default')
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'apps'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'apps'))
+
+    def test_no_replicas(self):
+        self.assertEqual(PrimaryReplicaRouter(replicas=[]).db_for_read(Product), 'default')
+
+    def test_request_is_pinned_after_write(self):
+        decisions = []
+
+        def view(request):
+            decisions.append(self.router.db_for_read(Category))
+            if request.method == 'POST' or 'write' in request.GET:
+                self.router.db_for_write(Order)
+            return HttpResponse()
+
+        middleware = ReplicaPinMiddleware(view)
+        factory = RequestFactory()
+        self.assertNotIn('primary_pin', middleware(factory.get('/')).cookies)
+        response = middleware(factory.get('/?write=1'))
+        self.assertEqual(response.cookies['primary_pin']['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertIn('primary_pin', middleware(factory.post('/')).cookies)
+
+        request = factory.get('/')
+        request.COOKIES['primary_pin'] = '1'
+        middleware(request)
+        self.assertEqual(decisions, ['replica_0', 'replica_0', 'default', 'default'])
+
+        # Сразу после изменения каталога кэши собираются с основной базы
+        bump_catalog_version()
+        middleware(factory.get('/'))
+        self.assertEqual(decisions[-1], 'default')
+
+    def test_cart_reads_price_from_primary(self):
+        category = Category.objects.create(title='Телефоны', slug='phones')
+        product = create_product(category, 1)
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user(username='buyer', password='secret-pass-123')
+        request._messages = CookieStorage(request)
+        CartForAuthenticatedUser(request).get_order()
+        # Новый запрос: корзина уже есть, записей до изменения корзины нет.
+        # Реплики replica_0 в тестах нет, чтение товара с неё упало бы с ConnectionDoesNotExist
+        token = routing_state.set(RoutingState())
+        try:
+            with override_settings(DATABASE_ROUTERS=[self.router]):
+                CartForAuthenticatedUser(request, product.pk, 'add')
+        finally:
+            routing_state.reset(token)
+        self.assertEqual(Order.objects.get(customer__user=request.user).total_price, product.effective_price)
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(title='Техника', slug='tech')
+        self.child = Category.objects.create(title='Телефоны', slug='phones', parent=self.root)
+        self.products = [create_product(self.child, number) for number in range(15)]
+        self.user = User.objects.create_user(username='async-fan', password='secret-pass-123')
+
+    def get_pks(self, response):
+        return [product.pk for product in response.context['products']]
+
+    async def test_category_matches_sync_view(self):
+        for query in ({}, {'sort': 'price', 'page_size': 24}):
+            sync_response = await self.async_client.get(reverse('category_page', kwargs={'slug': 'tech'}), query)
+            async_response = await self.async_client.get(reverse('async_category_page', kwargs={'slug': 'tech'}),
+                                                         query)
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(self.get_pks(async_response), self.get_pks(sync_response))
+            self.assertEqual(async_response.context['page_obj'].next_cursor,
+                             sync_response.context['page_obj'].next_cursor)
+
+        response = await self.async_client.get(reverse('async_category_page', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_product_detail_and_favorites(self):
+        product = self.products[0]
+        response = await self.async_client.get(reverse('async_product_detail', kwargs={'slug': product.slug}))
+        self.assertEqual(response.context['product'], product)
+        self.assertEqual(len(response.context['products']), 3)
+
+        response = await self.async_client.get(reverse('async_favorite'))
+        self.assertEqual(response.status_code, 302)
+
+        await FavoriteProducts.objects.acreate(user=self.user, product=product)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('async_favorite'))
+        self.assertEqual(self.get_pks(response), [product.pk])
+        self.assertEqual(response.context['favorite_ids'], {product.pk})
+
+    async def test_guest_pages_are_cached(self):
+        url = reverse('async_index')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_async_page_matches_sync_page(self):
+        ordering = ('effective_price', 'pk')
+        paginator = KeysetPaginator(get_products_queryset().order_by(*ordering), 4, ordering)
+        page = paginator.get_page(None)
+        async_page = async_to_sync(paginator.aget_page)(page.next_cursor)
+        self.assertEqual(list(async_page.object_list), list(paginator.get_page(page.next_cursor).object_list))
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test', PAYMENT_GATEWAY='apps.payments.StripeGateway')
+class PaymentTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = start_fake_stripe(webhook_secret='whsec_test')
+        cls.settings_override = override_settings(STRIPE_API_BASE=cls.stripe.base_url)
+        cls.settings_override.enable()
+        get_gateway.cache_clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        get_gateway.cache_clear()
+        cls.stripe.shutdown()
+        cls.stripe.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='secret-pass-123')
+        self.client.force_login(self.user)
+        category = Category.objects.create(title='Телевизоры', slug='tv')
+        self.product = create_product(category, 1)
+        self.city = City.objects.create(city_name='Ташкент')
+        self.client.get(reverse('to_cart', kwargs={'pk': self.product.pk, 'action': 'add'}))
+        self.order = Order.objects.get(customer__user=self.user)
+
+    def checkout(self):
+        return self.client.post(reverse('payment'), {
+            'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'ivan@example.com',
+            'address': 'ул. Навои 1', 'city': self.city.pk, 'region': 'Ташкент', 'phone': '+998900000000',
+        })
+
+    def test_checkout_is_idempotent(self):
+        first = self.checkout()
+        second = self.checkout()
+        self.assertEqual(first.status_code, 303)
+        self.assertEqual(first['Location'], second['Location'])
+        payment = Payment.objects.get()
+        self.assertEqual(payment.amount, self.product.effective_price)
+        self.assertEqual(self.stripe.sessions[payment.session_id]['amount_total'],
+                         to_minor_units(self.product.effective_price))
+        # Пока оплата не подтверждена, заказ открыт и адреса доставки нет
+        self.assertFalse(Order.objects.get(pk=self.order.pk).is_completed)
+        self.assertFalse(ShippingAddress.objects.exists())
+
+        # Изменённая корзина - новый платёж
+        self.client.get(reverse('to_cart', kwargs={'pk': self.product.pk, 'action': 'add'}))
+        self.checkout()
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_webhook_completes_order_once(self):
+        self.checkout()
+        payment = Payment.objects.get()
+        payload, signature = self.stripe.build_event(payment.session_id)
+
+        response = self.client.post(reverse('stripe_webhook'), payload, content_type='application/json',
+                                    HTTP_STRIPE_SIGNATURE='t=1,v1=bad')
+        self.assertEqual(response.status_code, 400)
+
+        for _ in range(2):  # Stripe может доставить событие повторно
+            response = self.client.post(reverse('stripe_webhook'), payload, content_type='application/json',
+                                        HTTP_STRIPE_SIGNATURE=signature)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+        self.assertEqual(process_payment_events(), 1)
+        self.assertEqual(process_payment_events(), 0)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.PAID)
+        self.assertTrue(Order.objects.get(pk=self.order.pk).is_completed)
+        self.assertEqual(ShippingAddress.objects.get().city, self.city)
+
+        # Новая корзина пустая, оплаченные строки остались в завершённом заказе
+        self.assertEqual(get_cart_data(self.client.get(reverse('index')).wsgi_request)['cart_total_quantity'], 0)
+        self.assertEqual(OrderProduct.objects.filter(order=self.order).count(), 1)
+
+    def deliver(self, session_id, event_type='checkout.session.completed'):
+        payload, signature = self.stripe.build_event(session_id, event_type)
+        self.client.post(reverse('stripe_webhook'), payload, content_type='application/json',
+                         HTTP_STRIPE_SIGNATURE=signature)
+        process_payment_events()
+
+    def test_stale_payments_are_not_completed(self):
+        self.checkout()
+        old = Payment.objects.get()
+        self.client.get(reverse('to_cart', kwargs={'pk': self.product.pk, 'action': 'add'}))
+        self.checkout()
+        new = Payment.objects.latest('pk')
+        old.refresh_from_db()
+        self.assertEqual(old.status, Payment.FAILED)
+
+        # Старая сессия оплачена - заказ не завершается, платёж к возврату
+        self.deliver(old.session_id)
+        old.refresh_from_db()
+        self.assertEqual(old.status, Payment.REFUND)
+        self.assertFalse(Order.objects.get(pk=self.order.pk).is_completed)
+
+        self.deliver(new.session_id)
+        self.assertTrue(Order.objects.get(pk=self.order.pk).is_completed)
+
+        # Второй платёж за уже оплаченный заказ тоже к возврату, второго адреса нет
+        another = Payment.objects.create(order=self.order, idempotency_key=f'{new.idempotency_key}-1',
+                                         amount=new.amount, session_id='cs_test_another')
+        self.stripe.sessions['cs_test_another'] = dict(self.stripe.sessions[new.session_id], id='cs_test_another')
+        self.deliver('cs_test_another')
+        another.refresh_from_db()
+        self.assertEqual(another.status, Payment.REFUND)
+        self.assertEqual(ShippingAddress.objects.count(), 1)
+
+    def test_success_page_after_payment(self):
+        self.checkout()
+        payment = Payment.objects.get()
+        self.deliver(payment.session_id)
+
+        response = self.client.get(reverse('success'), {'session_id': payment.session_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['payment'], payment)
+        self.assertEqual(get_cart_data(response.wsgi_request)['cart_total_quantity'], 0)
+        self.assertFalse(OrderProduct.objects.exclude(order=self.order).exists())
+
+    def test_expired_payment_gets_new_session(self):
+        first = self.checkout()
+        payment = Payment.objects.get()
+        self.deliver(payment.session_id, 'checkout.session.expired')
+
+        second = self.checkout()
+        self.assertNotEqual(first['Location'], second['Location'])
+        self.assertEqual(Payment.objects.filter(status=Payment.PENDING).count(), 1)
+        self.assertEqual(self.checkout()['Location'], second['Location'])
@@ -12,10 +12,18 @@ urlpatterns = [
     path('product_color/<str:model_product>/<str:color_code>/', product_by_color, name='product_color'),
     path('save_favorite/<slug:slug>/', save_favorite_product, name='save_favorite'),
     path('favorite/', FavoriteProductView.as_view(), name='favorite'),
+    path('search/', search_view, name='search'),
+    path('search/autocomplete/', search_autocomplete_view, name='search_autocomplete'),
     path('to_cart/<int:pk>/<str:action>/', to_cart_view, name='to_cart'),
     path('my_cart/', my_cart_view, name='my_cart'),
     path('clear_cart/', clear_cart, name='clear_cart'),
     path('checkout/', checkout_view, name='checkout'),
     path('success/', success_payment, name='success'),
-    path('payment/', create_checkout_session, name='payment')
-]
\ No newline at end of file
+    path('payment/', create_checkout_session, name='payment'),
+    path('payment/webhook/', stripe_webhook, name='stripe_webhook'),
+    # Асинхронные версии страниц каталога и избранного (под ASGI)
+    path('async/', async_product_list, name='async_index'),
+    path('async/category/<slug:slug>/', async_category_view, name='async_category_page'),
+    path('async/product_detail/<slug:slug>/', async_product_detail, name='async_product_detail'),
+    path('async/favorite/', async_favorite_view, name='async_favorite'),
+]
@@ -1,69 +1,291 @@
 from .models import Product, OrderProduct, Order, Customer
 from django.contrib import messages
+from django.db import router, transaction
+from django.db.models import F, Sum, DecimalField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .stock import reserve_stock, release_stock, release_stock_many
+from .money import MONEY_TOTAL_MAX_DIGITS, MONEY_DECIMAL_PLACES
 
 class CartForAuthenticatedUser:
     def __init__(self, request, pk=None, action=None):
         self.user = request.user
         self.request = request
+        self.reset()
 
         if pk and action:
             self.add_or_delete(pk, action)
 
+    # Сбрасываем запомненные покупателя/заказ, например после изменения корзины
+    def reset(self):
+        self._order = None
+        self._order_loaded = False
+        self._cart_info = None
+
+    # Открытый заказ вместе с покупателем одним запросом, None если корзины ещё нет
+    def find_order(self):
+        if not self._order_loaded:
+            self._order = Order.objects.select_related('customer').filter(customer__user=self.user,
+                                                                          is_completed=False).first()
+            self._order_loaded = True
+        return self._order
+
+    # Открытый заказ, создаём только если его ещё нет
+    def get_order(self):
+        if self.find_order() is None:
+            customer, created = Customer.objects.get_or_create(user=self.user)
+            self._order, created = Order.objects.get_or_create(customer=customer, is_completed=False)
+        return self._order
+
+    def get_customer(self):
+        return self.get_order().customer
+
+    # Кол-во товаров для значка корзины в шапке. Просмотр страниц корзину не создаёт
+    def get_total_quantity(self):
+        order = self.find_order()
+        return order.total_quantity if order else 0
 
     # Метод для получения информации о корзине
     def get_cart_info(self):
-        customer, created = Customer.objects.get_or_create(user=self.user)
+        if self._cart_info is None:
+            order = self.get_order()
+            order_products = order.orderproduct_set.select_related('product')
+
+            cart_total_quantity = order.get_cart_total_quantity
+            cart_total_price = order.get_cart_total_price
+
+            self._cart_info = {
+                'cart_total_quantity': cart_total_quantity,
+                'cart_total_price': cart_total_price,
+                'order': order,
+                'products': order_products
+            }
+        return self._cart_info
+
+
+    # Метод который будит добавлять или удалять товар из корзины.
+    # Остаток и строка корзины меняются условными UPDATE, без чтения и сохранения целых строк
+    # Цена идёт в итоги заказа, поэтому товар читается с основной базы, а не с отстающей реплики
+    def add_or_delete(self, pk, action):
+        order = self.get_order()
+        product = Product.objects.using(router.db_for_write(Product)).only('title', 'effective_price').get(pk=pk)
+        self.reset()
+
+        with transaction.atomic():
+            if action == 'add':
+                if not reserve_stock(product.pk):
+                    messages.error(self.request, f'Товара {product.title} нет в наличии')
+                    return
+                updated = OrderProduct.objects.filter(order=order, product=product).update(
+                    quantity=F('quantity') + 1, reserved_at=timezone.now()  # +1 в корзину
+                )
+                if not updated:
+                    OrderProduct.objects.create(order=order, product=product, quantity=1)
+                update_order_totals(order, product.effective_price, 1)
+                messages.success(self.request, f'Товар {product.title} в корзине')
+            else:
+                removed = OrderProduct.objects.filter(order=order, product=product, quantity__gt=0).update(
+                    quantity=F('quantity') - 1, reserved_at=timezone.now()  # -1 в корзине
+                )
+                if not removed:
+                    return
+                release_stock(product.pk)  # +1 у кол-ва товара
+                update_order_totals(order, -product.effective_price, -1)
+                OrderProduct.objects.filter(order=order, product=product, quantity__lte=0).delete()
+                messages.warning(self.request, f'Товар {product.title} удалён из корзины')
+
+
+    # Метод для очищения корзины. restore_stock=True возвращает товары на склад
+    def clear(self, restore_stock=False):
+        order = self.get_order()
+        clear_order(order, restore_stock)
+        self.reset()
+
+
+# Очищаем заказ за постоянное число запросов, независимо от кол-ва строк
+def clear_order(order, restore_stock=False):
+    with transaction.atomic():
+        order_products = OrderProduct.objects.filter(order=order)
+        if restore_stock:
+            stock = order_products.filter(product__isnull=False).values('product').annotate(total=Sum('quantity'))
+            release_stock_many({row['product']: row['total'] for row in stock})
+        order_products.delete()
+        reset_order_totals(order)
+
+
+# Атомарно меняем сохранённые итоги заказа прямо в базе
+def update_order_totals(order, price, quantity):
+    Order.objects.filter(pk=order.pk).update(total_price=F('total_price') + price,
+                                             total_quantity=F('total_quantity') + quantity)
+
+
+def reset_order_totals(order):
+    Order.objects.filter(pk=order.pk).update(total_price=0, total_quantity=0)
+
+
+# Сумма строк заказа агрегатом в базе: Sum(кол-во * цена товара со скидкой) с точностью до копейки
+def lines_total_price():
+    return Coalesce(Sum(F('quantity') * F('product__effective_price')), Value(0),
+                    output_field=DecimalField(max_digits=MONEY_TOTAL_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES))
+
+
+# Итоги заказа прямо по строкам, без сохранённых полей - для оплаты
+def get_order_totals(order):
+    return OrderProduct.objects.filter(order=order, product__isnull=False).aggregate(
+        total_price=lines_total_price(), total_quantity=Coalesce(Sum('quantity'), 0)
+    )
+
+
+# Пересчитываем сохранённые итоги заказов одним UPDATE с подзапросами по строкам
+def recalculate_order_totals(orders):
+    lines = OrderProduct.objects.filter(order=OuterRef('pk'), product__isnull=False).order_by().values('order')
+    return orders.update(
+        total_price=Coalesce(Subquery(lines.annotate(total=lines_total_price()).values('total')), Value(0),
+                             output_field=DecimalField(max_digits=MONEY_TOTAL_MAX_DIGITS,
+                                                       decimal_places=MONEY_DECIMAL_PLACES)),
+        total_quantity=Coalesce(Subquery(lines.annotate(total=Sum('quantity')).values('total')), 0),
+    )
+
+
+# Открытые корзины, в которых есть хотя бы один из товаров - их итоги нужно пересчитать после смены цены
+def get_open_orders_with_products(product_ids):
+    return Order.objects.filter(
+        is_completed=False, pk__in=Order.objects.filter(orderproduct__product_id__in=product_ids).values('pk')
+    )
+
 
-        order, created = Order.objects.get_or_create(customer=customer)
-        order_products = order.orderproduct_set.all()
+# -------------------------------------------------------------------------------------
 
-        cart_total_quantity = order.get_cart_total_quantity
-        cart_total_price = order.get_cart_total_price
+SESSION_CART_KEY = 'cart'
+
+
+# Строка корзины гостя, повторяет то что шаблоны берут у OrderProduct
+class SessionCartLine:
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def get_total_price(self):
+        return self.product.effective_price * self.quantity
+
+
+# Итоги корзины гостя, повторяют свойства Order
+class SessionOrder:
+    def __init__(self, lines):
+        self.lines = lines
+
+    @property
+    def get_cart_total_price(self):
+        return sum(line.get_total_price for line in self.lines)
+
+    @property
+    def get_cart_total_quantity(self):
+        return sum(line.quantity for line in self.lines)
+
+
+# Корзина неавторизованного пользователя: хранится в сессии, в базу ничего не пишет
+class CartForAnonymousUser:
+    def __init__(self, request, pk=None, action=None):
+        self.request = request
+        self.session = request.session
+
+        if pk and action:
+            self.add_or_delete(pk, action)
+
+    def get_lines(self):
+        return self.session.get(SESSION_CART_KEY, {})
+
+    def save_lines(self, lines):
+        self.session[SESSION_CART_KEY] = lines
+
+    # Кол-во товаров для значка корзины в шапке, без запросов в базу
+    def get_total_quantity(self):
+        return sum(self.get_lines().values())
+
+    # Метод для получения информации о корзине
+    def get_cart_info(self):
+        lines = self.get_lines()
+        products = Product.objects.in_bulk([int(pk) for pk in lines]) if lines else {}
+        order_products = [SessionCartLine(products[int(pk)], quantity)
+                          for pk, quantity in lines.items() if int(pk) in products]
+        order = SessionOrder(order_products)
 
         return {
-            'cart_total_quantity': cart_total_quantity,
-            'cart_total_price': cart_total_price,
+            'cart_total_quantity': order.get_cart_total_quantity,
+            'cart_total_price': order.get_cart_total_price,
             'order': order,
             'products': order_products
         }
 
-
     # Метод который будит добавлять или удалять товар из корзины
     def add_or_delete(self, pk, action):
-        order = self.get_cart_info()['order']
-        product = Product.objects.get(pk=pk)
-        order_product, created = OrderProduct.objects.get_or_create(order=order, product=product)
+        lines = self.get_lines()
+        key = str(pk)
+        product = Product.objects.only('title', 'quantity').get(pk=pk)
 
-        if action == 'add' and product.quantity > 0:
-            order_product.quantity += 1  # +1 в корзину
-            product.quantity -= 1  # -1 у кол-ва товара
+        if action == 'add':
+            if product.quantity <= lines.get(key, 0):
+                messages.error(self.request, f'Товара {product.title} нет в наличии')
+                return
+            lines[key] = lines.get(key, 0) + 1
             messages.success(self.request, f'Товар {product.title} в корзине')
-        else:
-            order_product.quantity -= 1  # -1 в корзине
-            product.quantity += 1  # +1 у кол-ва товара
+        elif lines.get(key, 0) > 0:
+            lines[key] -= 1
+            if lines[key] <= 0:
+                del lines[key]
             messages.warning(self.request, f'Товар {product.title} удалён из корзины')
 
-        product.save()
-        order_product.save()
+        self.save_lines(lines)
+
+    # Метод для очищения корзины, резервов у гостя нет, поэтому restore_stock не нужен
+    def clear(self, restore_stock=False):
+        self.session.pop(SESSION_CART_KEY, None)
+
 
+# Переносим корзину гостя в корзину пользователя после входа.
+# Товары резервируются пачкой, строки создаются через bulk_create/bulk_update
+def merge_session_cart(request):
+    lines = {int(pk): quantity for pk, quantity in request.session.pop(SESSION_CART_KEY, {}).items()}
+    if not lines:
+        return
 
-        if order_product.quantity <= 0:
-            order_product.delete()
+    order = CartForAuthenticatedUser(request).get_order()
+    products = Product.objects.only('title').in_bulk(lines)
 
+    with transaction.atomic():
+        reserved = {}
+        for pk in sorted(products):
+            if reserve_stock(pk, lines[pk]):
+                reserved[pk] = lines[pk]
+            else:
+                messages.error(request, f'Товара {products[pk].title} не хватает на складе')
+        if not reserved:
+            return
 
-    # Метод для очищения корзины после заказа
-    def clear(self):
-        order = self.get_cart_info()['order']
-        order_products = order.orderproduct_set.all()
-        for product in order_products:
-            product.delete()
+        existing = {line.product_id: line for line in OrderProduct.objects.filter(order=order, product_id__in=reserved)}
+        now = timezone.now()
+        for line in existing.values():
+            line.quantity += reserved[line.product_id]
+            line.reserved_at = now
+        OrderProduct.objects.bulk_update(existing.values(), ['quantity', 'reserved_at'])
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order=order, product_id=pk, quantity=quantity)
+            for pk, quantity in reserved.items() if pk not in existing
+        ])
 
-        order.save()
+        recalculate_order_totals(Order.objects.filter(pk=order.pk))
+
+
+# Корзина под текущего пользователя: из базы для авторизованных, из сессии для гостей
+def get_cart(request, pk=None, action=None):
+    if request.user.is_authenticated:
+        return CartForAuthenticatedUser(request, pk, action)
+    return CartForAnonymousUser(request, pk, action)
 
 
 # Функция для получения информации о крзине
 def get_cart_data(request):
-    cart = CartForAuthenticatedUser(request)
+    cart = getattr(request, 'cart', None) or get_cart(request)
     cart_info = cart.get_cart_info()
     return cart_info
-
@@ -1,19 +1,34 @@
-from random import randint
-
 from django.contrib.auth import login, logout
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from .models import *
 from django.views.generic import ListView, DetailView
 from .forms import LoginForm, RegisterForm, CustomerForm, ShippingForm
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .utils import CartForAuthenticatedUser, get_cart_data
+from .utils import get_cart_data, merge_session_cart
+from .payments import get_or_create_payment, serialize_shipping, start_checkout, enqueue_payment_event
+from .catalog import (get_homepage_catalog, get_category_tree, get_category_products, get_category_ids,
+                      get_products_queryset, get_related_products, get_variant_swatches, aget_category_tree,
+                      aget_catalog_version, aget_related_products, aget_variant_swatches)
+from .facets import FacetFilters, apply_facet_filters, get_facets
+from .pagination import KeysetPaginator
+from .page_cache import CatalogPageCacheMixin, async_catalog_page_cache
+from .favorites import toggle_favorite, aget_favorite_ids
+from .pricing import aget_installment_plans
+from .search import search_products, autocomplete
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from django.views.decorators.csrf import csrf_exempt
+from django.contrib.auth.views import redirect_to_login
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+import asyncio
 import stripe
 
 
 # Create your views here.
 
-class ProductList(ListView):
+class ProductList(CatalogPageCacheMixin, ListView):
     model = Product
     context_object_name = 'categories'
 
@@ -24,35 +39,107 @@ class ProductList(ListView):
     template_name = 'digital/index.html'
 
     def get_queryset(self):
-        categories = Category.objects.filter(parent=None)
+        categories = get_homepage_catalog()
         return categories
 
 
+# Размер страницы можно передать в ?page_size=, но только из разрешённых значений.
+# По умолчанию settings.CATALOG_PAGE_SIZE, читается при каждом запросе
+def get_page_size(request, default=None):
+    page_size = request.GET.get('page_size')
+    if page_size and page_size.isdigit() and int(page_size) in settings.CATALOG_PAGE_SIZES:
+        return int(page_size)
+    return default or settings.CATALOG_PAGE_SIZE
+
+
 # Вьюшка для страницы категории товаров
-class CategoryView(ListView):
+class CategoryView(CatalogPageCacheMixin, ListView):
     model = Product
     context_object_name = 'products'
     template_name = 'digital/category.html'
-    paginate_by = 1
-
-    def get_queryset(self):
+    # None - размер страницы из settings.CATALOG_PAGE_SIZE (get_page_size)
+    paginate_by = None
+    # Сортировки ?sort=, под каждую есть индекс (category, поле, id)
+    orderings = {
+        'new': ('-created_at', '-pk'),
+        'price': ('effective_price', 'pk'),
+        '-price': ('-effective_price', '-pk'),
+    }
 
+    # Категорию берём из закэшированного дерева, без запроса в базу
+    def get_category(self):
+        category = get_category_tree().get(self.kwargs['slug'])
+        if category is None:
+            raise Http404('Категория не найдена')
+        return category
 
-        category = Category.objects.get(slug=self.kwargs['slug'])
-        products = Product.objects.filter(category=category)
+    def get_filters(self):
+        if not hasattr(self, 'filters'):
+            self.filters = FacetFilters(self.request.GET)
+        return self.filters
 
+    def get_ordering(self):
+        return self.orderings.get(self.request.GET.get('sort'), self.orderings['new'])
 
+    def get_queryset(self):
+        category = self.get_category()
+        products = get_category_products(category).order_by(*self.get_ordering())
+        products = apply_facet_filters(products, get_category_ids(category), self.get_filters())
         return products
 
+    def get_paginate_by(self, queryset):
+        return get_page_size(self.request, self.paginate_by)
+
+    def paginate_queryset(self, queryset, page_size):
+        if settings.CATALOG_PAGINATION != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, self.get_ordering())
+        page = paginator.get_page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data()
-        category = Category.objects.get(slug=self.kwargs['slug'])
+        category = self.get_category()
         context['title'] = f'Категория {category.title}'
         context['category'] = category
+        context['breadcrumbs'] = get_category_tree().breadcrumbs(category.slug)
+        context['facets'] = get_facets(get_category_ids(category), self.get_filters())
+        context['sort'] = self.request.GET.get('sort') if self.request.GET.get('sort') in self.orderings else 'new'
+        # Фильтры и размер страницы сохраняются в ссылке на следующую страницу
+        query = self.request.GET.copy()
+        query.pop('cursor', None)
+        query.pop('page', None)
+        context['filter_query'] = query.urlencode()
 
         return context
 
 
+# Вьюшка для страницы поиска товаров
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    page = request.GET.get('page', '1')
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+    page_size = settings.CATALOG_PAGE_SIZE
+
+    products, has_next = search_products(query, page_size, (page - 1) * page_size)
+
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'products': products,
+        'page': page,
+        'has_next': has_next,
+    }
+    return render(request, 'digital/search.html', context)
+
+
+# Вьюшка для подсказок в строке поиска
+def search_autocomplete_view(request):
+    query = request.GET.get('q', '').strip()
+    return JsonResponse({'results': autocomplete(query)})
+
+
 # Функция для страницы входа в Аккаунт и логика входа
 def user_login_view(request):
     if request.user.is_authenticated:
@@ -65,6 +152,7 @@ def user_login_view(request):
                 user = form.get_user()
                 if user:
                     login(request, user)
+                    merge_session_cart(request)
                     messages.success(request, 'Вы вошли в Аккаунт')
                     return redirect('index')
                 else:
@@ -119,66 +207,49 @@ def register_view(request):
 
 
 # Вьюшка для страницы детали товара
-class ProductDetail(DetailView):
+class ProductDetail(CatalogPageCacheMixin, DetailView):
     model = Product
     context_object_name = 'product'
+    template_name = 'digital/product.html'
+
+    def get_queryset(self):
+        return get_products_queryset()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data()
-        product = Product.objects.get(slug=self.kwargs['slug'])
+        product = self.object
         context['title'] = f'Товар {product.title}'
-
-        products = Product.objects.filter(category=product.category)
-        data = []
-        for i in range(0, 3):
-            random_index = randint(0, len(products) - 1)
-            p = products[random_index]
-            if p not in data and product != p:
-                data.append(p)
-
-        context['products'] = data
+        context['products'] = get_related_products(product)
+        context['variants'] = get_variant_swatches(product)
 
         return context
 
 
 # Вьюшка для получения товара по цвету
 def product_by_color(request, model_product, color_code):
-    product = Product.objects.get(model_product=model_product, color_code=color_code)
-
-    products = Product.objects.filter(category=product.category)
-    data = []
-    for i in range(0, 3):
-        random_index = randint(0, len(products) - 1)
-        p = products[random_index]
-        if p not in data and product != p:
-            data.append(p)
+    product = get_object_or_404(get_products_queryset(), variant_group__slug=model_product, color_code=color_code)
 
     context = {
         'title': f'Товар {product.title}',
         'product': product,
-        'products': data
+        'products': get_related_products(product),
+        'variants': get_variant_swatches(product)
     }
 
-    return render(request, 'digital/product_detail.html', context)
+    return render(request, 'digital/product.html', context)
 
 
 # Вьюшка для добавления товара в избранное
 def save_favorite_product(request, slug):
     if request.user.is_authenticated:
-        user = request.user
-        product = Product.objects.get(slug=slug)
-        favorite_products = FavoriteProducts.objects.filter(user=user)
-        if user:
-            if product not in [i.product for i in favorite_products]:
-                messages.success(request, f'Товар добавлен в избранное')
-                FavoriteProducts.objects.create(user=user, product=product)
-            else:
-                fav_product = FavoriteProducts.objects.get(user=user, product=product)
-                messages.error(request, f'Товар удалён из избранного')
-                fav_product.delete()
+        product = get_object_or_404(Product.objects.only('pk'), slug=slug)
+        if toggle_favorite(request.user, product):
+            messages.success(request, f'Товар добавлен в избранное')
+        else:
+            messages.error(request, f'Товар удалён из избранного')
 
-            page = request.META.get('HTTP_REFERER', 'index')
-            return redirect(page)
+        page = request.META.get('HTTP_REFERER', 'index')
+        return redirect(page)
 
     else:
         messages.warning(request, 'Авторизуйтесь что бы добавить в избранное')
@@ -194,48 +265,31 @@ class FavoriteProductView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user = self.request.user
-        favorite_products = FavoriteProducts.objects.filter(user=user)
-        products = [i.product for i in favorite_products]
+        products = get_products_queryset().filter(favoriteproducts__user=user)
         return products
 
 
 # Вьюшка для добавления товара в корзину
 def to_cart_view(request, pk, action):
-    if request.user.is_authenticated:
-        user_cart = CartForAuthenticatedUser(request, pk, action)
-        page = request.META.get('HTTP_REFERER', 'index')
-        return redirect(page)
-
-    else:
-        return redirect('login')
+    request.cart.add_or_delete(pk, action)
+    page = request.META.get('HTTP_REFERER', 'index')
+    return redirect(page)
 
 
 # Вьюшка для страницы каорзины пользователя
 def my_cart_view(request):
-    if request.user.is_authenticated:
-        cart_info = get_cart_data(request)
-        context = {
-            'title': 'Моя корзина',
-            'order': cart_info['order'],
-            'products': cart_info['products']
-        }
-        return render(request, 'digital/my_cart.html', context)
-
-    else:
-        return redirect('login')
+    cart_info = get_cart_data(request)
+    context = {
+        'title': 'Моя корзина',
+        'order': cart_info['order'],
+        'products': cart_info['products']
+    }
+    return render(request, 'digital/my_cart.html', context)
 
 
 # Вьюшка для очтщения корзины кнопки
 def clear_cart(request):
-    user_cart = CartForAuthenticatedUser(request)
-    order = user_cart.get_cart_info()['order']
-    order_products = order.orderproduct_set.all()
-    for order_product in order_products:
-        quantity = order_product.quantity
-        product = order_product.product
-        order_product.delete()
-        product.quantity += quantity
-        product.save()
+    request.cart.clear(restore_stock=True)
     messages.warning(request, 'Корзина очищена')
     return redirect('my_cart')
 
@@ -259,60 +313,210 @@ def checkout_view(request):
         return redirect('login')
 
 
-# Вьюшка для реализации оплаты
-def create_checkout_session(request):
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-    if request.method == 'POST':
-        user_cart = CartForAuthenticatedUser(request)
-        cart_info = user_cart.get_cart_info()
-
-        customer_form = CustomerForm(data=request.POST)  # Из формы пользователя получ данные
-        if customer_form.is_valid():
-            customer = Customer.objects.get(user=request.user)  # Получ покупателя по запросу пользователя
-            customer.first_name = customer_form.cleaned_data['first_name']  # Получ имя покупателя из формы
-            customer.last_name = customer_form.cleaned_data['last_name']  # Получ фамилию покупателя из формы
-            customer.email = customer_form.cleaned_data['email']  # Получ посту покупателя из формы
-            customer.save()
-
-        shipping_form = ShippingForm(data=request.POST)
-        if shipping_form.is_valid():
-            address = shipping_form.save(commit=False)
-            address.customer = Customer.objects.get(user=request.user)
-            address.order = user_cart.get_cart_info()['order']
-            address.save()
-        else:
-            for field in shipping_form.errors:
-                messages.error(request, shipping_form.errors[field].as_text() )
-
-        total_price = cart_info['cart_total_price']  # Получаем сумму заказа
-        session = stripe.checkout.Session.create(
-            line_items=[{
-                'price_data':{
-                    'currency': 'uzs',
-                    'product_data':{
-                        'name': 'Товары DigitalStore'
-                    },
-                    'unit_amount': int(total_price)
-                },
-                'quantity': 1
-            }],
-            mode='payment',
-            success_url=request.build_absolute_uri(reverse('success')),
-            cancel_url=request.build_absolute_uri(reverse('checkout'))
-        )
-        return redirect(session.url, 303)
-
-
-
-# Вьюшка для страницы успешной оплаты
+# Сохраняем покупателя из формы и готовим платёж под текущую корзину. Синхронная часть оплаты
+def prepare_checkout(request):
+    user_cart = request.cart
+    order = user_cart.get_order()
+    customer = user_cart.get_customer()  # Покупатель уже подгружен вместе с заказом
+
+    customer_form = CustomerForm(data=request.POST)  # Из формы пользователя получ данные
+    if customer_form.is_valid():
+        customer.first_name = customer_form.cleaned_data['first_name']  # Получ имя покупателя из формы
+        customer.last_name = customer_form.cleaned_data['last_name']  # Получ фамилию покупателя из формы
+        customer.email = customer_form.cleaned_data['email']  # Получ посту покупателя из формы
+        customer.save()
+
+    # Адрес доставки сохраняется в платеже, ShippingAddress появится после подтверждения оплаты
+    shipping_form = ShippingForm(data=request.POST)
+    if not shipping_form.is_valid():
+        for field in shipping_form.errors:
+            messages.error(request, shipping_form.errors[field].as_text())
+        return None
+
+    payment = get_or_create_payment(order, serialize_shipping(shipping_form.cleaned_data))
+    if payment is None:
+        messages.error(request, 'Корзина пуста')
+    return payment
+
+
+# Вьюшка для реализации оплаты. Асинхронная: пока ждём Stripe, воркер не занят
+async def create_checkout_session(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect('login')
+    if request.method != 'POST':
+        return redirect('checkout')
+
+    payment = await sync_to_async(prepare_checkout)(request)
+    if payment is None:
+        return redirect('checkout')
+
+    success_url = request.build_absolute_uri(reverse('success')) + '?session_id={CHECKOUT_SESSION_ID}'
+    try:
+        url = await start_checkout(payment, success_url, request.build_absolute_uri(reverse('checkout')))
+    except stripe.StripeError:
+        messages.error(request, 'Платёжный сервис недоступен, попробуйте ещё раз')
+        return redirect('checkout')
+
+    response = redirect(url)
+    response.status_code = 303
+    return response
+
+
+# Вебхук Stripe: проверяем подпись, кладём событие в очередь и сразу отвечаем.
+# Заказ завершает обработчик очереди (manage.py process_payment_events)
+@csrf_exempt
+async def stripe_webhook(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        await sync_to_async(enqueue_payment_event)(request.body, request.headers.get('Stripe-Signature', ''))
+    except (ValueError, stripe.SignatureVerificationError):
+        return HttpResponseBadRequest()
+    return HttpResponse()
+
+
+# Вьюшка для страницы успешной оплаты. Корзину не трогаем: заказ завершается только
+# после подтверждения оплаты вебхуком, и тогда у покупателя появляется новая пустая корзина
 def success_payment(request):
     if request.user.is_authenticated:
-        user_cart = CartForAuthenticatedUser(request)
-        # Дописать логику сохранения заказа
-
-        user_cart.clear()
-        messages.success(request, 'Ваша оплта прошла успешно. Мы вас кинули')
-        return render(request, 'digital/success.html')
+        payment = Payment.objects.filter(session_id=request.GET.get('session_id'),
+                                         order__customer__user=request.user).first()
+        if payment and payment.status == Payment.PAID:
+            messages.success(request, 'Ваша оплата прошла успешно')
+        elif payment and payment.status == Payment.PENDING:
+            messages.info(request, 'Оплата обрабатывается, заказ появится после подтверждения')
+        else:
+            messages.error(request, 'Оплата не найдена')
+            return redirect('checkout')
+        return render(request, 'digital/success.html', {'payment': payment})
 
     else:
         return redirect('index')
+
+
+# -------------------------------------------------------------------------------------
+# Асинхронные вьюшки каталога и избранного (для запуска под ASGI, root/asgi.py).
+# Независимые обращения к базе и кэшу идут через asyncio.gather, шаблон рендерится в sync-потоке
+
+# Данные, которые иначе загрузили бы контекст-процессоры и теги шаблона во время рендера.
+# Дерево категорий и планы рассрочки только прогреваются в кэше, теги возьмут их оттуда
+async def aget_page_context(request, user):
+    favorite_ids, cart_total_quantity, catalog_version, *_ = await asyncio.gather(
+        aget_favorite_ids(user),
+        sync_to_async(lambda: request.cart.get_total_quantity())(),
+        aget_catalog_version(),
+        aget_category_tree(),
+        aget_installment_plans(),
+    )
+    return {
+        'favorite_ids': favorite_ids,
+        'cart_total_quantity': cart_total_quantity,
+        'catalog_version': catalog_version,
+    }
+
+
+async def arender(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@async_catalog_page_cache
+async def async_product_list(request):
+    user = await request.auser()
+    categories, page_context = await asyncio.gather(
+        alist(get_homepage_catalog()),
+        aget_page_context(request, user),
+    )
+    return await arender(request, 'digital/index.html', {
+        'title': 'DigitalStore',
+        'categories': categories,
+        **page_context,
+    })
+
+
+# Асинхронная выборка есть только для keyset-пагинации, с постраничной остаётся sync CategoryView
+async def async_category_view(request, slug):
+    if settings.CATALOG_PAGINATION != 'keyset':
+        return await sync_to_async(CategoryView.as_view())(request, slug=slug)
+    return await async_category_page(request, slug)
+
+
+@async_catalog_page_cache
+async def async_category_page(request, slug):
+    tree, user = await asyncio.gather(aget_category_tree(), request.auser())
+    category = tree.get(slug)
+    if category is None:
+        raise Http404('Категория не найдена')
+
+    category_ids = [category.pk] + [child.pk for child in tree.descendants_by_pk.get(category.pk, [])]
+    filters = FacetFilters(request.GET)
+    sort = request.GET.get('sort') if request.GET.get('sort') in CategoryView.orderings else 'new'
+    ordering = CategoryView.orderings[sort]
+    products = get_products_queryset().filter(category_id__in=category_ids).order_by(*ordering)
+    products = apply_facet_filters(products, category_ids, filters)
+    paginator = KeysetPaginator(products, get_page_size(request), ordering)
+
+    page, facets, page_context = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        sync_to_async(get_facets)(category_ids, filters),
+        aget_page_context(request, user),
+    )
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    query.pop('page', None)
+    return await arender(request, 'digital/category.html', {
+        'title': f'Категория {category.title}',
+        'category': category,
+        'breadcrumbs': tree.breadcrumbs(category.slug),
+        'facets': facets,
+        'sort': sort,
+        'filter_query': query.urlencode(),
+        'products': page.object_list,
+        'page_obj': page,
+        'paginator': paginator,
+        'is_paginated': page.has_other_pages(),
+        **page_context,
+    })
+
+
+@async_catalog_page_cache
+async def async_product_detail(request, slug):
+    try:
+        product, user = await asyncio.gather(get_products_queryset().aget(slug=slug), request.auser())
+    except Product.DoesNotExist:
+        raise Http404('Товар не найден')
+
+    related, variants, page_context = await asyncio.gather(
+        aget_related_products(product),
+        aget_variant_swatches(product),
+        aget_page_context(request, user),
+    )
+    return await arender(request, 'digital/product.html', {
+        'title': f'Товар {product.title}',
+        'product': product,
+        'products': related,
+        'variants': variants,
+        **page_context,
+    })
+
+
+async def async_favorite_view(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path(), 'login')
+
+    favorites = get_products_queryset().filter(favoriteproducts__user=user)
+    products, total, page_context = await asyncio.gather(
+        alist(favorites.aiterator()),
+        favorites.acount(),
+        aget_page_context(request, user),
+    )
+    return await arender(request, 'digital/favorite.html', {
+        'title': f'Избранное ({total})',
+        'products': products,
+        **page_context,
+    })
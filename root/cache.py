@@ -0,0 +1,37 @@
+import os
+
+# Настройки кэша из переменных окружения.
+# CACHE_BACKEND=locmem (по умолчанию), redis или memcached, CACHE_LOCATION - адрес сервера
+# (redis://host:6379/0 или host:11211), CACHE_MAX_ENTRIES - размер locmem.
+# Сброс кэшей по сигналам (версия каталога, дерево категорий, избранное, цены) срабатывает только
+# в процессе, который сделал запись. Поэтому locmem годится только для одного процесса, при нескольких
+# воркерах нужен общий кэш - Redis или Memcached (проверка apps.E001, apps/checks.py)
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+# Карточки, фрагменты, манифесты картинок, списки товаров категорий и избранное - это десятки тысяч
+# записей. Стандартные 300 записей locmem постоянно вытесняли бы дерево категорий и версию каталога
+CACHE_MAX_ENTRIES = 50_000
+
+
+def get_caches(env=os.environ):
+    backend = env.get('CACHE_BACKEND', 'locmem')
+    if backend not in CACHE_BACKENDS:
+        raise ValueError(f'Неизвестный CACHE_BACKEND: {backend}')
+
+    if backend == 'locmem':
+        cache = {
+            'BACKEND': CACHE_BACKENDS[backend],
+            'LOCATION': 'digital-store',
+            'OPTIONS': {'MAX_ENTRIES': int(env.get('CACHE_MAX_ENTRIES', CACHE_MAX_ENTRIES))},
+        }
+    else:
+        cache = {
+            'BACKEND': CACHE_BACKENDS[backend],
+            'LOCATION': env.get('CACHE_LOCATION') or ('redis://localhost:6379/0' if backend == 'redis'
+                                                      else 'localhost:11211'),
+            'KEY_PREFIX': 'digital-store',
+        }
+    return {'default': cache}
@@ -0,0 +1,97 @@
+import os
+
+import django
+
+# Настройки базы из переменных окружения.
+# DATABASE_ENGINE=sqlite (по умолчанию) или postgresql, остальное - DATABASE_NAME, DATABASE_USER,
+# DATABASE_PASSWORD, DATABASE_HOST, DATABASE_PORT, DATABASE_CONN_MAX_AGE, DATABASE_POOL_MAX_SIZE.
+# DATABASE_REPLICAS - реплики для чтения каталога через запятую: файлы для SQLite, host[:port] для Postgres
+
+# PRAGMA для каждого нового соединения SQLite (apps/signals.py).
+# WAL - читатели не ждут писателя, synchronous=NORMAL в WAL не теряет целостность, а fsync
+# делается только на checkpoint. busy_timeout - сколько мс ждать блокировку вместо "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+def get_sqlite_pragmas(env=os.environ):
+    return {
+        'journal_mode': env.get('SQLITE_JOURNAL_MODE', SQLITE_PRAGMAS['journal_mode']),
+        'synchronous': env.get('SQLITE_SYNCHRONOUS', SQLITE_PRAGMAS['synchronous']),
+        'busy_timeout': int(env.get('SQLITE_BUSY_TIMEOUT', SQLITE_PRAGMAS['busy_timeout'])),
+        'mmap_size': int(env.get('SQLITE_MMAP_SIZE', SQLITE_PRAGMAS['mmap_size'])),
+    }
+
+
+def get_databases(base_dir, env=os.environ):
+    engine = env.get('DATABASE_ENGINE', 'sqlite')
+    # Соединение живёт между запросами, перед переиспользованием проверяется что оно живое
+    conn_max_age = int(env.get('DATABASE_CONN_MAX_AGE', 60))
+
+    replicas = [replica.strip() for replica in env.get('DATABASE_REPLICAS', '').split(',') if replica.strip()]
+
+    if engine == 'sqlite':
+        pragmas = get_sqlite_pragmas(env)
+        primary = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': env.get('DATABASE_NAME') or base_dir / 'db.sqlite3',
+            'CONN_MAX_AGE': conn_max_age,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': pragmas['busy_timeout'] / 1000,
+            },
+        }
+        return add_replicas(primary, [{'NAME': replica} for replica in replicas])
+
+    if engine not in ('postgres', 'postgresql'):
+        raise ValueError(f'Неизвестный DATABASE_ENGINE: {engine}')
+
+    options = {'connect_timeout': int(env.get('DATABASE_CONNECT_TIMEOUT', 5))}
+    pool_max_size = int(env.get('DATABASE_POOL_MAX_SIZE', 0))
+    # Пул соединений psycopg есть в Django 5.1+, он заменяет постоянные соединения.
+    # На более старом Django остаются постоянные соединения (CONN_MAX_AGE)
+    if pool_max_size and django.VERSION >= (5, 1):
+        options['pool'] = {
+            'min_size': int(env.get('DATABASE_POOL_MIN_SIZE', 2)),
+            'max_size': pool_max_size,
+            'timeout': int(env.get('DATABASE_POOL_TIMEOUT', 10)),
+        }
+        conn_max_age = 0
+
+    primary = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('DATABASE_NAME', 'digital_store'),
+        'USER': env.get('DATABASE_USER', 'postgres'),
+        'PASSWORD': env.get('DATABASE_PASSWORD', ''),
+        'HOST': env.get('DATABASE_HOST', 'localhost'),
+        'PORT': env.get('DATABASE_PORT', '5432'),
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': options,
+    }
+    hosts = [replica.partition(':') for replica in replicas]
+    return add_replicas(primary, [{'HOST': host, 'PORT': port or primary['PORT']} for host, _, port in hosts])
+
+
+# Реплики - копии настроек основной базы с другим файлом/хостом, алиасы replica_0, replica_1, ...
+# В тестах реплики смотрят в тестовую основную базу (MIRROR), иначе данные тестов были бы им не видны
+def add_replicas(primary, replicas):
+    databases = {'default': primary}
+    for number, replica in enumerate(replicas):
+        databases[f'replica_{number}'] = {**primary, **replica, 'TEST': {'MIRROR': 'default'}}
+    return databases
+
+
+# Обработчик сигнала connection_created: PRAGMA из settings.SQLITE_PRAGMAS для нового соединения SQLite
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    from django.conf import settings
+
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -1,5 +1,9 @@
+import os
 from pathlib import Path
 
+from root.cache import get_caches
+from root.database import get_databases, get_sqlite_pragmas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,11 +35,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.middleware.InstrumentationMiddleware',  # первым, чтобы мерить все остальные
+    'apps.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.middleware.CartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,23 +62,44 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.context_processors.cart',
+                'apps.context_processors.catalog',
+                'apps.context_processors.favorites',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'root.wsgi.application'
+# Под ASGI (uvicorn/daphne) оплата и вебхуки работают асинхронно
+ASGI_APPLICATION = 'root.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# База настраивается переменными окружения (root/database.py): SQLite в режиме WAL или Postgres
+DATABASES = get_databases(BASE_DIR)
+SQLITE_PRAGMAS = get_sqlite_pragmas()
+# Каталог читается с реплик, если они есть; корзина и заказы - всегда с основной базы (apps/routers.py)
+DATABASE_ROUTERS = ['apps.routers.PrimaryReplicaRouter']
+# Сколько секунд после записи покупатель читает только с основной базы (реплики могут отставать)
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Кэш настраивается переменными окружения (root/cache.py). Локально locmem на 50 000 записей,
+# при нескольких воркерах обязателен общий Redis или Memcached: иначе сброс кэшей по сигналам
+# доходит только до процесса, сделавшего запись
+
+CACHES = get_caches()
+
+
+# Сессии на сервере: выход на всех устройствах и сброс сессий при смене пароля работают.
+# Сессия читается из кэша, в базу пишется только при изменении. Корзина гостя хранится в сессии
+# и заказов в базе не создаёт
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 
 # Password validation
@@ -117,6 +145,14 @@ STATICFILES_DIRS = [  # Указали где будут лежать стати
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Уменьшенные копии картинок товаров (apps/images.py)
+IMAGE_DERIVATIVES_DIR = 'derivatives'
+IMAGE_DERIVATIVE_WIDTHS = (200, 400, 800)
+IMAGE_DERIVATIVE_FORMATS = ('avif', 'webp')  # берутся только те, что поддерживает установленный Pillow
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_CARD_WIDTH = 400
+IMAGE_CARD_SIZES = '(max-width: 600px) 50vw, 280px'
+
 
 
 # Default primary key field type
@@ -134,7 +170,47 @@ MESSAGE_TAGS = {
         messages.ERROR: 'alert-danger',
 }
 
+# Пагинация каталога: 'keyset' (по курсору, без COUNT) или 'offset' (обычная по номеру страницы)
+CATALOG_PAGINATION = 'keyset'
+CATALOG_PAGE_SIZE = 12
+CATALOG_PAGE_SIZES = (12, 24, 48)
+# Верхние границы ценовых диапазонов для фильтра на странице категории
+CATALOG_PRICE_BUCKETS = (500_000, 1_000_000, 5_000_000, 10_000_000)
+# Сколько секунд хранить закэшированные страницы каталога для гостей
+CATALOG_PAGE_CACHE_TIMEOUT = 60 * 15
+
+# Через сколько секунд снимать резерв товара в неизменной корзине (None - не снимать)
+CART_RESERVATION_TTL = None
+
 STRIPE_PUBLIC_KEY = 'pk_test_51KniXYAxRYRPHE83bbfdE4ksfdYA2pF8frneghPJUbP2CDE8tiFwzAnS92DVnkvC2hlzGIA0gEShDwXzK3HcRnxe009WCAo7Dc'
 
 
-STRIPE_SECRET_KEY = "sk_test_51KniXYAxRYRPHE83AnQt699xPMqf2yp8jmPl1qY1WhdG5AW7mFyKqLrGjsakvGO5KWb6VQBhCrXW0w3pq2ChmlGp0027FjhCDL"
\ No newline at end of file
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', "sk_test_51KniXYAxRYRPHE83AnQt699xPMqf2yp8jmPl1qY1WhdG5AW7mFyKqLrGjsakvGO5KWb6VQBhCrXW0w3pq2ChmlGp0027FjhCDL")
+# Секрет подписи вебхуков Stripe
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', 'whsec_test')
+# Адрес API: пусто - настоящий Stripe, http://127.0.0.1:12111 - локальная заглушка (manage.py fake_stripe)
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE') or None
+STRIPE_CURRENCY = 'uzs'
+STRIPE_TIMEOUT = 10
+STRIPE_MAX_RETRIES = 2
+# Класс платёжного шлюза
+PAYMENT_GATEWAY = 'apps.payments.StripeGateway'
+
+# Замер запросов (apps/middleware.py InstrumentationMiddleware): число запросов к базе, время в базе
+# и в шаблонах идут в заголовок Server-Timing и, если задан путь, в JSON-lines журнал
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_SERVER_TIMING = DEBUG
+INSTRUMENTATION_LOG = os.environ.get('INSTRUMENTATION_LOG') or None
+# Сколько запросов к базе можно делать вьюшке (по имени URL) на холодном кэше.
+# Проверяется в тестах через QueryBudgetMixin, в работе превышение пишется в лог
+QUERY_BUDGETS = {
+    'index': 7,
+    'category_page': 8,
+    'product_detail': 7,
+    'product_color': 7,
+    'search': 7,
+    'search_autocomplete': 2,
+    'async_index': 7,
+    'async_category_page': 8,
+    'async_product_detail': 7,
+}